@@ -1,8 +1,12 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from commons.models import AccountType, AgeGroup, Gender, CustomerAccount
 from datetime import date
 
+# クエリ数を数えるテストでは、キャッシュの読み書き（DatabaseCache）を数に入れない
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
 class CustomerRegisterTest(TestCase):
     def setUp(self):
         # マスタデータの作成
@@ -44,3 +48,62 @@ class CustomerRegisterTest(TestCase):
         self.assertEqual(user.username, 'test@example.com')
         self.assertEqual(user.account_type.account_type, '顧客')
         self.assertTrue(user.check_password('Password123'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CustomerTopCacheTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_top_page_served_from_cache_until_store_changes(self):
+        """2回目はキャッシュから返し、店舗の変更で作り直されるか"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from commons.models import Area, Scene, Store
+
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+        url = reverse('accounts:customer_top')
+
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        Store.objects.create(store_name="新しい店舗", area=area, scene=scene, seats=10, budget=1000)
+        response = self.client.get(url)
+        self.assertContains(response, "新しい店舗")
+
+    def test_top_page_refreshes_when_reviewer_profile_changes(self):
+        """ピックアップの投稿者がニックネームを変えると作り直され、ログイン日時だけの保存では残るか"""
+        from django.utils import timezone
+        from commons.models import Area, Review, Scene, Store
+
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+        store = Store.objects.create(store_name="テスト店舗", area=area, scene=scene, seats=10, budget=1000)
+        reviewer = CustomerAccount.objects.create(
+            username="reviewer@example.com",
+            email="reviewer@example.com",
+            account_type=AccountType.objects.create(account_type="顧客"),
+            nickname="旧ニックネーム",
+            age_group=AgeGroup.objects.create(age_range="20代"),
+            gender=Gender.objects.create(gender="男性"),
+            birth_date=date(1990, 1, 1),
+        )
+        Review.objects.create(reviewer=reviewer, store=store, score=4, review_text="おいしい")
+        url = reverse('accounts:customer_top')
+        self.assertContains(self.client.get(url), "旧ニックネーム")
+
+        reviewer.last_login = timezone.now()
+        reviewer.save(update_fields=["last_login"])
+        CustomerAccount.objects.filter(pk=reviewer.pk).update(nickname="直接更新")
+        self.assertContains(self.client.get(url), "旧ニックネーム")
+
+        reviewer.nickname = "新ニックネーム"
+        reviewer.save()
+        response = self.client.get(url)
+        self.assertContains(response, "新ニックネーム")
+        self.assertNotContains(response, "旧ニックネーム")
@@ -15,6 +15,8 @@ from django.views.generic.base import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 
 from commons.models import StoreAccount, Account, Scene, Store, StoreAccountRequest, ApplicationStatus, Area, CustomerAccount, StoreAccountRequestLog, AccountType
+from commons import page_cache, sampling
+from commons.follow_graph import FollowGraph
 from .forms import CustomerLoginForm, CustomerRegisterForm, CustomerPasswordResetForm, StorePasswordResetForm, StoreLoginForm, StoreSetPasswordForm
 from django.contrib.auth.views import (
     PasswordResetView, PasswordResetDoneView,
@@ -654,6 +656,42 @@ class customer_topView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
+        # 閲覧者によらない部分はキャッシュから（口コミ・店舗などの変更で無効化）
+        version = page_cache.get_version(page_cache.CUSTOMER_TOP)
+        context.update(
+            page_cache.cached(page_cache.CUSTOMER_TOP, self._build_shared_context, version=version)
+        )
+        # テンプレートの {% cache %} 用
+        context["top_cache_version"] = version
+        context["top_cache_ttl"] = page_cache.PAGE_CACHE_TTL
+
+        # 6) ユーザーを探す（ランダム6件）：フォロー状態だけ閲覧者ごとに付ける
+        from commons.models import CustomerAccount
+        viewer = None
+        if self.request.user.is_authenticated:
+            viewer = CustomerAccount.objects.filter(pk=self.request.user.pk).first()
+
+        random_users = [
+            u for u in context["pickup_user_candidates"]
+            if not (self.request.user.is_authenticated and u.pk == self.request.user.pk)
+        ][:6]
+
+        graph = FollowGraph.resolve(viewer, random_users)
+        pickup_users = [
+            {"account": u, "is_following": graph.is_following(u)}
+            for u in random_users
+        ]
+        context["pickup_users"] = pickup_users
+
+        return context
+
+    def _build_shared_context(self):
+        """
+        閲覧者によらない部分（エリア・シーン・ランキング・ピックアップ）
+        キャッシュに載せるので QuerySet はリストにしておく
+        """
+        context = {}
+
         # 0) エリア情報の取得（主要エリアとその他）
         all_areas = Area.objects.all().order_by("id")
         
@@ -685,7 +723,7 @@ class customer_topView(TemplateView):
 
         context["major_areas"] = major_areas
         context["other_areas"] = other_areas
-        context["areas"] = all_areas # 全件も一応残す
+        context["areas"] = list(all_areas) # 全件も一応残す
 
         # 1) シーン画像の定義
         SCENE_IMAGE_MAP = {
@@ -705,76 +743,56 @@ class customer_topView(TemplateView):
         context["scenes"] = scenes
 
         # 3) 人気ランキング（weighted_avg_rating で上位5件）
-        #    search/views.py と同様の計算式: 
-        #    Sum(score * trust) / Sum(trust)
-        
-        from django.db.models import Avg, Count, Sum, F, ExpressionWrapper, FloatField
-
-        # 加重平均の重み計算式（累算出方式）
-        weight_expr = ExpressionWrapper(
-            (F("review__reviewer__trust_score") / 10.0) * 
-            ((1.0 + F("review__like_count") / 5.0) * (1.0 + F("review__like_count") / 5.0) * (1.0 + F("review__like_count") / 5.0)) * 
-            (1.0 + F("review__reviewer__follower_count") / 10.0),
-            output_field=FloatField()
+        #    加重平均は StoreRatingSummary に保持済み（commons.ratings で差分更新）
+        from django.db.models import F
+
+        ranking_stores = list(
+            Store.objects
+            .select_related("rating_summary", "area")
+            .prefetch_related("images")
+            .order_by(F("rating_summary__weighted_avg_rating").desc(nulls_last=True), "id")[:5]
         )
 
-        ranking_stores = Store.objects.prefetch_related("images").annotate(
-            weighted_avg_rating=Sum(
-                F('review__score') * weight_expr
-            ) / Sum(weight_expr),
-            review_count_val=Count('review'),
-        ).order_by('-weighted_avg_rating', 'id')[:5]
-
         # テンプレートで星を表示するためのヘルパー
         for store in ranking_stores:
-             # None の場合は 0 または 3.0 (表示上のデフォルト)
-            rating = store.weighted_avg_rating if store.weighted_avg_rating else 0.0
+            summary = getattr(store, "rating_summary", None)
+            rating = summary.display_rating if summary else 0.0
             store.avg_rating_val = rating
-            
+            store.review_count_val = summary.review_count if summary else 0
+
             # 星の生成（一元化されたルールを使用）
             store.star_states = Store.build_star_states(rating)
 
         context["ranking_stores"] = ranking_stores
 
         # 4) 星の合計獲得数ランキング（総スコアで上位5件）
-        total_star_stores = Store.objects.prefetch_related("images").annotate(
-            total_score_val=Sum(
-                F('review__score'),
-                output_field=FloatField()
-            )
-        ).order_by('-total_score_val', 'id')[:5]
-
-        # ヘルパー（合計ランキング用）
-        for store in total_star_stores:
-             # display rating (avg)
-             # 別途 avg_rating 計算しないと avg が出せないのでここで計算 or annotate する
-             # ここでは簡易的に aggregate せず review__score の平均を出すアノテート入れてもいいが、
-             # 既存 ranking_stores と被らないようにもう一度記述するか、共通化するか。
-             # シンプルに annotate で avg も取る。
-             pass
-
-        # 上記で annotate してないので、改めて取る（チェーンできるが可読性重視で書き直し）
-        # 実際には total_score_val だけで並び替え済み。
-        # 4) 星の合計獲得数ランキング（総スコアで上位5件）
-        total_star_stores = Store.objects.prefetch_related("images").annotate(
-             total_score_val=Sum('review__score'),
-             avg_rating_val=Avg('review__score')
-        ).order_by('-total_score_val', 'id')[:5]
+        total_star_stores = list(
+            Store.objects
+            .select_related("rating_summary", "area")
+            .prefetch_related("images")
+            .order_by(F("rating_summary__total_score").desc(nulls_last=True), "id")[:5]
+        )
 
         for store in total_star_stores:
-            store.star_states = Store.build_star_states(rating)
+            summary = getattr(store, "rating_summary", None)
+            store.total_score_val = summary.total_score if summary else 0
+            store.avg_rating_val = summary.avg_score if summary else 0.0
+            store.star_states = Store.build_star_states(store.avg_rating_val)
 
         context["total_star_stores"] = total_star_stores
 
         # 5) 口コミから探す（ランダム4件）
+        #    order_by('?') ではなく、キャッシュ済みの ID プールから引く（写真付きを優先）
         from commons.models import Review
-        # order_by('?') は大量データだと遅いが、小規模ならOK
-        pickup_reviews = (
+        review_qs = (
             Review.objects
             .select_related("reviewer", "store", "store__area")
             .prefetch_related("photos")
-            .order_by("?")[:4]
         )
+        pickup_reviews = sampling.pick(review_qs, "reviews_with_photos", 4)
+        if len(pickup_reviews) < 4:
+            picked = [r.pk for r in pickup_reviews]
+            pickup_reviews += sampling.pick(review_qs, "reviews", 4 - len(pickup_reviews), exclude=picked)
         # 評価ヘルパー処理（スター表示用）
         for r in pickup_reviews:
             r.avg_rating_val = float(r.score) # Reviewモデルは score (int) だが float扱いにしておく
@@ -792,28 +810,8 @@ class customer_topView(TemplateView):
 
         context["pickup_reviews"] = pickup_reviews
 
-        # 6) ユーザーを探す（ランダム6件）
-        from commons.models import CustomerAccount, Follow
-        random_users = CustomerAccount.objects.all().order_by("?")
-        if self.request.user.is_authenticated:
-            random_users = random_users.exclude(pk=self.request.user.pk)
-        
-        random_users = random_users[:6]
-        
-        pickup_users = []
-        viewer = None
-        if self.request.user.is_authenticated:
-            viewer = CustomerAccount.objects.filter(pk=self.request.user.pk).first()
+        # 6) おすすめユーザーの候補（閲覧者本人を除いても6件残るよう1件多め）
+        from commons.models import CustomerAccount
+        context["pickup_user_candidates"] = sampling.pick(CustomerAccount.objects.all(), "customers", 7)
 
-        for u in random_users:
-            is_following = False
-            if viewer:
-                is_following = Follow.objects.filter(follower=viewer, followee=u).exists()
-            
-            pickup_users.append({
-                "account": u,
-                "is_following": is_following,
-            })
-        context["pickup_users"] = pickup_users
-
-        return context
\ No newline at end of file
+        return context
@@ -0,0 +1,170 @@
+# commons/access_log.py
+"""
+店舗ページのアクセス記録（書き込みバッファ + 日次集計）
+
+閲覧のたびに INSERT せず、プロセス内のバッファに溜めて
+一定間隔ごと（タイマー）か一定件数に達したとき、リクエストとは別のスレッドでまとめて書き込む。
+  - 生ログ StoreAccessLog : bulk_create（保持期間を過ぎたら prune_store_access_logs で削除）
+  - 日次集計 StoreAccessDaily : (店舗, 日付) ごとに件数を加算（ダッシュボードのグラフはこちらを読む）
+ダッシュボードは書き込みを待たず、日次集計にこのプロセスのバッファの件数を足して表示する。
+"""
+from __future__ import annotations
+
+import atexit
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from commons.models import StoreAccessDaily, StoreAccessLog
+
+# この件数 or 秒数を超えたら書き込む（settings で上書き可）
+FLUSH_SIZE = getattr(settings, "STORE_ACCESS_FLUSH_SIZE", 200)
+FLUSH_INTERVAL = getattr(settings, "STORE_ACCESS_FLUSH_INTERVAL", 30)
+# 生ログの保持日数
+RETENTION_DAYS = getattr(settings, "STORE_ACCESS_LOG_RETENTION_DAYS", 90)
+
+_lock = threading.Lock()
+_buffer: list[tuple[int, datetime]] = []
+_timer: threading.Timer | None = None
+
+
+def record_access(store_id: int, at: datetime | None = None) -> None:
+    """
+    アクセスを1件バッファに積む。書き込みはタイマー（FLUSH_INTERVAL 秒後）か、
+    FLUSH_SIZE 件に達したときに別スレッドで行う（店舗ページのリクエストでは書かない）
+    """
+    global _timer
+    with _lock:
+        _buffer.append((store_id, at or timezone.now()))
+        if len(_buffer) >= FLUSH_SIZE:
+            if _timer is not None:
+                _timer.cancel()
+            _timer = threading.Timer(0, _flush_from_timer)
+        elif _timer is None:
+            _timer = threading.Timer(FLUSH_INTERVAL, _flush_from_timer)
+        else:
+            return
+        _timer.daemon = True
+        _timer.start()
+
+
+def flush() -> int:
+    """
+    バッファを書き込む。戻り値: 書き込んだ件数
+    """
+    global _buffer, _timer
+    with _lock:
+        pending, _buffer = _buffer, []
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not pending:
+        return 0
+
+    daily = Counter((store_id, timezone.localdate(at)) for store_id, at in pending)
+    try:
+        with transaction.atomic():
+            StoreAccessLog.objects.bulk_create(
+                [StoreAccessLog(store_id=store_id, accessed_at=at) for store_id, at in pending],
+                batch_size=500,
+            )
+            _add_daily_counts(daily)
+    except Exception:
+        # 書き込めなかった分は次回に回す
+        with _lock:
+            _buffer = pending + _buffer
+        raise
+    return len(pending)
+
+
+def clear() -> None:
+    """
+    書き込まずにバッファを捨てる（テスト用）
+    """
+    global _buffer, _timer
+    with _lock:
+        _buffer = []
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+
+
+def _flush_from_timer() -> None:
+    try:
+        flush()
+    except Exception as e:
+        # アクセス数のために店舗ページを落とさない（バッファは次回に持ち越し）
+        print("STORE ACCESS FLUSH ERROR:", e)
+    finally:
+        connection.close()
+
+
+def _add_daily_counts(daily: Counter) -> None:
+    for (store_id, day), count in daily.items():
+        updated = StoreAccessDaily.objects.filter(store_id=store_id, date=day).update(
+            count=F("count") + count
+        )
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                StoreAccessDaily.objects.create(store_id=store_id, date=day, count=count)
+        except IntegrityError:
+            # 別プロセスが先に作った
+            StoreAccessDaily.objects.filter(store_id=store_id, date=day).update(
+                count=F("count") + count
+            )
+
+
+def pending_counts(store_id: int, start: date, end: date) -> Counter:
+    """
+    このプロセスのバッファにある、まだ書き込んでいない [start, end] の日別アクセス数
+    """
+    with _lock:
+        pending = [at for pending_id, at in _buffer if pending_id == store_id]
+    days = Counter(timezone.localdate(at) for at in pending)
+    return Counter({day: count for day, count in days.items() if start <= day <= end})
+
+
+def daily_counts(store_id: int, start: date, end: date) -> dict[date, int]:
+    """
+    [start, end] の日別アクセス数（日次集計を1クエリ＋このプロセスの未書き込み分）
+    """
+    counts = Counter(dict(
+        StoreAccessDaily.objects.filter(store_id=store_id, date__range=(start, end))
+        .values_list("date", "count")
+    ))
+    counts.update(pending_counts(store_id, start, end))
+    return dict(counts)
+
+
+def prune_raw_logs(days: int = RETENTION_DAYS, chunk_size: int = 5000) -> int:
+    """
+    保持期間より古い生ログを削除（日次集計は残す）。戻り値: 削除件数
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted = 0
+    while True:
+        ids = list(
+            StoreAccessLog.objects.filter(accessed_at__lt=cutoff)
+            .order_by()
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        deleted += StoreAccessLog.objects.filter(id__in=ids).delete()[0]
+
+
+def _flush_at_exit() -> None:
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
@@ -10,9 +10,9 @@ from .models import (
     Store, AccountType, Area, Scene, Gender, AgeGroup,
     ReservationStatus, ImageStatus, ApplicationStatus,
     Review, ReviewPhoto, ReviewReport, Follow, Reservator,
-    Reservation, StoreOnlineReservation, StoreImage, StoreMenu,
+    Reservation, StoreOnlineReservation, StoreReservationRule, StoreOccupancy, StoreImage, StoreMenu,
     StoreAccountRequest, StoreAccountRequestLog, PasswordResetLog, TempRequestMailLog, StoreInfoReport,
-    StoreAccessLog,Genre
+    StoreAccessLog,Genre, StoreRatingSummary, StoreAccessDaily, ImageDerivative, ImageUpload, TimelineEntry
 )
 
 # ==========================================================
@@ -262,6 +262,13 @@ class ReviewAdmin(admin.ModelAdmin):
     search_fields = ("reviewer__nickname", "store__store_name")
 
 
+@admin.register(StoreRatingSummary)
+class StoreRatingSummaryAdmin(admin.ModelAdmin):
+    list_display = ("store", "weighted_avg_rating", "avg_score", "review_count", "total_score", "updated_at")
+    search_fields = ("store__store_name",)
+    readonly_fields = ("weighted_sum", "weight_total", "avg_score", "review_count", "total_score", "weighted_avg_rating", "updated_at")
+
+
 @admin.register(ReviewPhoto)
 class ReviewPhotoAdmin(admin.ModelAdmin):
     list_display = ("id", "review", "image_path")
@@ -301,6 +308,16 @@ class StoreOnlineReservationAdmin(admin.ModelAdmin):
     list_display = ("id", "store", "booking_status", "available_seats", "date")
 
 
+@admin.register(StoreReservationRule)
+class StoreReservationRuleAdmin(admin.ModelAdmin):
+    list_display = ("id", "store", "open_weekdays", "available_seats", "updated_at")
+
+
+@admin.register(StoreOccupancy)
+class StoreOccupancyAdmin(admin.ModelAdmin):
+    list_display = ("id", "store", "date")
+
+
 @admin.register(StoreImage)
 class StoreImageAdmin(admin.ModelAdmin):
     list_display = ("id", "store", "image_path", "image_status")
@@ -311,6 +328,25 @@ class StoreMenuAdmin(admin.ModelAdmin):
     list_display = ("id", "store", "menu_name", "price")
 
 
+@admin.register(ImageDerivative)
+class ImageDerivativeAdmin(admin.ModelAdmin):
+    list_display = ("id", "source", "content_hash", "width", "height", "created_at")
+    search_fields = ("source", "content_hash")
+
+
+@admin.register(TimelineEntry)
+class TimelineEntryAdmin(admin.ModelAdmin):
+    list_display = ("id", "owner", "review", "author_id", "posted_at")
+    raw_id_fields = ("owner", "review")
+
+
+@admin.register(ImageUpload)
+class ImageUploadAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "state", "original_name", "uploaded_by", "attempts", "created_at", "updated_at")
+    list_filter = ("kind", "state")
+    search_fields = ("original_name", "error")
+
+
 @admin.register(StoreAccountRequest)
 class StoreAccountRequestAdmin(admin.ModelAdmin):
     list_display = ("id", "requester", "store_name", "phone_number", "requested_at")
@@ -347,3 +383,10 @@ class StoreAccessLogAdmin(admin.ModelAdmin):
     list_display = ("id", "store", "accessed_at")
     list_filter = ("store", "accessed_at")
     date_hierarchy = "accessed_at"
+
+
+@admin.register(StoreAccessDaily)
+class StoreAccessDailyAdmin(admin.ModelAdmin):
+    list_display = ("id", "store", "date", "count")
+    list_filter = ("date",)
+    date_hierarchy = "date"
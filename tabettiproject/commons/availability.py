@@ -0,0 +1,312 @@
+# commons/availability.py
+"""
+ネット予約の受付日（店舗 × 日付）の判定
+
+受付可否は「既定ルール（曜日ごとの受付可否・席数）」＋「ルールと異なる日の上書き」で決まる。
+  - 既定ルール: StoreReservationRule（ID209-390 の店舗は行が無くても全曜日受付・店舗の席数）
+  - 上書き:     StoreOnlineReservation（店舗が設定した日だけ。ルールと同じ設定は持たない）
+
+読み取りのために行を作ることはしないので、行数は「店舗 × 日数」では増えない。
+複数店舗 × 期間をまとめて判定するときは AvailabilityWindow を使う
+（1クエリで読み、店舗ごとに「日付ビット列」(int) で持つ）。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from django.db import transaction
+
+from commons.models import StoreOnlineReservation, StoreReservationRule
+
+# ID209〜390 は「店舗アカウント無しでも」ネット予約を有効化（既定で受付中）
+AUTO_RESERVATION_STORE_ID_MIN = 209
+AUTO_RESERVATION_STORE_ID_MAX = 390
+
+ALL_WEEKDAYS = StoreReservationRule.ALL_WEEKDAYS
+
+
+def is_default_open_store(store_id) -> bool:
+    try:
+        sid = int(store_id or 0)
+    except (TypeError, ValueError):
+        sid = 0
+    return AUTO_RESERVATION_STORE_ID_MIN <= sid <= AUTO_RESERVATION_STORE_ID_MAX
+
+
+def default_available_seats(store) -> int:
+    # seats が 0/None の場合は "無制限相当" として大きめにする
+    seats = int(getattr(store, "seats", 0) or 0)
+    return seats if seats > 0 else 999
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    店舗の既定ルール（is_virtual=True は行が無い店舗の既定値）
+    """
+    open_weekdays: int
+    available_seats: int
+    is_virtual: bool = False
+
+    def is_open_on(self, d: date) -> bool:
+        return bool(self.open_weekdays >> d.weekday() & 1)
+
+
+CLOSED_RULE = Rule(open_weekdays=0, available_seats=0, is_virtual=True)
+
+
+def _rule_from_row(store, open_weekdays: int, available_seats: int) -> Rule:
+    seats = int(available_seats or 0) or default_available_seats(store)
+    return Rule(int(open_weekdays or 0), seats)
+
+
+def _virtual_rule(store) -> Rule:
+    if is_default_open_store(store.pk):
+        return Rule(ALL_WEEKDAYS, default_available_seats(store), is_virtual=True)
+    return CLOSED_RULE
+
+
+def get_rule(store) -> Rule:
+    """
+    1店舗の既定ルール（行が無ければ既定値。受付しない店舗は CLOSED_RULE）
+    """
+    row = (
+        StoreReservationRule.objects.filter(store_id=store.pk)
+        .values_list("open_weekdays", "available_seats")
+        .first()
+    )
+    if row is not None:
+        return _rule_from_row(store, *row)
+    return _virtual_rule(store)
+
+
+def get_rules(stores) -> dict[int, Rule]:
+    """
+    複数店舗の既定ルール（1クエリ）
+    """
+    stores = list(stores)
+    rows = {
+        store_id: (open_weekdays, available_seats)
+        for store_id, open_weekdays, available_seats in StoreReservationRule.objects.filter(
+            store_id__in=[s.pk for s in stores]
+        ).values_list("store_id", "open_weekdays", "available_seats")
+    }
+    return {
+        s.pk: (_rule_from_row(s, *rows[s.pk]) if s.pk in rows else _virtual_rule(s))
+        for s in stores
+    }
+
+
+def has_rule(store) -> bool:
+    """
+    既定で受付する曜日があるか（ID209-390 またはルール設定済み）
+    """
+    return get_rule(store).open_weekdays != 0
+
+
+@dataclass(frozen=True)
+class DaySetting:
+    """
+    ある店舗・ある日の受付設定（is_virtual=True は既定ルールから作ったもの）
+    """
+    store_id: int
+    date: date
+    booking_status: bool
+    available_seats: int
+    is_virtual: bool = False
+
+
+def _setting_from_rule(store, rule: Rule, d: date) -> DaySetting | None:
+    if not rule.is_open_on(d):
+        return None
+    return DaySetting(store.pk, d, True, rule.available_seats, is_virtual=True)
+
+
+def get_day_setting(store, target_date: date) -> DaySetting | None:
+    """
+    1店舗1日分の設定。上書き行があればそれを、無ければ既定ルールから作る（書き込みはしない）
+    既定ルールで受付しない日で行も無ければ None
+    """
+    row = (
+        StoreOnlineReservation.objects.filter(store_id=store.pk, date=target_date)
+        .values_list("booking_status", "available_seats")
+        .first()
+    )
+    if row is not None:
+        return DaySetting(store.pk, target_date, bool(row[0]), int(row[1] or 0))
+    return _setting_from_rule(store, get_rule(store), target_date)
+
+
+def get_range_settings(store, start: date, end: date) -> dict[date, DaySetting]:
+    """
+    期間内（start〜end を含む）の設定を日付ごとに返す。受付しない既定日は含めない
+    """
+    rule = get_rule(store)
+    settings_by_date: dict[date, DaySetting] = {}
+    d = start
+    while d <= end:
+        setting = _setting_from_rule(store, rule, d)
+        if setting is not None:
+            settings_by_date[d] = setting
+        d += timedelta(days=1)
+
+    rows = StoreOnlineReservation.objects.filter(
+        store_id=store.pk, date__range=(start, end)
+    ).values_list("date", "booking_status", "available_seats")
+    for d, is_open, seats in rows:
+        settings_by_date[d] = DaySetting(store.pk, d, bool(is_open), int(seats or 0))
+    return settings_by_date
+
+
+def open_dates(store, start: date, end: date) -> list[date]:
+    return sorted(d for d, s in get_range_settings(store, start, end).items() if s.booking_status)
+
+
+def set_day_setting(store, target_date: date, booking_status: bool, available_seats: int) -> None:
+    """
+    店舗が日別に設定する。既定ルールと同じ内容なら上書き行を消す（行を増やさない）
+    """
+    rule = get_rule(store)
+    same_as_rule = (
+        booking_status
+        and rule.is_open_on(target_date)
+        and int(available_seats) == rule.available_seats
+    ) or (not booking_status and not rule.is_open_on(target_date))
+
+    if same_as_rule:
+        StoreOnlineReservation.objects.filter(store_id=store.pk, date=target_date).delete()
+        return
+
+    StoreOnlineReservation.objects.update_or_create(
+        store_id=store.pk,
+        date=target_date,
+        defaults={"booking_status": booking_status, "available_seats": available_seats},
+    )
+
+
+def set_rule(store, open_weekdays: int, available_seats: int = 0) -> Rule:
+    """
+    店舗の既定ルールを保存する（available_seats=0 なら店舗の席数）。ルールと同じになった上書き行は消す
+    """
+    StoreReservationRule.objects.update_or_create(
+        store_id=store.pk,
+        defaults={"open_weekdays": int(open_weekdays) & ALL_WEEKDAYS, "available_seats": max(0, int(available_seats))},
+    )
+    compact_overrides(store)
+    return get_rule(store)
+
+
+def open_range(store, start: date, end: date) -> int:
+    """
+    start〜end（end は含まない）をすべて受付中にする。戻り値：残った上書き行の数
+    既定ルールの行が無い店舗は、先に全曜日受付・店舗の席数のルールを作る
+    （受付しない店舗の CLOSED_RULE の席数 0 は「無制限」扱いになるため、そのままでは開けない）。
+    ルールで受付する日は上書き行を持たず、ルールで休みの曜日だけルールの席数で上書きする
+    """
+    with transaction.atomic():
+        rule = get_rule(store)
+        if rule.is_virtual:
+            rule = set_rule(store, ALL_WEEKDAYS, 0)
+
+        StoreOnlineReservation.objects.filter(store_id=store.pk, date__gte=start, date__lt=end).delete()
+        overrides = []
+        d = start
+        while d < end:
+            if not rule.is_open_on(d):
+                overrides.append(
+                    StoreOnlineReservation(
+                        store_id=store.pk, date=d, booking_status=True, available_seats=rule.available_seats
+                    )
+                )
+            d += timedelta(days=1)
+        StoreOnlineReservation.objects.bulk_create(overrides)
+    return len(overrides)
+
+
+def compact_overrides(store, start: date | None = None, end: date | None = None) -> int:
+    """
+    既定ルールと同じ内容の上書き行を消す。戻り値：削除件数
+    """
+    rule = get_rule(store)
+    qs = StoreOnlineReservation.objects.filter(store_id=store.pk)
+    if start is not None:
+        qs = qs.filter(date__gte=start)
+    if end is not None:
+        qs = qs.filter(date__lte=end)
+
+    redundant = [
+        pk
+        for pk, d, is_open, seats in qs.values_list("pk", "date", "booking_status", "available_seats")
+        if (
+            (is_open and rule.is_open_on(d) and int(seats or 0) == rule.available_seats)
+            or (not is_open and not rule.is_open_on(d))
+        )
+    ]
+    if redundant:
+        StoreOnlineReservation.objects.filter(pk__in=redundant).delete()
+    return len(redundant)
+
+
+class AvailabilityWindow:
+    """
+    店舗ごとの受付日ビット列（bit i が start + i 日目）
+
+        window = AvailabilityWindow.load(stores, start, end)
+        window.is_open(store.id, d)
+    """
+
+    def __init__(self, start: date, days: int, bitmaps: dict[int, int]):
+        self.start = start
+        self.days = days
+        self._bitmaps = bitmaps
+
+    @staticmethod
+    def _rule_bitmap(rule: Rule, start: date, days: int) -> int:
+        if rule.open_weekdays == ALL_WEEKDAYS:
+            return (1 << days) - 1
+        bitmap = 0
+        for i in range(days):
+            if rule.open_weekdays >> ((start.weekday() + i) % 7) & 1:
+                bitmap |= 1 << i
+        return bitmap
+
+    @classmethod
+    def load(cls, stores, start: date, end: date) -> "AvailabilityWindow":
+        stores = list(stores)
+        days = (end - start).days + 1
+        if days <= 0 or not stores:
+            return cls(start, max(days, 0), {})
+
+        bitmaps = {
+            store_id: cls._rule_bitmap(rule, start, days)
+            for store_id, rule in get_rules(stores).items()
+        }
+
+        # 店舗が設定した日だけで既定を上書き
+        rows = StoreOnlineReservation.objects.filter(
+            store_id__in=list(bitmaps.keys()),
+            date__range=(start, end),
+        ).values_list("store_id", "date", "booking_status")
+        for store_id, d, is_open in rows:
+            bit = 1 << (d - start).days
+            if is_open:
+                bitmaps[store_id] |= bit
+            else:
+                bitmaps[store_id] &= ~bit
+
+        return cls(start, days, bitmaps)
+
+    def is_open(self, store_id: int, d: date) -> bool:
+        offset = (d - self.start).days
+        if offset < 0 or offset >= self.days:
+            return False
+        return bool(self._bitmaps.get(store_id, 0) >> offset & 1)
+
+    def open_dates(self, store_id: int) -> list[date]:
+        bitmap = self._bitmaps.get(store_id, 0)
+        return [
+            self.start + timedelta(days=i)
+            for i in range(self.days)
+            if bitmap >> i & 1
+        ]
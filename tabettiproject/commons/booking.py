@@ -0,0 +1,147 @@
+# commons/booking.py
+"""
+ネット予約の確定・変更（空席確認と予約の作成・変更を1トランザクションで行う）
+
+空席は StoreOccupancy（15分枠の使用席数）で判定する。確認と確保は occupancy.claim が
+select_for_update ＋ version の比較で行い、同じ日の予約が同時に来たときは後から書いた側を
+やり直させる。SQLite は行ロックが無く、競合した書き込みが「database is locked」になるので
+それもやり直しの対象にする。
+"""
+from __future__ import annotations
+
+import random
+import time as time_module
+from dataclasses import dataclass
+from datetime import date, time
+
+from django.db import OperationalError, transaction
+
+from commons import availability, occupancy
+from commons.models import Reservation, ReservationStatus, Reservator, Store
+
+# 競合時のやり直し回数・待ち時間（秒）
+MAX_ATTEMPTS = 20
+RETRY_WAIT = 0.01
+
+
+class BookingError(Exception):
+    """
+    予約できない（message は画面にそのまま出す）
+    """
+
+
+@dataclass(frozen=True)
+class BookingRequest:
+    store: Store
+    visit_date: date
+    visit_time: time
+    end_time: time
+    course_minutes: int
+    course_name: str
+    party_size: int
+
+
+def _is_lock_error(exc: OperationalError) -> bool:
+    message = str(exc).lower()
+    return "locked" in message or "busy" in message
+
+
+def _book_once(req: BookingRequest, booking_user: Reservator, status: ReservationStatus) -> Reservation:
+    with transaction.atomic():
+        setting = availability.get_day_setting(req.store, req.visit_date)
+        if setting is None or not setting.booking_status:
+            raise BookingError("この日はネット予約を受け付けていません。")
+
+        start_m = req.visit_time.hour * 60 + req.visit_time.minute
+        buckets = occupancy.bucket_range(start_m, min(start_m + req.course_minutes, 24 * 60))
+        counted = occupancy.is_counted_status(status.status)
+        if counted and not occupancy.claim(
+            req.store.pk, req.visit_date, buckets, req.party_size, setting.available_seats
+        ):
+            raise BookingError("空席が不足しています。人数を減らすか別日をご選択ください。")
+
+        reservation = Reservation(
+            booking_user=booking_user,
+            store=req.store,
+            visit_date=req.visit_date,
+            visit_time=req.visit_time,
+            start_time=req.visit_time,
+            end_time=req.end_time,
+            visit_count=req.party_size,
+            course=req.course_name,
+            booking_status=status,
+        )
+        # 席は claim で確保済み（シグナルで二重に足さない）
+        reservation._occupancy_claimed = counted
+        reservation.save()
+        return reservation
+
+
+def _reschedule_once(reservation_id: int, req: BookingRequest) -> Reservation:
+    with transaction.atomic():
+        reservation = Reservation.objects.select_related("booking_status").get(pk=reservation_id)
+        previous = Reservation.objects.filter(pk=reservation_id).values(*occupancy.TRACKED_FIELDS).first()
+
+        counted = occupancy.is_counted_status(previous["booking_status__status"])
+        if counted:
+            setting = availability.get_day_setting(req.store, req.visit_date)
+            capacity = setting.available_seats if setting else 0
+
+            # 変更前の席を返してから、変更後の席を確保する（同じ日なら同じ行の中で）
+            release = None
+            before = occupancy.contribution(previous)
+            if before is not None:
+                store_id, d, buckets, count = before
+                if (store_id, d) == (req.store.pk, req.visit_date):
+                    release = (buckets, count)
+                else:
+                    occupancy.apply([(store_id, d, buckets, -count)])
+
+            start_m = req.visit_time.hour * 60 + req.visit_time.minute
+            buckets = occupancy.bucket_range(start_m, min(start_m + req.course_minutes, 24 * 60))
+            if not occupancy.claim(
+                req.store.pk, req.visit_date, buckets, req.party_size, capacity, release=release
+            ):
+                raise BookingError("空席が不足しています。人数を減らすか別の日時をご選択ください。")
+
+        reservation.visit_date = req.visit_date
+        reservation.visit_time = req.visit_time
+        reservation.start_time = req.visit_time
+        reservation.end_time = req.end_time
+        reservation.visit_count = req.party_size
+        reservation.course = req.course_name
+        # 席は claim で付け替え済み（シグナルで二重に足し引きしない）
+        reservation._occupancy_claimed = counted
+        reservation.save()
+        return reservation
+
+
+def _with_retries(fn, *args) -> Reservation:
+    """
+    version の競合・SQLite のロック待ちはやり直す
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return fn(*args)
+        except occupancy.OccupancyConflict:
+            pass
+        except OperationalError as exc:
+            if not _is_lock_error(exc):
+                raise
+        time_module.sleep(RETRY_WAIT * (attempt + 1) * random.random())
+    raise BookingError("混み合っています。時間をおいて再度お試しください。")
+
+
+def book(req: BookingRequest, booking_user: Reservator, status: ReservationStatus) -> Reservation:
+    """
+    空席を確保して予約を作る。空きが無い・受付していない日は BookingError
+    """
+    return _with_retries(_book_once, req, booking_user, status)
+
+
+def reschedule(reservation_id: int, req: BookingRequest) -> Reservation:
+    """
+    予約の日時・人数・コースを変更する。変更前の席を返して変更後の席を確保するまでを
+    新規予約と同じ1トランザクション＋ version の比較で行う。空きが無ければ BookingError
+    """
+    return _with_retries(_reschedule_once, reservation_id, req)
@@ -0,0 +1,103 @@
+# commons/follow_graph.py
+"""
+ユーザーカード用のフォロー関係をまとめて引く
+
+カード1枚ごとに Follow を 3 回引いていた処理（フォロワー数・自分→相手・相手→自分）を、
+1ページ分まとめて 2 クエリで解決する。フォロワー数は CustomerAccount.follower_count を使う。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from commons.models import CustomerAccount, Follow
+
+# これを超える人数は IN 句で絞らず、閲覧者側の関係を丸ごと読む（件数に関係なく 2 クエリ）
+IN_CLAUSE_LIMIT = 500
+
+
+@dataclass(frozen=True)
+class FollowState:
+    is_following: bool = False
+    is_follower: bool = False
+    is_muted: bool = False
+
+
+NO_RELATION = FollowState()
+
+
+class FollowGraph:
+    """
+    閲覧者と複数ユーザーの間のフォロー関係
+
+        graph = FollowGraph.resolve(viewer, targets)
+        graph.state(target).is_following
+    """
+
+    def __init__(self, viewer_id: int | None, following: dict[int, bool], followers: set[int]):
+        self.viewer_id = viewer_id
+        self._following = following  # followee_id -> is_muted
+        self._followers = followers
+
+    @classmethod
+    def resolve(cls, viewer: CustomerAccount | None, targets) -> "FollowGraph":
+        """
+        targets: CustomerAccount か ID の並び。viewer が None なら問い合わせない
+        """
+        if viewer is None:
+            return cls(None, {}, set())
+
+        ids = {getattr(t, "pk", t) for t in targets}
+        ids.discard(None)
+        if not ids:
+            return cls(viewer.pk, {}, set())
+
+        outgoing = Follow.objects.filter(follower_id=viewer.pk)
+        incoming = Follow.objects.filter(followee_id=viewer.pk)
+        if len(ids) <= IN_CLAUSE_LIMIT:
+            outgoing = outgoing.filter(followee_id__in=ids)
+            incoming = incoming.filter(follower_id__in=ids)
+
+        following = {
+            followee_id: is_muted
+            for followee_id, is_muted in outgoing.values_list("followee_id", "is_muted")
+            if followee_id in ids
+        }
+        followers = {
+            follower_id
+            for follower_id in incoming.values_list("follower_id", flat=True)
+            if follower_id in ids
+        }
+        return cls(viewer.pk, following, followers)
+
+    def state(self, target) -> FollowState:
+        target_id = getattr(target, "pk", target)
+        if self.viewer_id is None:
+            return NO_RELATION
+        is_following = target_id in self._following
+        return FollowState(
+            is_following=is_following,
+            is_follower=target_id in self._followers,
+            is_muted=self._following.get(target_id, False) if is_following else False,
+        )
+
+    def is_following(self, target) -> bool:
+        return getattr(target, "pk", target) in self._following
+
+    def card(self, target: CustomerAccount) -> dict:
+        """
+        ユーザーカード用の dict（テンプレの item.user.username 互換）
+        """
+        state = self.state(target)
+        cover_field = getattr(target, "cover_image", None)
+        icon_field = getattr(target, "icon_image", None)
+        return {
+            "id": target.pk,
+            "user": target,
+            "review_count": target.review_count,
+            "follower_count": target.follower_count,
+            "is_following": state.is_following,
+            "is_follower": state.is_follower,
+            "is_muted": state.is_muted,
+            "cover_image_url": cover_field.url if cover_field else "",
+            "user_icon_url": icon_field.url if icon_field else "",
+        }
@@ -0,0 +1,183 @@
+# commons/fulltext.py
+"""
+店舗・口コミの全文検索（SQLite FTS5 ＋ trigram トークナイザ）
+
+日本語は単語で区切れないので、3文字ずつの trigram で索引を作る。
+キーワード全体を1つのフレーズとして検索するので、結果は従来の icontains（部分一致）と同じになり、
+全件を走査せずに索引から引ける。順位は bm25（小さいほど上位）。
+
+索引の行は rowid = 店舗ID / 口コミID で、保存・削除時にシグナルから1件ずつ入れ替える。
+一括更新（update / bulk_create）は反映されないので rebuild_search_index で作り直す。
+
+- trigram は 3 文字未満の語を引けないので、短いキーワードは None を返す（呼び出し側で icontains に戻す）
+- SQLite 以外の DB では索引を作らない（同じく None）
+"""
+from __future__ import annotations
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+from commons.models import Review, Store
+
+STORE_TABLE = "store_search_fts"
+REVIEW_TABLE = "review_search_fts"
+
+# 索引に入れる列（FTS の列名 -> モデルの values() の名前）
+STORE_COLUMNS = {
+    "store_name": "store_name",
+    "genre": "genre",
+    "address": "address",
+    "scene_name": "scene__scene_name",
+}
+REVIEW_COLUMNS = {
+    "review_text": "review_text",
+}
+
+# trigram で引ける最短のキーワード長
+MIN_KEYWORD_LENGTH = 3
+
+# 索引の作り直しで1回に書く行数
+REBUILD_BATCH_SIZE = 500
+
+
+def is_enabled() -> bool:
+    return connection.vendor == "sqlite" and getattr(settings, "FULLTEXT_SEARCH_ENABLED", True)
+
+
+def match_expression(keyword: str) -> str | None:
+    """
+    キーワード全体を1つのフレーズにした MATCH 式。trigram で引けない短い語は None
+    """
+    keyword = (keyword or "").strip()
+    if len(keyword) < MIN_KEYWORD_LENGTH:
+        return None
+    return '"' + keyword.replace('"', '""') + '"'
+
+
+# =====================================================
+# 索引の更新
+# =====================================================
+def _replace(table: str, columns: dict, rows) -> None:
+    names = list(columns)
+    placeholders = ", ".join(["%s"] * (len(names) + 1))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table}(rowid, {', '.join(names)}) VALUES ({placeholders})",
+            [[row["pk"]] + [row[columns[name]] or "" for name in names] for row in rows],
+        )
+
+
+def _delete(table: str, ids) -> None:
+    ids = list(ids)
+    if not ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {table} WHERE rowid = %s", [[pk] for pk in ids])
+
+
+def index_stores(store_ids) -> None:
+    """
+    店舗の索引を入れ替える（削除済みの店舗は索引から消える）
+    """
+    if not is_enabled():
+        return
+    store_ids = list(store_ids)
+    rows = list(Store.objects.filter(pk__in=store_ids).values("pk", *STORE_COLUMNS.values()))
+    with transaction.atomic():
+        _delete(STORE_TABLE, store_ids)
+        _replace(STORE_TABLE, STORE_COLUMNS, rows)
+
+
+def index_reviews(review_ids) -> None:
+    """
+    口コミの索引を入れ替える（削除済みの口コミは索引から消える）
+    """
+    if not is_enabled():
+        return
+    review_ids = list(review_ids)
+    rows = list(Review.objects.filter(pk__in=review_ids).values("pk", *REVIEW_COLUMNS.values()))
+    with transaction.atomic():
+        _delete(REVIEW_TABLE, review_ids)
+        _replace(REVIEW_TABLE, REVIEW_COLUMNS, rows)
+
+
+def remove_store(store_id: int) -> None:
+    if is_enabled():
+        _delete(STORE_TABLE, [store_id])
+
+
+def remove_review(review_id: int) -> None:
+    if is_enabled():
+        _delete(REVIEW_TABLE, [review_id])
+
+
+def _rebuild_table(table: str, columns: dict, queryset, chunk_size: int) -> int:
+    count = 0
+    batch = []
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table}")
+        for row in queryset.order_by().values("pk", *columns.values()).iterator(chunk_size=chunk_size):
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                _replace(table, columns, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            _replace(table, columns, batch)
+            count += len(batch)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+    return count
+
+
+def rebuild(chunk_size: int = REBUILD_BATCH_SIZE) -> tuple[int, int]:
+    """
+    店舗・口コミの索引を全件作り直す。戻り値：(店舗数, 口コミ数)
+    """
+    if not is_enabled():
+        return 0, 0
+    return (
+        _rebuild_table(STORE_TABLE, STORE_COLUMNS, Store.objects.all(), chunk_size),
+        _rebuild_table(REVIEW_TABLE, REVIEW_COLUMNS, Review.objects.all(), chunk_size),
+    )
+
+
+# =====================================================
+# 検索
+# =====================================================
+def _search(queryset, table: str, keyword: str):
+    if not is_enabled():
+        return None
+    expression = match_expression(keyword)
+    if expression is None:
+        return None
+    pk_column = f'"{queryset.model._meta.db_table}"."{queryset.model._meta.pk.column}"'
+    return (
+        queryset
+        .filter(pk__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [expression]))
+        # 絞り込んだ行についてだけ順位を引く（rowid 指定なので索引を1件見るだけ）
+        .annotate(search_rank=RawSQL(
+            f"SELECT bm25({table}) FROM {table} WHERE {table} MATCH %s AND rowid = {pk_column}",
+            [expression],
+            output_field=FloatField(),
+        ))
+    )
+
+
+def search_stores(queryset, keyword: str):
+    """
+    店舗名・ジャンル・住所・利用シーンに keyword を含む店舗に絞り、search_rank（bm25）を付ける
+    全文検索で引けないとき（短い語・SQLite 以外）は None
+    """
+    return _search(queryset, STORE_TABLE, keyword)
+
+
+def search_reviews(queryset, keyword: str):
+    """
+    本文に keyword を含む口コミに絞り、search_rank を付ける
+    全文検索で引けないときは None
+    """
+    return _search(queryset, REVIEW_TABLE, keyword)
@@ -0,0 +1,223 @@
+# commons/geo.py
+"""
+店舗の位置検索（地図の表示範囲・クラスタ・現在地からの距離）
+
+SQLite では R*Tree の仮想テーブル（id = 店舗ID、緯度・経度の min/max）を空間索引にして、
+表示範囲（緯度・経度の矩形）に入る店舗を全件走査せずに引く。
+行は店舗の保存・削除時にシグナルで入れ替え、一括更新の後は rebuild_store_geo_index で作り直す。
+SQLite 以外では緯度・経度の範囲条件で絞る。
+
+広い範囲（ズームが小さい・件数が多い）は矩形を GRID × GRID のマスに分けて
+マスごとの件数・重心だけを返すので、店舗が増えても応答の大きさは変わらない。
+
+半径検索は、円を囲む矩形で索引から候補を引き、候補だけを大円距離（haversine）で絞る。
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+
+from django.db import connection, transaction
+from django.db.models import Avg, Count, F, IntegerField, Min
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from commons.models import Store
+
+RTREE_TABLE = "store_geo_rtree"
+
+# このズーム以上で店舗を1件ずつ返す（引いた地図は常にクラスタ）
+MIN_MARKER_ZOOM = 14
+# 表示範囲の店舗がこれより多ければクラスタで返す
+MAX_MARKERS = 200
+# クラスタのマス目（表示範囲を GRID × GRID に分ける）
+GRID = 8
+
+# 地球の平均半径（km）
+EARTH_RADIUS_KM = 6371.0088
+
+# 現在地からの検索の半径（km）：未指定時の値と上限
+DEFAULT_RADIUS_KM = 2.0
+MAX_RADIUS_KM = 50.0
+
+
+def is_enabled() -> bool:
+    return connection.vendor == "sqlite"
+
+
+def is_valid_point(lat, lng) -> bool:
+    return lat is not None and lng is not None and -90 <= lat <= 90 and -180 <= lng <= 180
+
+
+@dataclass(frozen=True)
+class BoundingBox:
+    south: float
+    west: float
+    north: float
+    east: float
+
+    @classmethod
+    def from_params(cls, params) -> "BoundingBox":
+        """
+        GET の south / west / north / east から作る（不正なら ValueError）
+        地図を横に回した分（経度 ±180 超え）は端で切る
+        """
+        try:
+            south, west, north, east = (float(params[k]) for k in ("south", "west", "north", "east"))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("south / west / north / east が不正です。")
+        south, north = max(-90.0, south), min(90.0, north)
+        west, east = max(-180.0, west), min(180.0, east)
+        if south > north or west > east:
+            raise ValueError("south / west / north / east が不正です。")
+        return cls(south, west, north, east)
+
+    @classmethod
+    def around(cls, lat: float, lng: float, radius_km: float) -> "BoundingBox":
+        """
+        (lat, lng) から半径 radius_km の円を囲む矩形（極に掛かる場合は経度を全周にする）
+        """
+        d = radius_km / EARTH_RADIUS_KM
+        south = max(-90.0, lat - math.degrees(d))
+        north = min(90.0, lat + math.degrees(d))
+        sin_d, cos_lat = math.sin(d), math.cos(math.radians(lat))
+        if south <= -90.0 or north >= 90.0 or sin_d >= cos_lat:
+            return cls(south, -180.0, north, 180.0)
+        # 円に接する経線までの経度差（小さい円でも d / cos(lat) より少し広い）
+        d_lng = math.degrees(math.asin(sin_d / cos_lat))
+        return cls(south, max(-180.0, lng - d_lng), north, min(180.0, lng + d_lng))
+
+
+# =====================================================
+# 索引の更新
+# =====================================================
+def index_stores(store_ids) -> None:
+    """
+    店舗の位置を索引に入れ替える（座標の無い店舗・削除済みの店舗は索引から消える）
+    """
+    if not is_enabled():
+        return
+    store_ids = list(store_ids)
+    rows = [
+        (pk, lat, lat, lng, lng)
+        for pk, lat, lng in Store.objects.filter(pk__in=store_ids).values_list("pk", "latitude", "longitude")
+        if is_valid_point(lat, lng)
+    ]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {RTREE_TABLE} WHERE id = %s", [[pk] for pk in store_ids])
+        cursor.executemany(
+            f"INSERT INTO {RTREE_TABLE}(id, min_lat, max_lat, min_lng, max_lng) VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def remove_store(store_id: int) -> None:
+    if is_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {RTREE_TABLE} WHERE id = %s", [store_id])
+
+
+def rebuild(chunk_size: int = 2000) -> int:
+    """
+    全店舗の位置索引を作り直す。戻り値：登録した店舗数
+    """
+    if not is_enabled():
+        return 0
+    count = 0
+    batch = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {RTREE_TABLE}")
+        rows = Store.objects.order_by().values_list("pk", "latitude", "longitude").iterator(chunk_size=chunk_size)
+        for pk, lat, lng in rows:
+            if not is_valid_point(lat, lng):
+                continue
+            batch.append((pk, lat, lat, lng, lng))
+            if len(batch) >= chunk_size:
+                cursor.executemany(f"INSERT INTO {RTREE_TABLE} VALUES (%s, %s, %s, %s, %s)", batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(f"INSERT INTO {RTREE_TABLE} VALUES (%s, %s, %s, %s, %s)", batch)
+            count += len(batch)
+    return count
+
+
+# =====================================================
+# 検索
+# =====================================================
+def in_bbox(queryset, bbox: BoundingBox):
+    """
+    表示範囲に入る店舗に絞る
+    """
+    if is_enabled():
+        # R*Tree の座標は 32bit 浮動小数で少し外側に丸められるので、最後に元の列でも判定する
+        queryset = queryset.filter(pk__in=RawSQL(
+            f"SELECT id FROM {RTREE_TABLE} WHERE max_lat >= %s AND min_lat <= %s AND max_lng >= %s AND min_lng <= %s",
+            [bbox.south, bbox.north, bbox.west, bbox.east],
+        ))
+    return queryset.filter(
+        latitude__range=(bbox.south, bbox.north),
+        longitude__range=(bbox.west, bbox.east),
+    )
+
+
+def clusters(queryset, bbox: BoundingBox, grid: int = GRID) -> list[dict]:
+    """
+    表示範囲を grid × grid のマスに分け、マスごとの件数と重心を返す（1件だけのマスは店舗ID付き）
+    """
+    # 北端・東端ちょうどの点が grid 番目（範囲外）のマスにならないよう、マスを少しだけ広げる
+    cell_h = ((bbox.north - bbox.south) or 1e-9) / grid * 1.000001
+    cell_w = ((bbox.east - bbox.west) or 1e-9) / grid * 1.000001
+    rows = (
+        in_bbox(queryset, bbox)
+        .order_by()
+        .annotate(
+            cell_y=Cast((F("latitude") - bbox.south) / cell_h, IntegerField()),
+            cell_x=Cast((F("longitude") - bbox.west) / cell_w, IntegerField()),
+        )
+        .values("cell_y", "cell_x")
+        .annotate(count=Count("pk"), lat=Avg("latitude"), lng=Avg("longitude"), store_id=Min("pk"))
+    )
+    return [
+        {
+            "lat": row["lat"],
+            "lng": row["lng"],
+            "count": row["count"],
+            "store_id": row["store_id"] if row["count"] == 1 else None,
+        }
+        for row in rows
+    ]
+
+
+def distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    2点間の大円距離（haversine, km）
+    """
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((p2 - p1) / 2) ** 2
+        + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def within_radius(queryset, lat: float, lng: float, radius_km: float) -> list[tuple[int, float]]:
+    """
+    (lat, lng) から radius_km 以内の店舗の (店舗ID, 距離km)。queryset の並び順のまま返す
+    候補は円を囲む矩形で索引から引くので、全店舗の距離は計算しない
+    """
+    bbox = BoundingBox.around(lat, lng, radius_km)
+    candidates = in_bbox(queryset, bbox).values_list("pk", "latitude", "longitude")
+
+    # 候補の列をまとめて距離に変換（中心側の値は先に1回だけ計算）
+    radians, sin, cos, asin, sqrt = math.radians, math.sin, math.cos, math.asin, math.sqrt
+    p1, cos_p1, l1 = radians(lat), cos(radians(lat)), radians(lng)
+    limit = sin(radius_km / EARTH_RADIUS_KM / 2) ** 2
+    result = []
+    for pk, lat2, lng2 in candidates:
+        p2 = radians(lat2)
+        a = sin((p2 - p1) / 2) ** 2 + cos_p1 * cos(p2) * sin((radians(lng2) - l1) / 2) ** 2
+        # 半径の判定は haversine の a のまま比べ、距離に戻すのは残った店舗だけ
+        if a <= limit:
+            result.append((pk, 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))))
+    return result
@@ -0,0 +1,150 @@
+# commons/image_worker.py
+"""
+画像の縮小版（派生画像）を作る処理（プロセスプールの子プロセスで動く）と、
+アップロード画像の検証・再エンコード（commons.uploads のワーカーが使う）
+
+子プロセスは spawn で起動するので、このモジュールは Django を読み込まない。
+ファイルの読み書きは MEDIA_ROOT からの相対パスで行い、DB への記録は親プロセス側（commons.images）で行う。
+
+派生画像のパス：<prefix>/<ハッシュ先頭2文字>/<SHA-256>/<サイズ名>.<拡張子>
+同じ内容の画像は同じパスになるので、作り直しや重複アップロードでもファイルは増えない。
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+# サイズ名 -> 長辺の最大ピクセル（元画像より大きくはしない）
+SIZES = {
+    "thumb": 160,
+    "card": 480,
+    "full": 1280,
+}
+
+# 出力形式（拡張子 -> Pillow の形式名・保存オプション）
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+DERIVED_PREFIX = "derived"
+
+# アップロードを受け付ける形式と上限（これを超える画像は展開せずに弾く）
+UPLOAD_FORMATS = {"JPEG", "MPO", "PNG", "WEBP", "GIF"}
+MAX_UPLOAD_PIXELS = 40_000_000
+# 再エンコード後の長辺の上限
+MAX_UPLOAD_SIDE = 4096
+
+READ_CHUNK = 1024 * 1024
+
+
+def content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def derived_dir(digest: str) -> str:
+    return f"{DERIVED_PREFIX}/{digest[:2]}/{digest}"
+
+
+def _save_atomic(image: Image.Image, path: str, fmt: str, options: dict) -> None:
+    """
+    一時ファイルに書いてから置き換える（並行して同じ画像を処理しても壊れたファイルを見せない）
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, fmt, **options)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def render(media_root: str, source: str) -> dict:
+    """
+    source（MEDIA_ROOT からの相対パス）の派生画像を作る。既にあるファイルは作り直さない
+    戻り値：{"source", "content_hash", "width", "height", "variants": {サイズ名: {"width", "height", 拡張子: パス}}}
+    """
+    source_path = os.path.join(media_root, source)
+    digest = content_hash(source_path)
+    out_dir = derived_dir(digest)
+    os.makedirs(os.path.join(media_root, out_dir), exist_ok=True)
+
+    with Image.open(source_path) as opened:
+        # スマホ写真の向き（EXIF）を反映してから縮小する
+        image = ImageOps.exif_transpose(opened)
+        width, height = image.size
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        variants = {}
+        for name, max_side in SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((max_side, max_side), Image.LANCZOS)
+            variant = {"width": resized.width, "height": resized.height}
+            for ext, (fmt, options) in FORMATS.items():
+                rel_path = f"{out_dir}/{name}.{ext}"
+                abs_path = os.path.join(media_root, rel_path)
+                if not os.path.exists(abs_path):
+                    # JPEG は透過を持てないので白で塗る
+                    frame = resized
+                    if fmt == "JPEG" and resized.mode == "RGBA":
+                        frame = Image.new("RGB", resized.size, (255, 255, 255))
+                        frame.paste(resized, mask=resized.getchannel("A"))
+                    _save_atomic(frame, abs_path, fmt, options)
+                variant[ext] = rel_path
+            variants[name] = variant
+
+    return {
+        "source": source,
+        "content_hash": digest,
+        "width": width,
+        "height": height,
+        "variants": variants,
+    }
+
+
+def sanitize(source_path: str, dest_path: str) -> dict:
+    """
+    アップロードされた画像を検証し、EXIF などのメタデータを落として再エンコードする
+    透過のある画像は PNG、それ以外は JPEG で dest_path（拡張子なし）に書く
+    戻り値：{"ext", "width", "height"}。画像として受け付けられなければ ValueError
+    """
+    try:
+        with Image.open(source_path) as opened:
+            if opened.format not in UPLOAD_FORMATS:
+                raise ValueError(f"対応していない画像形式です（{opened.format}）")
+            if opened.width * opened.height > MAX_UPLOAD_PIXELS:
+                raise ValueError("画像が大きすぎます")
+            # 壊れたファイルを先に弾く（verify 後は読み直す必要がある）
+            opened.verify()
+
+        with Image.open(source_path) as opened:
+            # 向きは EXIF で付いているので、画素に反映してから EXIF ごと捨てる
+            image = ImageOps.exif_transpose(opened)
+            has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+    except ValueError:
+        raise
+    except Exception as e:
+        # Pillow の例外（壊れた画像・画像以外のファイル・解凍爆弾など）
+        raise ValueError(f"画像として読み込めません（{e}）")
+
+    image.thumbnail((MAX_UPLOAD_SIDE, MAX_UPLOAD_SIDE), Image.LANCZOS)
+    if has_alpha:
+        ext, fmt, options = "png", "PNG", {"optimize": True}
+    else:
+        ext, fmt, options = "jpg", "JPEG", {"quality": 90, "optimize": True, "progressive": True}
+    # 画素だけを新しい Image に写すので、EXIF（撮影位置など）や埋め込みメタデータは残らない
+    clean = Image.new(image.mode, image.size)
+    clean.paste(image)
+    _save_atomic(clean, f"{dest_path}.{ext}", fmt, options)
+    return {"ext": ext, "width": clean.width, "height": clean.height}
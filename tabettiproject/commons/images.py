@@ -0,0 +1,201 @@
+# commons/images.py
+"""
+アップロード画像の派生画像（thumb / card / full × WebP / JPEG）
+
+画像の保存時にシグナルから schedule() を呼ぶと、コミット後にプロセスプールへ渡して
+リクエストとは別に縮小版を作る（縮小処理は commons.image_worker）。
+できた派生画像は ImageDerivative に記録し、テンプレートは image_extras のタグで
+派生画像の URL を使う（まだ無ければ元画像の URL）。
+既存の画像は build_image_derivatives でまとめて作る。
+"""
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from commons import image_worker
+from commons.models import CustomerAccount, ImageDerivative, ReviewPhoto, StoreImage, StoreMenu
+
+# 派生画像を作る対象（モデル, 画像フィールド名）
+IMAGE_FIELDS = (
+    (StoreImage, "image_file"),
+    (StoreMenu, "image_file"),
+    (ReviewPhoto, "image_path"),
+    (CustomerAccount, "icon_image"),
+    (CustomerAccount, "cover_image"),
+)
+
+SIZES = tuple(image_worker.SIZES)
+
+# プロセスプールの大きさ・キャッシュ秒数（settings で上書き可）
+WORKERS = getattr(settings, "IMAGE_DERIVATIVE_WORKERS", 2)
+CACHE_TTL = getattr(settings, "IMAGE_DERIVATIVE_CACHE_TTL", 3600)
+# 「まだ無い」ことを覚えておく秒数（できたら record() が上書きする）
+MISSING_TTL = 60
+
+_lock = threading.Lock()
+_executor: ProcessPoolExecutor | None = None
+_collector: threading.Thread | None = None
+_results: queue.Queue = queue.Queue()
+_pending: set[str] = set()
+
+
+def _cache_key(source: str) -> str:
+    return "image_derivative:" + hashlib.md5(source.encode()).hexdigest()
+
+
+def source_name(image) -> str:
+    """
+    FieldFile / 文字列から MEDIA_ROOT からの相対パスを取り出す
+    """
+    return (getattr(image, "name", image) or "").strip() if image else ""
+
+
+# =====================================================
+# 参照
+# =====================================================
+def variants_for(sources) -> dict[str, dict]:
+    """
+    元画像名 -> variants（派生画像の無いものは含めない）。キャッシュに無い分だけ DB を1回引く
+    """
+    keys = {_cache_key(s): s for s in {source_name(s) for s in sources} if s}
+    if not keys:
+        return {}
+    found = cache.get_many(list(keys))
+    result = {keys[k]: v for k, v in found.items() if v}
+
+    missing = [s for k, s in keys.items() if k not in found]
+    if missing:
+        rows = dict(ImageDerivative.objects.filter(source__in=missing).values_list("source", "variants"))
+        cache.set_many({_cache_key(s): v for s, v in rows.items()}, CACHE_TTL)
+        cache.set_many({_cache_key(s): {} for s in missing if s not in rows}, MISSING_TTL)
+        result.update({s: v for s, v in rows.items() if v})
+    return result
+
+
+def url(image, size: str = "card", ext: str = "jpg") -> str:
+    """
+    派生画像の URL（まだ無ければ元画像の URL、画像が無ければ空文字）
+    """
+    source = source_name(image)
+    if not source:
+        return ""
+    variant = variants_for([source]).get(source, {}).get(size)
+    if variant and variant.get(ext):
+        return default_storage.url(variant[ext])
+    return default_storage.url(source)
+
+
+def srcset(variants: dict, ext: str) -> str:
+    """
+    <img srcset> / <source srcset> 用の「URL 幅w, ...」
+    """
+    entries = []
+    seen_widths = set()
+    for size in SIZES:
+        variant = variants.get(size)
+        if not variant or not variant.get(ext) or variant["width"] in seen_widths:
+            continue
+        seen_widths.add(variant["width"])
+        entries.append(f"{default_storage.url(variant[ext])} {variant['width']}w")
+    return ", ".join(entries)
+
+
+# =====================================================
+# 作成
+# =====================================================
+def record(result: dict) -> ImageDerivative:
+    obj, _ = ImageDerivative.objects.update_or_create(
+        source=result["source"],
+        defaults={
+            "content_hash": result["content_hash"],
+            "width": result["width"],
+            "height": result["height"],
+            "variants": result["variants"],
+        },
+    )
+    cache.set(_cache_key(obj.source), obj.variants, CACHE_TTL)
+    return obj
+
+
+def process(source: str) -> ImageDerivative | None:
+    """
+    その場で派生画像を作って記録する（バックフィル・テスト用）。読めない画像は None
+    """
+    try:
+        result = image_worker.render(str(settings.MEDIA_ROOT), source)
+    except Exception as e:
+        # ファイルが無い・画像として読めない
+        print("IMAGE DERIVATIVE ERROR:", source, e)
+        return None
+    return record(result)
+
+
+def create_pool(workers: int = WORKERS) -> ProcessPoolExecutor:
+    # 子プロセスは Django の状態（DB 接続など）を引き継がないよう spawn で起動する
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _collect() -> None:
+    """
+    子プロセスの結果を受け取って DB に記録する（専用スレッド）
+    """
+    while True:
+        source, future = _results.get()
+        try:
+            record(future.result())
+        except Exception as e:
+            print("IMAGE DERIVATIVE ERROR:", source, e)
+        finally:
+            with _lock:
+                _pending.discard(source)
+            connection.close()
+
+
+def _submit(source: str) -> None:
+    global _executor, _collector
+    with _lock:
+        if source in _pending:
+            return
+        _pending.add(source)
+        if _executor is None:
+            _executor = create_pool()
+        if _collector is None:
+            _collector = threading.Thread(target=_collect, name="image-derivatives", daemon=True)
+            _collector.start()
+        future = _executor.submit(image_worker.render, str(settings.MEDIA_ROOT), source)
+    _results.put((source, future))
+
+
+def schedule(image) -> bool:
+    """
+    派生画像がまだ無ければ、コミット後にプロセスプールで作る。予約したら True
+    """
+    source = source_name(image)
+    if not source or variants_for([source]):
+        return False
+    transaction.on_commit(lambda: _submit(source))
+    return True
+
+
+def sources_without_derivatives(force: bool = False) -> list[str]:
+    """
+    IMAGE_FIELDS の画像のうち派生画像の無いもの（force なら全部）
+    """
+    sources = set()
+    for model, field in IMAGE_FIELDS:
+        sources.update(
+            model.objects.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+            .order_by().values_list(field, flat=True).distinct()
+        )
+    if not force:
+        sources -= set(ImageDerivative.objects.values_list("source", flat=True))
+    return sorted(sources)
@@ -0,0 +1,76 @@
+# commons/keyset.py
+"""
+キーセット（カーソル）方式のページ送り
+
+OFFSET を使わず「前のページの最後の行 (日時, id) より古いもの」を索引順に引くので、
+何ページ目でも先頭ページと同じ手間で返せる（無限スクロール用）。
+並び順は (日時の降順, id の降順)。日時が同じ行は id で順序が決まる。
+カーソルは最後の行の (日時, id) を URL に載せられる文字列にしたもの。
+"""
+from __future__ import annotations
+
+import base64
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _micros(at: datetime) -> int:
+    # UTC からのマイクロ秒（タイムゾーン表記の違いでカーソルが変わらないように）
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=dt_timezone.utc)
+    delta = at - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def encode(at: datetime, pk: int) -> str:
+    return base64.urlsafe_b64encode(f"{_micros(at)}:{pk}".encode()).decode().rstrip("=")
+
+
+def decode(cursor: str) -> tuple[datetime, int]:
+    """
+    encode() の逆。不正なカーソルは ValueError
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        micros, pk = (int(part) for part in raw.split(":"))
+        at = EPOCH + timedelta(microseconds=micros)
+    except (ValueError, TypeError, UnicodeDecodeError, OverflowError):
+        raise ValueError("カーソルが不正です。")
+    return at, pk
+
+
+def clamp_size(size: int) -> int:
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def after(queryset, cursor: str | None, field: str = "posted_at", pk_field: str = "pk"):
+    """
+    カーソルの行より後ろ（(field, pk_field) が小さいもの）に絞る。カーソルが無ければそのまま
+    """
+    if not cursor:
+        return queryset
+    at, pk = decode(cursor)
+    return queryset.filter(Q(**{f"{field}__lt": at}) | Q(**{field: at, f"{pk_field}__lt": pk}))
+
+
+def page(queryset, cursor: str | None = None, size: int = PAGE_SIZE, field: str = "posted_at"):
+    """
+    queryset を (field 降順, id 降順) で size 件だけ引く
+    戻り値：(行のリスト, 次のページのカーソル（最後のページなら None）)
+    """
+    size = clamp_size(size)
+    queryset = after(queryset.order_by(f"-{field}", "-pk"), cursor, field)
+
+    # 1件多く引いて次があるかを判定する（COUNT はしない）
+    rows = list(queryset[:size + 1])
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    last = rows[-1]
+    return rows, encode(getattr(last, field), last.pk)
@@ -0,0 +1,209 @@
+# commons/likes.py
+"""
+口コミの「いいね」
+
+いいねの有無は中間テーブル（Review.liked_users の through）の1行で、
+(review_id, account_id) の一意索引で存在確認する（いいねした人の一覧は読まない）。
+Review.like_count は F() で足し引きし、口コミ全体の save() は呼ばない。
+信頼度・口コミの重み・店舗評価への反映は review_likes_changed シグナルで行う（commons.signals）。
+
+一覧で「自分がいいね済みか」を出すときは liked_by() で表示中の口コミ分を1クエリで引く。
+結果は閲覧者ごとのバージョン付きキーでキャッシュし、いいねを切り替えたらバージョンを上げる
+（共有キャッシュなので、どのプロセスで切り替えても全プロセスで無効になる）。
+
+まとめ書きモード（REVIEW_LIKE_COALESCE_SECONDS > 0）では、いいねの行だけ即時に書き、
+いいね数と信頼度・店舗評価への反映は口コミごとの差分として数秒ぶん溜めてから1回で当てる。
+人気の口コミにいいねが集中しても、同じ行・同じ集計を1回ずつしか更新しない。
+"""
+from __future__ import annotations
+
+import atexit
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.dispatch import Signal
+
+from commons import page_cache
+from commons.models import Review
+
+# まとめ書きの間隔（秒、0 なら毎回その場で反映。settings で上書き可）
+COALESCE_SECONDS = getattr(settings, "REVIEW_LIKE_COALESCE_SECONDS", 0)
+
+# いいね済みの判定を閲覧者ごとに覚えておく秒数・件数（settings で上書き可）
+LIKED_CACHE_TTL = getattr(settings, "REVIEW_LIKED_CACHE_TTL", 600)
+LIKED_CACHE_MAX = 2000
+
+# いいね数が変わった（deltas={review_id: 増減}）
+review_likes_changed = Signal()
+
+Like = Review.liked_users.through
+
+_lock = threading.Lock()
+_pending: Counter = Counter()
+_timer: threading.Timer | None = None
+
+
+def is_liked(review_id: int, user_id: int) -> bool:
+    return Like.objects.filter(review_id=review_id, account_id=user_id).exists()
+
+
+def _liked_version_name(user_id: int) -> str:
+    return f"review_liked:{user_id}"
+
+
+def _viewer_id(viewer) -> int | None:
+    if viewer is None or not getattr(viewer, "is_authenticated", True):
+        return None
+    return getattr(viewer, "pk", viewer)
+
+
+def liked_by(viewer, review_ids) -> set[int]:
+    """
+    review_ids のうち viewer がいいね済みの口コミID（未ログインなら空）
+    閲覧者ごとのキャッシュ {review_id: いいね済みか} に無い分だけ1クエリで引く
+    """
+    user_id = _viewer_id(viewer)
+    review_ids = {int(review_id) for review_id in review_ids}
+    if not user_id or not review_ids:
+        return set()
+
+    # バージョンは DB を引く前に読む（切り替えのコミット前に引いた古い判定は、
+    # 切り替えでバージョンが上がった後は古いキーに書かれるだけで使われない）
+    version = page_cache.get_version(_liked_version_name(user_id))
+    key = f"review_liked:{user_id}:{version}"
+    known = cache.get(key) or {}
+    missing = review_ids - known.keys()
+    if missing:
+        liked = set(
+            Like.objects.filter(account_id=user_id, review_id__in=missing).values_list("review_id", flat=True)
+        )
+        # 見て回るほど増えるので、上限を超えたら今回の分だけにする
+        if len(known) + len(missing) > LIKED_CACHE_MAX:
+            known = {}
+        known.update({review_id: review_id in liked for review_id in missing})
+        cache.set(key, known, LIKED_CACHE_TTL)
+    return {review_id for review_id in review_ids if known.get(review_id)}
+
+
+def liked_context(viewer, reviews) -> dict:
+    """
+    一覧テンプレート用：{"liked_review_ids": いいね済みの口コミIDの set}
+    テンプレートでは {% if review.pk in liked_review_ids %} で判定する
+    """
+    return {"liked_review_ids": liked_by(viewer, (review.pk for review in reviews))}
+
+
+def like_count(review_id: int) -> int:
+    """
+    いいね数（まとめ書き待ちの差分を含む）
+    """
+    stored = Review.objects.filter(pk=review_id).values_list("like_count", flat=True).first() or 0
+    with _lock:
+        return stored + _pending.get(review_id, 0)
+
+
+def apply_deltas(deltas: dict[int, int]) -> None:
+    """
+    いいね数に差分を足し、review_likes_changed で信頼度・店舗評価へ反映する
+    """
+    deltas = {review_id: delta for review_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        for review_id, delta in deltas.items():
+            Review.objects.filter(pk=review_id).update(like_count=F("like_count") + delta)
+        review_likes_changed.send(sender=Review, deltas=deltas)
+
+
+def toggle(review_id: int, user_id: int, window: float | None = None) -> tuple[bool, int]:
+    """
+    いいね / いいね取り消しを切り替える。戻り値：(いいね中か, いいね数)
+    window：まとめ書きの秒数（None なら COALESCE_SECONDS、0 ならその場で反映）
+    """
+    window = COALESCE_SECONDS if window is None else window
+    with transaction.atomic():
+        liked = not is_liked(review_id, user_id)
+        if liked:
+            try:
+                with transaction.atomic():
+                    Like.objects.create(review_id=review_id, account_id=user_id)
+                delta = 1
+            except IntegrityError:
+                # 二重送信で先に入っていた
+                delta = 0
+        else:
+            # 二重送信で先に消えていれば 0
+            delta = -Like.objects.filter(review_id=review_id, account_id=user_id).delete()[0]
+
+        # 閲覧者のいいね済みキャッシュのバージョンを上げる（どのプロセス・端末の分も無効になる）
+        transaction.on_commit(lambda: page_cache.bump(_liked_version_name(user_id)))
+
+        if window > 0:
+            # 差分はコミット後に溜める（それまでの分をここで足して返す）
+            total = like_count(review_id) + delta
+            transaction.on_commit(lambda: _buffer(review_id, delta, window))
+        else:
+            apply_deltas({review_id: delta})
+            total = like_count(review_id)
+
+    return liked, total
+
+
+# =====================================================
+# まとめ書き
+# =====================================================
+def _buffer(review_id: int, delta: int, window: float) -> None:
+    global _timer
+    if not delta:
+        return
+    with _lock:
+        _pending[review_id] += delta
+        if _timer is None:
+            _timer = threading.Timer(window, _flush_from_timer)
+            _timer.daemon = True
+            _timer.start()
+
+
+def flush() -> int:
+    """
+    溜めた差分を反映する。戻り値：反映した口コミ数
+    """
+    global _pending, _timer
+    with _lock:
+        pending, _pending = _pending, Counter()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not pending:
+        return 0
+    try:
+        apply_deltas(pending)
+    except Exception:
+        # 反映できなかった分は次回に回す
+        with _lock:
+            _pending.update(pending)
+        raise
+    return len(pending)
+
+
+def _flush_from_timer() -> None:
+    try:
+        flush()
+    except Exception as e:
+        print("REVIEW LIKE FLUSH ERROR:", e)
+    finally:
+        connection.close()
+
+
+def _flush_at_exit() -> None:
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,64 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from commons import fulltext
+from commons.models import Review, Store
+
+
+def _store_icontains(keyword):
+    return Store.objects.filter(
+        Q(store_name__icontains=keyword) |
+        Q(genre__icontains=keyword) |
+        Q(address__icontains=keyword) |
+        Q(scene__scene_name__icontains=keyword)
+    ).order_by('id')
+
+
+def _review_icontains(keyword):
+    return Review.objects.filter(review_text__icontains=keyword).order_by('id')
+
+
+class Command(BaseCommand):
+    help = 'キーワード検索の速さを icontains と全文検索索引で比べます'
+
+    def add_arguments(self, parser):
+        parser.add_argument('keywords', nargs='+', help='検索キーワード（3文字以上）')
+        parser.add_argument('--repeat', type=int, default=20, help='1キーワードあたりの実行回数（デフォルト: 20）')
+
+    def _measure(self, build, repeat):
+        timings = []
+        ids = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            ids = list(build().values_list('pk', flat=True))
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), ids
+
+    def handle(self, *args, **options):
+        if not fulltext.is_enabled():
+            self.stdout.write(self.style.WARNING('全文検索は SQLite でのみ使えます'))
+            return
+
+        repeat = max(1, options['repeat'])
+        cases = (
+            ('店舗', _store_icontains, lambda kw: fulltext.search_stores(Store.objects.order_by('id'), kw)),
+            ('口コミ', _review_icontains, lambda kw: fulltext.search_reviews(Review.objects.order_by('id'), kw)),
+        )
+
+        for keyword in options['keywords']:
+            if fulltext.match_expression(keyword) is None:
+                self.stdout.write(self.style.WARNING(f'「{keyword}」は短いため全文検索を使いません（スキップ）'))
+                continue
+            for label, baseline, indexed in cases:
+                base_ms, base_ids = self._measure(lambda: baseline(keyword), repeat)
+                fts_ms, fts_ids = self._measure(lambda: indexed(keyword), repeat)
+                same = '一致' if base_ids == fts_ids else '不一致'
+                self.stdout.write(
+                    f'{label}「{keyword}」: icontains {base_ms:.2f}ms / 全文検索 {fts_ms:.2f}ms '
+                    f'（{len(fts_ids)} 件・結果{same}）'
+                )
+
+        self.stdout.write(self.style.SUCCESS('完了'))
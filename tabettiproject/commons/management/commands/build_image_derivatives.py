@@ -0,0 +1,40 @@
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from commons import image_worker, images
+
+
+class Command(BaseCommand):
+    help = 'アップロード画像の縮小版（thumb / card / full × WebP / JPEG）をまとめて作ります'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=images.WORKERS,
+                            help=f'縮小処理のプロセス数（デフォルト: {images.WORKERS}）')
+        parser.add_argument('--force', action='store_true',
+                            help='作成済みの画像も記録し直す（同じ内容のファイルは作り直さない）')
+
+    def handle(self, *args, **options):
+        sources = images.sources_without_derivatives(force=options['force'])
+        self.stdout.write(f'{len(sources)} 件の画像を処理します...')
+        if not sources:
+            self.stdout.write(self.style.SUCCESS('完了: 対象の画像はありません'))
+            return
+
+        media_root = str(settings.MEDIA_ROOT)
+        done = failed = 0
+        with images.create_pool(max(1, options['workers'])) as pool:
+            futures = {pool.submit(image_worker.render, media_root, source): source for source in sources}
+            for future in as_completed(futures):
+                try:
+                    images.record(future.result())
+                    done += 1
+                except Exception as e:
+                    # ファイルが無い・画像として読めない
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'スキップ: {futures[future]} ({e})'))
+                if (done + failed) % 100 == 0:
+                    self.stdout.write(f'  {done + failed}/{len(sources)} 件')
+
+        self.stdout.write(self.style.SUCCESS(f'完了: {done} 件作成・{failed} 件スキップ'))
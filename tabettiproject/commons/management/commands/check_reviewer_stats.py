@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from commons.models import CustomerAccount
+from commons import ratings, reviewer_stats, trust
+
+
+class Command(BaseCommand):
+    help = 'プロフィール見出しのカウンタ（口コミ・フォロー・フォロワー・写真・いいね・店舗数）を実データと照合し、ずれを修正します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='ずれの報告のみ行い、修正しない')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        self.stdout.write('プロフィールカウンタの整合性チェックを開始します...')
+
+        fields = reviewer_stats.PROFILE_FIELDS
+        expected = reviewer_stats.true_stats()
+        empty = dict.fromkeys(fields, 0)
+
+        drifted = []
+        for row in CustomerAccount.objects.values('pk', 'nickname', *fields).iterator():
+            want = expected.get(row['pk'], empty)
+            diff = {k: (row[k], want[k]) for k in fields if row[k] != want[k]}
+            if diff:
+                drifted.append((row['pk'], row['nickname'], want, diff))
+
+        for pk, nickname, _want, diff in drifted:
+            detail = ', '.join(f'{k}: {have} -> {want}' for k, (have, want) in diff.items())
+            self.stdout.write(self.style.WARNING(f'ユーザー {nickname} (id={pk}): {detail}'))
+
+        if dry_run or not drifted:
+            self.stdout.write(
+                self.style.SUCCESS(f'完了: {len(drifted)} 人のカウンタにずれがありました')
+            )
+            return
+
+        for pk, _nickname, want, diff in drifted:
+            with transaction.atomic():
+                CustomerAccount.objects.filter(pk=pk).update(**want)
+                if set(diff) - set(reviewer_stats.STAT_FIELDS):
+                    # 信頼度用のカウンタもずれていた：信頼度を付け直し、口コミの重み → 店舗評価まで反映
+                    # （点数の合計・二乗和は check_trust_counters で照合する）
+                    trust.apply_customer_delta(pk, reweight=False)
+                    ratings.reweight_reviewer(pk)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'完了: {len(drifted)} 人のカウンタを修正しました')
+        )
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from commons.models import CustomerAccount
+from commons import ratings, trust
+
+COUNTER_NAMES = ('review_count', 'total_likes', 'score_sum', 'score_sq_sum', 'follower_count')
+
+
+class Command(BaseCommand):
+    help = '信頼度スコア用カウンタを口コミ・フォローの実データと照合し、ずれを修正します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='ずれの報告のみ行い、修正しない')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        self.stdout.write('カウンタの整合性チェックを開始します...')
+
+        expected = trust.true_counters()
+        empty = dict.fromkeys(COUNTER_NAMES, 0)
+
+        drifted = []
+        for row in CustomerAccount.objects.values('pk', 'nickname', *COUNTER_NAMES).iterator():
+            want = expected.get(row['pk'], empty)
+            diff = {k: (row[k], want[k]) for k in COUNTER_NAMES if row[k] != want[k]}
+            if diff:
+                drifted.append((row['pk'], row['nickname'], want, diff))
+
+        for pk, nickname, _want, diff in drifted:
+            detail = ', '.join(f'{k}: {have} -> {want}' for k, (have, want) in diff.items())
+            self.stdout.write(self.style.WARNING(f'ユーザー {nickname} (id={pk}): {detail}'))
+
+        if dry_run or not drifted:
+            self.stdout.write(
+                self.style.SUCCESS(f'完了: {len(drifted)} 人のカウンタにずれがありました')
+            )
+            return
+
+        for pk, _nickname, want, _diff in drifted:
+            with transaction.atomic():
+                CustomerAccount.objects.filter(pk=pk).update(**want)
+                # 信頼度を付け直し、口コミの重み → 店舗評価まで反映
+                trust.apply_customer_delta(pk, reweight=False)
+                ratings.reweight_reviewer(pk)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'完了: {len(drifted)} 人のカウンタを修正しました')
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from commons import uploads
+
+
+class Command(BaseCommand):
+    help = '処理待ちの写真アップロード（ImageUpload）を検証・再エンコードして口コミ写真・店舗写真にします'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='処理する最大件数（デフォルト: すべて）')
+        parser.add_argument('--retry', action='store_true',
+                            help='失敗・処理中のまま止まったものも処理待ちに戻してやり直す')
+
+    def handle(self, *args, **options):
+        if options['retry']:
+            count = uploads.requeue(include_processing=True)
+            self.stdout.write(f'{count} 件を処理待ちに戻しました')
+
+        done, failed = uploads.process_pending(limit=options['limit'])
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} 件は処理できませんでした（管理画面の写真アップロードを確認してください）'))
+        self.stdout.write(self.style.SUCCESS(f'完了: {done} 件処理・{failed} 件失敗'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from commons import access_log
+
+
+class Command(BaseCommand):
+    help = '保持期間を過ぎた店舗アクセスの生ログを削除します（日次集計は残します）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=access_log.RETENTION_DAYS,
+                            help=f'保持日数（デフォルト: {access_log.RETENTION_DAYS}）')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='1回の DELETE で消す件数（デフォルト: 5000）')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{options["days"]} 日より古いアクセスログを削除します...')
+
+        deleted = access_log.prune_raw_logs(days=options['days'], chunk_size=options['chunk_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'完了: {deleted} 件のアクセスログを削除しました')
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from commons import fulltext
+
+
+class Command(BaseCommand):
+    help = '店舗・口コミの全文検索索引（FTS5 trigram）を作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=fulltext.REBUILD_BATCH_SIZE,
+                            help=f'1回に書き込む件数（デフォルト: {fulltext.REBUILD_BATCH_SIZE}）')
+
+    def handle(self, *args, **options):
+        if not fulltext.is_enabled():
+            self.stdout.write(self.style.WARNING('全文検索は SQLite でのみ使えます。何もしませんでした'))
+            return
+
+        self.stdout.write('全文検索索引の再作成を開始します...')
+
+        stores, reviews = fulltext.rebuild(chunk_size=options['chunk_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'完了: 店舗 {stores} 件・口コミ {reviews} 件を索引に登録しました')
+        )
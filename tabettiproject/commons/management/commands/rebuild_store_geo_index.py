@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from commons import geo
+
+
+class Command(BaseCommand):
+    help = '店舗の位置索引（地図の表示範囲検索用 R*Tree）を作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='1回に書き込む件数（デフォルト: 2000）')
+
+    def handle(self, *args, **options):
+        if not geo.is_enabled():
+            self.stdout.write(self.style.WARNING('位置索引は SQLite でのみ使います。何もしませんでした'))
+            return
+
+        self.stdout.write('位置索引の再作成を開始します...')
+
+        count = geo.rebuild(chunk_size=options['chunk_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'完了: {count} 店舗を位置索引に登録しました'))
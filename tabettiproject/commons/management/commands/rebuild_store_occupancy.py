@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from commons import occupancy
+
+
+class Command(BaseCommand):
+    help = '予約から店舗の使用席数タイムライン（StoreOccupancy）を作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', type=int, action='append', dest='store_ids',
+                            help='対象店舗ID（複数指定可。省略時は全店舗）')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='予約を読み込む件数（デフォルト: 2000）')
+
+    def handle(self, *args, **options):
+        self.stdout.write('使用席数タイムラインの再作成を開始します...')
+
+        created = occupancy.rebuild(
+            store_ids=options['store_ids'],
+            chunk_size=options['chunk_size'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'完了: {created} 件（店舗 × 日付）のタイムラインを作成しました')
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from commons.ratings import rebuild_store_ratings
+
+
+class Command(BaseCommand):
+    help = '口コミの重みと店舗評価集計（StoreRatingSummary）を作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', type=int, action='append', dest='store_ids',
+                            help='対象店舗ID（複数指定可。省略時は全店舗）')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='一括更新の件数（デフォルト: 500）')
+
+    def handle(self, *args, **options):
+        self.stdout.write('店舗評価の再集計を開始します...')
+
+        updated = rebuild_store_ratings(
+            store_ids=options['store_ids'],
+            chunk_size=options['chunk_size'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'完了: {updated} 店舗の評価集計を更新しました')
+        )
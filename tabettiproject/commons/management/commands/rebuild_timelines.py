@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from commons import timeline
+
+
+class Command(BaseCommand):
+    help = 'フォロー中のユーザーの口コミのタイムラインを作り直します（既存データの取り込み・配信閾値の変更時）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customer', type=int, action='append', dest='customers',
+                            help='作り直す顧客の ID（複数指定可、省略時は全員）')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'タイムラインを作り直します（フォロワー {timeline.fanout_max_followers()} 人以上の投稿者は読むときに引きます）...'
+        )
+
+        def progress(done, total):
+            if done % 1000 == 0 or done == total:
+                self.stdout.write(f'  {done}/{total} 件のフォロー')
+
+        with transaction.atomic():
+            created = timeline.rebuild(options['customers'], progress=progress)
+
+        self.stdout.write(self.style.SUCCESS(f'完了: {created} 件のタイムライン行を作成しました'))
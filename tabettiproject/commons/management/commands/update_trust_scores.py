@@ -1,29 +1,22 @@
 from django.core.management.base import BaseCommand
-from commons.models import CustomerAccount
+from commons import trust
 
 
 class Command(BaseCommand):
     help = '全ユーザーの信頼度スコアを更新します'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='一括更新の件数（デフォルト: 500）')
+
     def handle(self, *args, **options):
         self.stdout.write('信頼度スコアの更新を開始します...')
-        
-        customers = CustomerAccount.objects.all()
-        total = customers.count()
-        updated = 0
-        
-        for customer in customers:
-            try:
-                customer.update_trust_score()
-                updated += 1
-                
-                if updated % 100 == 0:
-                    self.stdout.write(f'進捗: {updated}/{total}')
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'ユーザー {customer.nickname} の更新に失敗: {str(e)}')
-                )
-        
+
+        def progress(done, total):
+            self.stdout.write(f'進捗: {done}/{total}')
+
+        updated = trust.recompute_all(chunk_size=options['chunk_size'], progress=progress)
+
         self.stdout.write(
-            self.style.SUCCESS(f'完了: {updated}/{total} 人のユーザーの信頼度スコアを更新しました')
+            self.style.SUCCESS(f'完了: {updated} 人のユーザーの信頼度スコアを更新しました')
         )
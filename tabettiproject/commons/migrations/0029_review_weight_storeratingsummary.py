@@ -0,0 +1,82 @@
+# Generated by Django 4.0 on 2026-10-18 01:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_store_ratings(apps, schema_editor):
+    """
+    既存の口コミから重みと店舗評価集計を作る（commons.ratings.rebuild_store_ratings と同じ式）
+    """
+    Review = apps.get_model("commons", "Review")
+    Store = apps.get_model("commons", "Store")
+    StoreRatingSummary = apps.get_model("commons", "StoreRatingSummary")
+
+    sums = {}
+    changed = []
+    rows = Review.objects.values_list(
+        "id", "store_id", "score", "like_count", "reviewer__trust_score", "reviewer__follower_count"
+    )
+    for rid, store_id, score, like_count, trust_score, follower_count in rows.iterator():
+        like_factor = 1.0 + float(like_count or 0) / 5.0
+        weight = (
+            (float(trust_score or 0.0) / 10.0)
+            * (like_factor * like_factor * like_factor)
+            * (1.0 + float(follower_count or 0) / 10.0)
+        )
+        changed.append(Review(id=rid, weight=weight))
+        acc = sums.setdefault(store_id, [0.0, 0.0, 0, 0])
+        acc[0] += score * weight
+        acc[1] += weight
+        acc[2] += 1
+        acc[3] += score
+    Review.objects.bulk_update(changed, ["weight"], batch_size=500)
+
+    summaries = []
+    for store_id in Store.objects.values_list("id", flat=True):
+        wsum, wt, cnt, total = sums.get(store_id, (0.0, 0.0, 0, 0))
+        summaries.append(StoreRatingSummary(
+            store_id=store_id,
+            weighted_sum=wsum,
+            weight_total=wt,
+            review_count=cnt,
+            total_score=total,
+            avg_score=(total / cnt) if cnt else 0.0,
+            weighted_avg_rating=(wsum / wt) if wt > 1e-9 else None,
+        ))
+    StoreRatingSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0028_customeraccount_follower_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='weight',
+            field=models.FloatField(default=0.0, verbose_name='評価重み'),
+        ),
+        migrations.CreateModel(
+            name='StoreRatingSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weighted_sum', models.FloatField(default=0.0, verbose_name='加重スコア合計')),
+                ('weight_total', models.FloatField(default=0.0, verbose_name='重み合計')),
+                ('avg_score', models.FloatField(default=0.0, verbose_name='単純平均')),
+                ('review_count', models.IntegerField(db_index=True, default=0, verbose_name='口コミ数')),
+                ('total_score', models.IntegerField(db_index=True, default=0, verbose_name='合計スコア')),
+                ('weighted_avg_rating', models.FloatField(blank=True, db_index=True, null=True, verbose_name='加重平均評価')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('store', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rating_summary', to='commons.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': '店舗評価集計',
+                'verbose_name_plural': '店舗評価集計',
+                'db_table': 'store_rating_summaries',
+            },
+        ),
+        migrations.RunPython(backfill_store_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.0 on 2026-10-18 01:20
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def backfill_score_counters(apps, schema_editor):
+    """
+    既存の口コミ・フォローからカウンタを作る
+    """
+    CustomerAccount = apps.get_model("commons", "CustomerAccount")
+    Review = apps.get_model("commons", "Review")
+    Follow = apps.get_model("commons", "Follow")
+
+    counters = {}
+    for row in Review.objects.values("reviewer_id").annotate(
+        cnt=Count("id"),
+        likes=Sum("like_count"),
+        total=Sum("score"),
+        sq=Sum(F("score") * F("score")),
+    ):
+        counters[row["reviewer_id"]] = row
+    followers = dict(
+        Follow.objects.values("followee_id").annotate(cnt=Count("id")).values_list("followee_id", "cnt")
+    )
+
+    customers = list(CustomerAccount.objects.only("pk"))
+    for customer in customers:
+        row = counters.get(customer.pk) or {}
+        customer.review_count = row.get("cnt") or 0
+        customer.total_likes = row.get("likes") or 0
+        customer.score_sum = row.get("total") or 0
+        customer.score_sq_sum = row.get("sq") or 0
+        customer.follower_count = followers.get(customer.pk, 0)
+    CustomerAccount.objects.bulk_update(
+        customers,
+        ["review_count", "total_likes", "score_sum", "score_sq_sum", "follower_count"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0029_review_weight_storeratingsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customeraccount',
+            name='score_sq_sum',
+            field=models.IntegerField(default=0, verbose_name='点数二乗和'),
+        ),
+        migrations.AddField(
+            model_name='customeraccount',
+            name='score_sum',
+            field=models.IntegerField(default=0, verbose_name='点数合計'),
+        ),
+        migrations.RunPython(backfill_score_counters, migrations.RunPython.noop),
+    ]
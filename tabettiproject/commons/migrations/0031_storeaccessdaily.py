@@ -0,0 +1,60 @@
+# Generated by Django 4.0 on 2026-10-18 01:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_access_daily(apps, schema_editor):
+    """
+    既存の生ログから日次集計を作る（日付は TIME_ZONE 基準）
+    """
+    StoreAccessLog = apps.get_model("commons", "StoreAccessLog")
+    StoreAccessDaily = apps.get_model("commons", "StoreAccessDaily")
+
+    rows = (
+        StoreAccessLog.objects.order_by()
+        .annotate(day=TruncDate("accessed_at"))
+        .values("store_id", "day")
+        .annotate(cnt=Count("id"))
+    )
+    StoreAccessDaily.objects.bulk_create(
+        [StoreAccessDaily(store_id=r["store_id"], date=r["day"], count=r["cnt"]) for r in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0030_customeraccount_score_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='storeaccesslog',
+            name='accessed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='アクセス日時'),
+        ),
+        migrations.CreateModel(
+            name='StoreAccessDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日付')),
+                ('count', models.IntegerField(default=0, verbose_name='アクセス数')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_daily', to='commons.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': '店舗アクセス日次集計',
+                'verbose_name_plural': '店舗アクセス日次集計',
+                'db_table': 'store_access_daily',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='storeaccessdaily',
+            constraint=models.UniqueConstraint(fields=('store', 'date'), name='uniq_store_access_daily'),
+        ),
+        migrations.RunPython(backfill_access_daily, migrations.RunPython.noop),
+    ]
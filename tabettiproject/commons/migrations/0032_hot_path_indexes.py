@@ -0,0 +1,45 @@
+# Generated by Django 4.0 on 2026-10-18 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0031_storeaccessdaily'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['followee', 'follower'], name='idx_follow_followee_follower'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['store', 'visit_date'], name='idx_resv_store_date'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['booking_user', 'store', 'booking_status'], name='idx_resv_user_store_status'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['store', '-posted_at'], name='idx_review_store_posted'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['reviewer', '-posted_at'], name='idx_review_reviewer_posted'),
+        ),
+        migrations.AddIndex(
+            model_name='store',
+            index=models.Index(fields=['scene', 'seats'], name='idx_store_scene_seats'),
+        ),
+        migrations.AddIndex(
+            model_name='storeaccesslog',
+            index=models.Index(fields=['store', 'accessed_at'], name='idx_access_store_at'),
+        ),
+        migrations.AddIndex(
+            model_name='storeaccesslog',
+            index=models.Index(fields=['accessed_at'], name='idx_access_at'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.0 on 2026-10-18 01:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def compact_default_rows(apps, schema_editor):
+    """
+    ID209-390 の店舗について、閲覧時に自動生成された「既定どおり」の行を削除する
+    （受付中・席数が店舗の既定値。既定ルールから同じ内容が計算される）
+    """
+    Store = apps.get_model("commons", "Store")
+    StoreOnlineReservation = apps.get_model("commons", "StoreOnlineReservation")
+
+    stores = Store.objects.filter(pk__gte=209, pk__lte=390).values_list("pk", "seats")
+    for store_id, seats in stores.iterator():
+        default_seats = int(seats or 0) or 999
+        StoreOnlineReservation.objects.filter(
+            store_id=store_id,
+            booking_status=True,
+            available_seats=default_seats,
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0032_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreReservationRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('open_weekdays', models.PositiveSmallIntegerField(default=127, verbose_name='受付曜日')),
+                ('available_seats', models.IntegerField(default=0, help_text='0 の場合は店舗の席数を使う', verbose_name='予約可能席数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('store', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reservation_rule', to='commons.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': '店舗ネット予約ルール',
+                'verbose_name_plural': '店舗ネット予約ルール',
+                'db_table': 'store_reservation_rules',
+            },
+        ),
+        migrations.RunPython(compact_default_rows, migrations.RunPython.noop),
+    ]
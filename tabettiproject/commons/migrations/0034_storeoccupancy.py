@@ -0,0 +1,77 @@
+# Generated by Django 4.0 on 2026-10-18 01:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import defaultdict
+
+COURSE_MINUTES = {
+    "30分コース": 30,
+    "1時間コース": 60,
+    "1時間30分コース": 90,
+    "2時間コース": 120,
+    "2時間30分コース": 150,
+}
+
+
+def backfill_occupancy(apps, schema_editor):
+    """
+    既存の予約から15分枠ごとの使用席数を作る（キャンセル・保存済みは除く）
+    """
+    Reservation = apps.get_model("commons", "Reservation")
+    StoreOccupancy = apps.get_model("commons", "StoreOccupancy")
+
+    grouped = defaultdict(lambda: [0] * 96)
+    rows = Reservation.objects.order_by().values_list(
+        "store_id", "visit_date", "visit_time", "start_time", "end_time",
+        "visit_count", "course", "booking_status__status",
+    )
+    for store_id, d, visit_time, start_time, end_time, count, course, status in rows.iterator():
+        status = (status or "").strip()
+        if status == "保存済み" or "キャンセル" in status or "cancel" in status.lower():
+            continue
+        start = start_time or visit_time
+        if start is None or not count or count <= 0:
+            continue
+        start_m = start.hour * 60 + start.minute
+        if end_time is not None and end_time.hour * 60 + end_time.minute > start_m:
+            end_m = end_time.hour * 60 + end_time.minute
+        else:
+            end_m = start_m + COURSE_MINUTES.get(course or "", 60)
+        end_m = min(end_m, 24 * 60)
+        seats = grouped[(store_id, d)]
+        for i in range(start_m // 15, -(-end_m // 15)):
+            seats[i] += count
+
+    StoreOccupancy.objects.bulk_create(
+        [StoreOccupancy(store_id=s, date=d, seats=seats) for (s, d), seats in grouped.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0033_storereservationrule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日付')),
+                ('seats', models.JSONField(default=list, verbose_name='15分枠ごとの使用席数')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='commons.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': '店舗使用席数',
+                'verbose_name_plural': '店舗使用席数',
+                'db_table': 'store_occupancy',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='storeoccupancy',
+            constraint=models.UniqueConstraint(fields=('store', 'date'), name='uniq_store_occupancy'),
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0034_storeoccupancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storeoccupancy',
+            name='version',
+            field=models.PositiveIntegerField(default=0, verbose_name='バージョン'),
+        ),
+    ]
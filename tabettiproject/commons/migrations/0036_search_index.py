@@ -0,0 +1,59 @@
+from django.db import migrations
+
+STORE_TABLE = "store_search_fts"
+REVIEW_TABLE = "review_search_fts"
+
+
+def create_search_index(apps, schema_editor):
+    """
+    店舗・口コミの全文検索索引（FTS5 trigram）を作り、既存の行を入れる（SQLite のみ）
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    Store = apps.get_model("commons", "Store")
+    Review = apps.get_model("commons", "Review")
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {STORE_TABLE} "
+            "USING fts5(store_name, genre, address, scene_name, tokenize='trigram')"
+        )
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {REVIEW_TABLE} "
+            "USING fts5(review_text, tokenize='trigram')"
+        )
+        cursor.executemany(
+            f"INSERT INTO {STORE_TABLE}(rowid, store_name, genre, address, scene_name) VALUES (%s, %s, %s, %s, %s)",
+            [
+                [pk, name or "", genre or "", address or "", scene or ""]
+                for pk, name, genre, address, scene in Store.objects.order_by().values_list(
+                    "pk", "store_name", "genre", "address", "scene__scene_name"
+                ).iterator()
+            ],
+        )
+        cursor.executemany(
+            f"INSERT INTO {REVIEW_TABLE}(rowid, review_text) VALUES (%s, %s)",
+            [
+                [pk, text or ""]
+                for pk, text in Review.objects.order_by().values_list("pk", "review_text").iterator()
+            ],
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {STORE_TABLE}")
+        cursor.execute(f"DROP TABLE IF EXISTS {REVIEW_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0035_storeoccupancy_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+RTREE_TABLE = "store_geo_rtree"
+
+
+def create_geo_index(apps, schema_editor):
+    """
+    店舗の位置索引（R*Tree）を作り、座標のある店舗を入れる（SQLite のみ）
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    Store = apps.get_model("commons", "Store")
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} "
+            "USING rtree(id, min_lat, max_lat, min_lng, max_lng)"
+        )
+        cursor.executemany(
+            f"INSERT INTO {RTREE_TABLE}(id, min_lat, max_lat, min_lng, max_lng) VALUES (%s, %s, %s, %s, %s)",
+            [
+                [pk, lat, lat, lng, lng]
+                for pk, lat, lng in Store.objects.order_by().values_list("pk", "latitude", "longitude").iterator()
+                if lat is not None and lng is not None and -90 <= lat <= 90 and -180 <= lng <= 180
+            ],
+        )
+
+
+def drop_geo_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {RTREE_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0036_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_geo_index, drop_geo_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0 on 2026-10-18 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0037_store_geo_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='元画像')),
+                ('content_hash', models.CharField(db_index=True, max_length=64, verbose_name='内容のハッシュ')),
+                ('width', models.PositiveIntegerField(default=0, verbose_name='元画像の幅')),
+                ('height', models.PositiveIntegerField(default=0, verbose_name='元画像の高さ')),
+                ('variants', models.JSONField(default=dict, verbose_name='派生画像')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+            ],
+            options={
+                'verbose_name': '派生画像',
+                'verbose_name_plural': '派生画像',
+                'db_table': 'image_derivatives',
+            },
+        ),
+    ]
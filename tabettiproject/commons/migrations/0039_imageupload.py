@@ -0,0 +1,43 @@
+# Generated by Django 4.0 on 2026-10-18 01:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0038_imagederivative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('review_photo', '口コミ写真'), ('store_image', '店舗写真')], max_length=20, verbose_name='種類')),
+                ('state', models.CharField(choices=[('pending', '処理待ち'), ('processing', '処理中'), ('done', '完了'), ('failed', '失敗')], default='pending', max_length=20, verbose_name='処理状態')),
+                ('staged_name', models.CharField(max_length=255, verbose_name='ステージングのファイル名')),
+                ('original_name', models.CharField(blank=True, default='', max_length=255, verbose_name='元のファイル名')),
+                ('error', models.TextField(blank=True, default='', verbose_name='エラー内容')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='処理回数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='受付日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('image_status', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='commons.imagestatus', verbose_name='画像ステータス')),
+                ('review', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='commons.review', verbose_name='口コミ')),
+                ('review_photo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='commons.reviewphoto', verbose_name='作成した口コミ写真')),
+                ('store', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='commons.store', verbose_name='店舗')),
+                ('store_image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='commons.storeimage', verbose_name='作成した店舗写真')),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='commons.account', verbose_name='投稿者')),
+            ],
+            options={
+                'verbose_name': '写真アップロード',
+                'verbose_name_plural': '写真アップロード',
+                'db_table': 'image_uploads',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='imageupload',
+            index=models.Index(fields=['state', 'id'], name='idx_image_upload_state'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.0 on 2026-10-18 01:56
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_profile_counters(apps, schema_editor):
+    """
+    既存の口コミ・写真・フォローからカウンタを作る
+    """
+    CustomerAccount = apps.get_model("commons", "CustomerAccount")
+    Review = apps.get_model("commons", "Review")
+    ReviewPhoto = apps.get_model("commons", "ReviewPhoto")
+    Follow = apps.get_model("commons", "Follow")
+
+    following = dict(
+        Follow.objects.values("follower_id").annotate(cnt=Count("id")).values_list("follower_id", "cnt")
+    )
+    photos = dict(
+        ReviewPhoto.objects.values("review__reviewer_id").annotate(cnt=Count("id"))
+        .values_list("review__reviewer_id", "cnt")
+    )
+    stores = dict(
+        Review.objects.values("reviewer_id").annotate(cnt=Count("store_id", distinct=True))
+        .values_list("reviewer_id", "cnt")
+    )
+
+    customers = list(CustomerAccount.objects.only("pk"))
+    for customer in customers:
+        customer.following_count = following.get(customer.pk, 0)
+        customer.photo_count = photos.get(customer.pk, 0)
+        customer.visited_store_count = stores.get(customer.pk, 0)
+    CustomerAccount.objects.bulk_update(
+        customers, ["following_count", "photo_count", "visited_store_count"], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0039_imageupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customeraccount',
+            name='following_count',
+            field=models.IntegerField(default=0, verbose_name='フォロー数'),
+        ),
+        migrations.AddField(
+            model_name='customeraccount',
+            name='photo_count',
+            field=models.IntegerField(default=0, verbose_name='投稿写真数'),
+        ),
+        migrations.AddField(
+            model_name='customeraccount',
+            name='visited_store_count',
+            field=models.IntegerField(default=0, verbose_name='口コミした店舗数'),
+        ),
+        migrations.RunPython(backfill_profile_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0 on 2026-10-18 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0040_customeraccount_profile_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='review',
+            name='idx_review_store_posted',
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['store', '-posted_at', '-id'], name='idx_review_store_posted'),
+        ),
+    ]
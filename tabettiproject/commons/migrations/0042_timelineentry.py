@@ -0,0 +1,37 @@
+# Generated by Django 4.0 on 2026-10-18 02:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0041_review_store_posted_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author_id', models.BigIntegerField(verbose_name='投稿者ID')),
+                ('posted_at', models.DateTimeField(verbose_name='投稿日時')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='commons.customeraccount', verbose_name='タイムラインの持ち主')),
+                ('review', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='commons.review', verbose_name='口コミ')),
+            ],
+            options={
+                'verbose_name': 'タイムライン',
+                'verbose_name_plural': 'タイムライン',
+                'db_table': 'timeline_entries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['owner', '-posted_at', '-review'], name='idx_timeline_owner_posted'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('owner', 'review'), name='uniq_timeline_owner_review'),
+        ),
+    ]
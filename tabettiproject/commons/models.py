@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from datetime import time
+from django.utils import timezone
 
 
 # ----------------
@@ -172,6 +173,13 @@ class CustomerAccount(Account):
     review_count = models.IntegerField(verbose_name="口コミ数", default=0)
     total_likes = models.IntegerField(verbose_name="総いいね数", default=0)
     follower_count = models.IntegerField(verbose_name="フォロワー数", default=0)
+    # プロフィールの見出し用のカウンタ（commons.reviewer_stats で維持）
+    following_count = models.IntegerField(verbose_name="フォロー数", default=0)
+    photo_count = models.IntegerField(verbose_name="投稿写真数", default=0)
+    visited_store_count = models.IntegerField(verbose_name="口コミした店舗数", default=0)
+    # 信頼度の一貫性スコア（標準偏差）用のカウンタ
+    score_sum = models.IntegerField(verbose_name="点数合計", default=0)
+    score_sq_sum = models.IntegerField(verbose_name="点数二乗和", default=0)
     standard_score = models.IntegerField(verbose_name="標準点", default=0)
     trust_score = models.FloatField(verbose_name="信頼度スコア", default=50.0)
     inquiry_log = models.TextField(verbose_name="問い合わせ内容", blank=True, default="")
@@ -201,48 +209,18 @@ class CustomerAccount(Account):
     def calculate_trust_score(self):
         """
         ユーザーの信頼度スコアを計算 (0-100点)
-        より実績による差が顕著に出るように調整
+        口コミを読み直さず、カウンタ列（commons.trust で差分更新）から計算する
         """
-        from datetime import datetime
-        from django.db.models import Avg, StdDev
-        
-        score = 0.0
-        
-        # 1. アカウント年齢スコア (0-20点) - 2年で満点
-        if self.date_joined:
-            account_age_days = (datetime.now(self.date_joined.tzinfo) - self.date_joined).days
-            age_score = min(20.0, (account_age_days / 730.0) * 20.0)
-            score += age_score
-        
-        # 2. レビュー数スコア (0-20点) - 100件で満点
-        review_score = min(20.0, (self.review_count / 100.0) * 20.0)
-        score += review_score
-        
-        # 3. レビューの質スコア (0-20点) - 平均5いいね以上で満点（基準を下げて活性化）
-        if self.review_count > 0:
-            avg_likes = self.total_likes / self.review_count
-            quality_score = min(20.0, (avg_likes / 5.0) * 20.0)
-            score += quality_score
-        
-        # 4. レビューの一貫性スコア (0-20点)
-        reviews = self.review_set.all()
-        if reviews.count() >= 3:
-            stats = reviews.aggregate(std_dev=StdDev('score'))
-            std_dev = stats['std_dev'] or 0
-            consistency_score = max(0.0, 20.0 - (std_dev / 1.5) * 20.0)
-            score += consistency_score
-        elif reviews.count() > 0:
-            score += 5.0 # 未実績時のベースを下げて差を出す
-
-        # 5. フォロワー数スコア (0-20点) - 50人で満点
-        follower_score = min(20.0, (self.follower_count / 50.0) * 20.0)
-        score += follower_score
-        
-        # 実績が極端に少ないユーザーは低く抑えるための係数
-        if self.review_count < 3:
-            score *= 0.5
-
-        return round(score, 2)
+        from commons.trust import compute_trust_score
+
+        return compute_trust_score(
+            self.date_joined,
+            self.review_count,
+            self.total_likes,
+            self.score_sum,
+            self.score_sq_sum,
+            self.follower_count,
+        )
 
     def update_trust_score(self):
         """信頼度スコアを計算して保存"""
@@ -304,6 +282,10 @@ class Store(models.Model):
 
     class Meta:
         db_table = "stores"
+        indexes = [
+            # 検索：利用シーン + 人数（席数）での絞り込み
+            models.Index(fields=["scene", "seats"], name="idx_store_scene_seats"),
+        ]
         verbose_name = "店舗基本情報"
         verbose_name_plural = "店舗基本情報"
 
@@ -312,38 +294,17 @@ class Store(models.Model):
 
     def get_weighted_rating_context(self):
         """
-        レビュアーの信頼度(trust_score)を加重値として店舗評価を計算する
+        レビュアーの信頼度(trust_score)を加重値として店舗評価を返す
+        集計済みの StoreRatingSummary を読むだけ（無ければその店舗分だけ再集計）
         """
-        from django.db.models import Sum, F, Avg, Count, FloatField, ExpressionWrapper
-        # 劇的な影響力強化 (累乗による非線形重みづけ):
-        # 重み W = (信頼度/10) * (1 + いいね数/5)^3 * (1 + フォロワー数/10)
-        # Djangoの型エラーを避けるため ExpressionWrapper を使用
-        weight_expr = ExpressionWrapper(
-            (F("reviewer__trust_score") / 10.0) * 
-            ((1.0 + F("like_count") / 5.0) * (1.0 + F("like_count") / 5.0) * (1.0 + F("like_count") / 5.0)) * 
-            (1.0 + F("reviewer__follower_count") / 10.0),
-            output_field=FloatField()
-        )
-        
-        agg = self.review_set.aggregate(
-            weighted_sum=Sum(ExpressionWrapper(F("score") * weight_expr, output_field=FloatField())),
-            weight_total=Sum(weight_expr),
-            avg=Avg("score"),
-            cnt=Count("id"),
-        )
-        # 以下略
-
-        # 加重平均を計算（重み合計が0の場合は単純平均、それもなければ0）
-        if agg["weight_total"]:
-            avg_rating = float(agg["weighted_sum"]) / float(agg["weight_total"])
-        else:
-            avg_rating = float(agg["avg"] or 0.0)
-
-        # 5.0を超えないようにキャップ
-        if avg_rating > 5.0:
-            avg_rating = 5.0
-
-        review_count = int(agg["cnt"] or 0)
+        summary = StoreRatingSummary.objects.filter(store_id=self.pk).first()
+        if summary is None:
+            from commons.ratings import rebuild_store_ratings
+            rebuild_store_ratings(store_ids=[self.pk])
+            summary = StoreRatingSummary.objects.filter(store_id=self.pk).first()
+
+        avg_rating = summary.display_rating if summary else 0.0
+        review_count = summary.review_count if summary else 0
         return {
             "avg_rating": avg_rating,
             "review_count": review_count,
@@ -375,6 +336,45 @@ class Store(models.Model):
         return (["full"] * full) + (["half"] * half) + (["empty"] * empty)
 
 
+class StoreRatingSummary(models.Model):
+    """
+    店舗ごとの評価集計（口コミ・フォロー・いいねのシグナルで差分更新する）
+    重み W = (信頼度/10) * (1 + いいね数/5)^3 * (1 + フォロワー数/10)
+    """
+    store = models.OneToOneField(
+        "Store",
+        on_delete=models.CASCADE,
+        related_name="rating_summary",
+        verbose_name="店舗",
+    )
+    weighted_sum = models.FloatField(verbose_name="加重スコア合計", default=0.0)
+    weight_total = models.FloatField(verbose_name="重み合計", default=0.0)
+    avg_score = models.FloatField(verbose_name="単純平均", default=0.0)
+    review_count = models.IntegerField(verbose_name="口コミ数", default=0, db_index=True)
+    total_score = models.IntegerField(verbose_name="合計スコア", default=0, db_index=True)
+    # 並び替え用（重み合計が0なら NULL）
+    weighted_avg_rating = models.FloatField(null=True, blank=True, db_index=True, verbose_name="加重平均評価")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    class Meta:
+        db_table = "store_rating_summaries"
+        verbose_name = "店舗評価集計"
+        verbose_name_plural = "店舗評価集計"
+
+    def __str__(self):
+        return f"store={self.store_id} rating={self.weighted_avg_rating} ({self.review_count})"
+
+    @property
+    def display_rating(self) -> float:
+        """
+        表示用の評価（加重平均、重みが無ければ単純平均、5.0でキャップ）
+        """
+        rating = self.weighted_avg_rating
+        if rating is None:
+            rating = self.avg_score or 0.0
+        return max(0.0, min(5.0, float(rating)))
+
+
 class StoreAccount(Account):
     store = models.ForeignKey("Store", on_delete=models.CASCADE, verbose_name="店舗情報")
     admin_email = models.EmailField(max_length=255, verbose_name="管理者メールアドレス")
@@ -410,6 +410,8 @@ class Review(models.Model):
     score = models.IntegerField(verbose_name="点数")
     review_text = models.TextField(verbose_name="レビュー")
     like_count = models.IntegerField(verbose_name="いいね数", default=0)
+    # 店舗評価の加重平均に使う重み（commons.ratings で維持）
+    weight = models.FloatField(verbose_name="評価重み", default=0.0)
     liked_users = models.ManyToManyField(
         "Account", 
         related_name="liked_reviews", 
@@ -420,6 +422,12 @@ class Review(models.Model):
     
     class Meta:
         db_table = "reviews"
+        indexes = [
+            # 店舗の口コミ一覧（新着順、同時刻は id 順。キーセットのページ送り用）
+            models.Index(fields=["store", "-posted_at", "-id"], name="idx_review_store_posted"),
+            # レビュアーの口コミ一覧・最新口コミ（新着順）
+            models.Index(fields=["reviewer", "-posted_at"], name="idx_review_reviewer_posted"),
+        ]
         verbose_name = "口コミ"
         verbose_name_plural = "口コミ"
 
@@ -468,6 +476,10 @@ class Follow(models.Model):
 
     class Meta:
         db_table = "follows"
+        indexes = [
+            # フォロワー数・フォロワー一覧（followee から follower を引く）
+            models.Index(fields=["followee", "follower"], name="idx_follow_followee_follower"),
+        ]
         verbose_name = "フォロー"
         verbose_name_plural = "フォロー"
         unique_together = (("follower", "followee"),)
@@ -476,6 +488,35 @@ class Follow(models.Model):
         return f"{self.follower.nickname} follows {self.followee.nickname}"
 
 
+class TimelineEntry(models.Model):
+    """
+    フォロー中のユーザーの口コミのタイムライン（書き込み時に配る分、commons.timeline で維持）
+    フォロワーの多いユーザーの口コミはここに配らず、読むときに口コミから直接引く
+    """
+    owner = models.ForeignKey(
+        "CustomerAccount", on_delete=models.CASCADE, related_name="timeline_entries", verbose_name="タイムラインの持ち主",
+    )
+    review = models.ForeignKey("Review", on_delete=models.CASCADE, verbose_name="口コミ")
+    # 並び替え・フォロー解除時の削除に使う（口コミを結合しないよう複製して持つ）
+    author_id = models.BigIntegerField(verbose_name="投稿者ID")
+    posted_at = models.DateTimeField(verbose_name="投稿日時")
+
+    class Meta:
+        db_table = "timeline_entries"
+        indexes = [
+            # タイムラインの新着順（キーセットのページ送り用）
+            models.Index(fields=["owner", "-posted_at", "-review"], name="idx_timeline_owner_posted"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "review"], name="uniq_timeline_owner_review"),
+        ]
+        verbose_name = "タイムライン"
+        verbose_name_plural = "タイムライン"
+
+    def __str__(self):
+        return f"timeline owner={self.owner_id} review={self.review_id}"
+
+
 # ----------------
 # 予約者・予約
 # ----------------
@@ -516,6 +557,12 @@ class Reservation(models.Model):
 
     class Meta:
         db_table = "reservations"
+        indexes = [
+            # 店舗の日別・月別予約（予約台帳・空席計算）
+            models.Index(fields=["store", "visit_date"], name="idx_resv_store_date"),
+            # 「保存済み」判定・行った判定（予約者 × 店舗 × ステータス）
+            models.Index(fields=["booking_user", "store", "booking_status"], name="idx_resv_user_store_status"),
+        ]
         verbose_name = "予約"
         verbose_name_plural = "予約"
 
@@ -544,6 +591,55 @@ class StoreOnlineReservation(models.Model):
         return f"{self.store.store_name} - {self.date}"
 
 
+class StoreReservationRule(models.Model):
+    """
+    ネット予約の既定ルール（曜日ごとの受付可否と席数）
+    StoreOnlineReservation はこのルールと異なる日だけを持つ
+    """
+    # bit0=月曜 … bit6=日曜
+    ALL_WEEKDAYS = 0b1111111
+
+    store = models.OneToOneField(
+        "Store", on_delete=models.CASCADE, related_name="reservation_rule", verbose_name="店舗"
+    )
+    open_weekdays = models.PositiveSmallIntegerField(verbose_name="受付曜日", default=ALL_WEEKDAYS)
+    available_seats = models.IntegerField(
+        verbose_name="予約可能席数", default=0, help_text="0 の場合は店舗の席数を使う"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    class Meta:
+        db_table = "store_reservation_rules"
+        verbose_name = "店舗ネット予約ルール"
+        verbose_name_plural = "店舗ネット予約ルール"
+
+    def __str__(self):
+        return f"{self.store.store_name} のネット予約ルール"
+
+
+class StoreOccupancy(models.Model):
+    """
+    店舗 × 日付の使用席数タイムライン（15分枠ごとの席数。commons.occupancy が予約の保存時に更新）
+    キャンセル・保存済みの予約は含めない
+    """
+    store = models.ForeignKey("Store", on_delete=models.CASCADE, verbose_name="店舗")
+    date = models.DateField(verbose_name="日付")
+    seats = models.JSONField(default=list, verbose_name="15分枠ごとの使用席数")
+    # 楽観ロック用（更新のたびに +1。SQLite では行ロックが効かないため）
+    version = models.PositiveIntegerField(default=0, verbose_name="バージョン")
+
+    class Meta:
+        db_table = "store_occupancy"
+        verbose_name = "店舗使用席数"
+        verbose_name_plural = "店舗使用席数"
+        constraints = [
+            models.UniqueConstraint(fields=["store", "date"], name="uniq_store_occupancy")
+        ]
+
+    def __str__(self):
+        return f"{self.store.store_name} - {self.date}"
+
+
 # ----------------
 # 追加モデル：店舗画像・メニュー・申請・ログ・パスワード・仮申請
 # ----------------
@@ -760,13 +856,130 @@ class StoreAccessLog(models.Model):
         related_name="access_logs",
         verbose_name="店舗",
     )
-    accessed_at = models.DateTimeField(auto_now_add=True, verbose_name="アクセス日時")
+    # バッファ経由でまとめて書くので、記録時刻を渡せるよう auto_now_add ではなく default
+    accessed_at = models.DateTimeField(default=timezone.now, verbose_name="アクセス日時")
 
     class Meta:
         db_table = "store_access_logs"
+        indexes = [
+            # 店舗ごとの期間集計・保持期間での削除
+            models.Index(fields=["store", "accessed_at"], name="idx_access_store_at"),
+            models.Index(fields=["accessed_at"], name="idx_access_at"),
+        ]
         verbose_name = "店舗アクセスログ"
         verbose_name_plural = "店舗アクセスログ"
         ordering = ["-accessed_at"]
 
     def __str__(self):
-        return f"{self.store.store_name} - {self.accessed_at}"
\ No newline at end of file
+        return f"{self.store.store_name} - {self.accessed_at}"
+
+
+class StoreAccessDaily(models.Model):
+    """
+    店舗アクセス数の日次集計（commons.access_log が生ログと一緒に加算する）
+    """
+    store = models.ForeignKey(
+        "Store",
+        on_delete=models.CASCADE,
+        related_name="access_daily",
+        verbose_name="店舗",
+    )
+    date = models.DateField(verbose_name="日付")
+    count = models.IntegerField(default=0, verbose_name="アクセス数")
+
+    class Meta:
+        db_table = "store_access_daily"
+        verbose_name = "店舗アクセス日次集計"
+        verbose_name_plural = "店舗アクセス日次集計"
+        constraints = [
+            models.UniqueConstraint(fields=["store", "date"], name="uniq_store_access_daily"),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} {self.date}: {self.count}"
+
+
+class ImageDerivative(models.Model):
+    """
+    アップロード画像の縮小版（thumb / card / full × WebP / JPEG。commons.images が作る）
+    ファイルは元画像の内容のハッシュで決まるパス（derived/xx/<SHA-256>/...）に置く
+    """
+    source = models.CharField(max_length=255, unique=True, verbose_name="元画像")
+    content_hash = models.CharField(max_length=64, db_index=True, verbose_name="内容のハッシュ")
+    width = models.PositiveIntegerField(default=0, verbose_name="元画像の幅")
+    height = models.PositiveIntegerField(default=0, verbose_name="元画像の高さ")
+    # {サイズ名: {"width", "height", "webp": パス, "jpg": パス}}
+    variants = models.JSONField(default=dict, verbose_name="派生画像")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
+
+    class Meta:
+        db_table = "image_derivatives"
+        verbose_name = "派生画像"
+        verbose_name_plural = "派生画像"
+
+    def __str__(self):
+        return self.source
+
+
+class ImageUpload(models.Model):
+    """
+    写真アップロードの処理待ち行列（commons.uploads が検証・EXIF 除去・再エンコードして
+    ReviewPhoto / StoreImage を作る）
+    受け付けたファイルは公開されないステージング領域に置き、処理が終わったら消す
+    """
+    KIND_REVIEW_PHOTO = "review_photo"
+    KIND_STORE_IMAGE = "store_image"
+    KIND_CHOICES = [
+        (KIND_REVIEW_PHOTO, "口コミ写真"),
+        (KIND_STORE_IMAGE, "店舗写真"),
+    ]
+
+    STATE_PENDING = "pending"
+    STATE_PROCESSING = "processing"
+    STATE_DONE = "done"
+    STATE_FAILED = "failed"
+    STATE_CHOICES = [
+        (STATE_PENDING, "処理待ち"),
+        (STATE_PROCESSING, "処理中"),
+        (STATE_DONE, "完了"),
+        (STATE_FAILED, "失敗"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="種類")
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=STATE_PENDING, verbose_name="処理状態")
+    staged_name = models.CharField(max_length=255, verbose_name="ステージングのファイル名")
+    original_name = models.CharField(max_length=255, blank=True, default="", verbose_name="元のファイル名")
+    error = models.TextField(blank=True, default="", verbose_name="エラー内容")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="処理回数")
+
+    uploaded_by = models.ForeignKey(
+        "Account", on_delete=models.SET_NULL, null=True, blank=True, verbose_name="投稿者",
+    )
+    review = models.ForeignKey("Review", on_delete=models.CASCADE, null=True, blank=True, verbose_name="口コミ")
+    store = models.ForeignKey("Store", on_delete=models.CASCADE, null=True, blank=True, verbose_name="店舗")
+    image_status = models.ForeignKey(
+        "ImageStatus", on_delete=models.PROTECT, null=True, blank=True, verbose_name="画像ステータス",
+    )
+
+    # 処理結果
+    review_photo = models.ForeignKey(
+        "ReviewPhoto", on_delete=models.SET_NULL, null=True, blank=True, verbose_name="作成した口コミ写真",
+    )
+    store_image = models.ForeignKey(
+        "StoreImage", on_delete=models.SET_NULL, null=True, blank=True, verbose_name="作成した店舗写真",
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="受付日時")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    class Meta:
+        db_table = "image_uploads"
+        indexes = [
+            # 処理待ちの取り出し
+            models.Index(fields=["state", "id"], name="idx_image_upload_state"),
+        ]
+        verbose_name = "写真アップロード"
+        verbose_name_plural = "写真アップロード"
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.original_name} ({self.get_state_display()})"
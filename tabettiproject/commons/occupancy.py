@@ -0,0 +1,290 @@
+# commons/occupancy.py
+"""
+店舗 × 日付の使用席数タイムライン（StoreOccupancy）
+
+1日を15分枠 96 個に分け、枠ごとの使用席数を持つ。予約の作成・変更・キャンセル・削除時に
+シグナルからその予約の寄与（来店〜終了の枠に人数）だけを足し引きする。
+キャンセル・保存済み（ブックマーク用の予約）は席を使わないので数えない。
+
+空席判定は「使う枠の最大値 + 人数 <= 席数」を見るだけで、予約の集計はしない。
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, time
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from commons.models import Reservation, StoreOccupancy
+
+BUCKET_MINUTES = 15
+BUCKETS = 24 * 60 // BUCKET_MINUTES
+
+# 差分計算に使う予約の列（status は ReservationStatus.status）
+TRACKED_FIELDS = (
+    "store_id", "visit_date", "visit_time", "start_time", "end_time",
+    "visit_count", "course", "booking_status__status",
+)
+
+# 席を使わない予約ステータス
+SAVED_STATUS = "保存済み"
+CANCEL_TOKENS = ("キャンセル", "cancel")
+
+COURSE_MINUTES = {
+    "30分コース": 30,
+    "1時間コース": 60,
+    "1時間30分コース": 90,
+    "2時間コース": 120,
+    "2時間30分コース": 150,
+}
+DEFAULT_COURSE_MINUTES = 60
+
+
+def reservation_row(instance: Reservation) -> dict:
+    """
+    メモリ上の予約から TRACKED_FIELDS と同じ形の dict を作る
+    """
+    status = instance.booking_status.status if instance.booking_status_id else ""
+    return {
+        "store_id": instance.store_id,
+        "visit_date": instance.visit_date,
+        "visit_time": instance.visit_time,
+        "start_time": instance.start_time,
+        "end_time": instance.end_time,
+        "visit_count": instance.visit_count,
+        "course": instance.course,
+        "booking_status__status": status,
+    }
+
+
+def is_counted_status(status: str | None) -> bool:
+    status = (status or "").strip()
+    if status == SAVED_STATUS:
+        return False
+    lowered = status.lower()
+    return not any(token in lowered for token in CANCEL_TOKENS)
+
+
+def _minutes(t: time) -> int:
+    return t.hour * 60 + t.minute
+
+
+def span_minutes(row: dict) -> tuple[int, int] | None:
+    """
+    予約の (開始分, 終了分)。終了時刻が無ければコースから計算。日跨ぎ分は当日で切る
+    """
+    start = row.get("start_time") or row.get("visit_time")
+    if not isinstance(start, time):
+        return None
+    start_m = _minutes(start)
+
+    end = row.get("end_time")
+    if isinstance(end, time) and _minutes(end) > start_m:
+        end_m = _minutes(end)
+    else:
+        end_m = start_m + COURSE_MINUTES.get(row.get("course") or "", DEFAULT_COURSE_MINUTES)
+    return start_m, min(end_m, 24 * 60)
+
+
+def bucket_range(start_m: int, end_m: int) -> range:
+    """
+    開始〜終了（分）が掛かる15分枠
+    """
+    return range(start_m // BUCKET_MINUTES, -(-end_m // BUCKET_MINUTES))
+
+
+def contribution(row: dict | None):
+    """
+    予約1件の寄与 (store_id, 日付, 枠の range, 人数)。席を使わない予約は None
+    """
+    if not row or not row.get("store_id") or not row.get("visit_date"):
+        return None
+    if not is_counted_status(row.get("booking_status__status")):
+        return None
+    count = int(row.get("visit_count") or 0)
+    span = span_minutes(row)
+    if count <= 0 or span is None or span[1] <= span[0]:
+        return None
+    return row["store_id"], row["visit_date"], bucket_range(*span), count
+
+
+def _empty() -> list[int]:
+    return [0] * BUCKETS
+
+
+def _normalized(seats) -> list[int]:
+    seats = list(seats or [])
+    if len(seats) < BUCKETS:
+        seats += [0] * (BUCKETS - len(seats))
+    return seats[:BUCKETS]
+
+
+class OccupancyConflict(Exception):
+    """
+    読んでから書くまでの間に別の更新が入った（呼び出し側でやり直す）
+    """
+
+
+def apply(changes) -> None:
+    """
+    changes: (store_id, 日付, 枠の range, 人数の増減) の並び
+    """
+    grouped: dict[tuple[int, date], list[int]] = defaultdict(_empty)
+    for store_id, d, buckets, delta in changes:
+        seats = grouped[(store_id, d)]
+        for i in buckets:
+            seats[i] += delta
+
+    with transaction.atomic():
+        for (store_id, d), delta_seats in grouped.items():
+            if not any(delta_seats):
+                continue
+            row = StoreOccupancy.objects.select_for_update().filter(store_id=store_id, date=d).first()
+            if row is None:
+                row = StoreOccupancy(store_id=store_id, date=d, seats=_empty())
+            seats = [max(0, a + b) for a, b in zip(_normalized(row.seats), delta_seats)]
+            if not any(seats):
+                if row.pk:
+                    row.delete()
+                continue
+            row.seats = seats
+            row.version += 1
+            row.save()
+
+
+def claim(
+    store_id: int, target_date: date, buckets: range, count: int, capacity: int,
+    release: tuple[range, int] | None = None,
+) -> bool:
+    """
+    空きがあれば count 席を確保する（capacity が 0 なら無制限）。空きが無ければ False
+    release=(枠, 人数) は同じ日の変更前の席で、先に返してから空きを見る（予約の変更用）
+    行は select_for_update で読み、version が読んだときのままの場合だけ書く。
+    別の更新が先に入っていたら OccupancyConflict（トランザクションごとやり直す）
+    """
+    row = (
+        StoreOccupancy.objects.select_for_update()
+        .filter(store_id=store_id, date=target_date)
+        .values_list("pk", "seats", "version")
+        .first()
+    )
+    seats = _normalized(row[1] if row else None)
+    if release is not None:
+        for i in release[0]:
+            seats[i] = max(0, seats[i] - release[1])
+    if capacity and max((seats[i] for i in buckets), default=0) + count > capacity:
+        return False
+    for i in buckets:
+        seats[i] += count
+
+    if row is None:
+        try:
+            with transaction.atomic():
+                StoreOccupancy.objects.create(store_id=store_id, date=target_date, seats=seats, version=1)
+        except IntegrityError:
+            raise OccupancyConflict()
+        return True
+
+    updated = StoreOccupancy.objects.filter(pk=row[0], version=row[2]).update(
+        seats=seats, version=F("version") + 1
+    )
+    if not updated:
+        raise OccupancyConflict()
+    return True
+
+
+def reservation_saved(instance: Reservation, previous: dict | None) -> None:
+    """
+    予約の作成・変更後に呼ぶ（previous は変更前の TRACKED_FIELDS、新規なら None）
+    commons.booking で席を確保・付け替え済みの保存（_occupancy_claimed）は足し引きしない（その1回だけ）
+    """
+    if instance.__dict__.pop("_occupancy_claimed", False):
+        return
+    changes = []
+    before = contribution(previous)
+    after = contribution(reservation_row(instance))
+    if before == after:
+        return
+    if before is not None:
+        store_id, d, buckets, count = before
+        changes.append((store_id, d, buckets, -count))
+    if after is not None:
+        changes.append(after)
+    apply(changes)
+
+
+def reservation_deleted(row: dict) -> None:
+    before = contribution(row)
+    if before is not None:
+        store_id, d, buckets, count = before
+        apply([(store_id, d, buckets, -count)])
+
+
+def timeline(store_id: int, target_date: date, exclude_reservation_id: int | None = None) -> list[int]:
+    """
+    その日の15分枠ごとの使用席数（exclude_reservation_id の予約は除く）
+    """
+    seats = _normalized(
+        StoreOccupancy.objects.filter(store_id=store_id, date=target_date)
+        .values_list("seats", flat=True)
+        .first()
+    )
+    if exclude_reservation_id is not None:
+        excluded = contribution(
+            Reservation.objects.filter(pk=exclude_reservation_id).values(*TRACKED_FIELDS).first()
+        )
+        if excluded is not None and excluded[0] == store_id and excluded[1] == target_date:
+            for i in excluded[2]:
+                seats[i] = max(0, seats[i] - excluded[3])
+    return seats
+
+
+def fits(
+    store_id: int,
+    target_date: date,
+    visit_time: time,
+    course_minutes: int,
+    party_size: int,
+    capacity: int,
+    exclude_reservation_id: int | None = None,
+) -> bool:
+    """
+    来店〜終了の全ての枠で「使用席数 + 人数 <= 席数」か（capacity が 0 なら無制限）
+    """
+    if not capacity:
+        return True
+    start_m = _minutes(visit_time)
+    end_m = min(start_m + course_minutes, 24 * 60)
+    seats = timeline(store_id, target_date, exclude_reservation_id)
+    used = max((seats[i] for i in bucket_range(start_m, end_m)), default=0)
+    return used + party_size <= capacity
+
+
+def rebuild(store_ids=None, chunk_size: int = 2000) -> int:
+    """
+    予約から作り直す（store_ids 指定時はその店舗だけ）。戻り値：作成した行数
+    """
+    reservations = Reservation.objects.order_by()
+    occupancy = StoreOccupancy.objects.all()
+    if store_ids is not None:
+        reservations = reservations.filter(store_id__in=store_ids)
+        occupancy = occupancy.filter(store_id__in=store_ids)
+
+    grouped: dict[tuple[int, date], list[int]] = defaultdict(_empty)
+    for row in reservations.values(*TRACKED_FIELDS).iterator(chunk_size=chunk_size):
+        c = contribution(row)
+        if c is None:
+            continue
+        store_id, d, buckets, count = c
+        seats = grouped[(store_id, d)]
+        for i in buckets:
+            seats[i] += count
+
+    with transaction.atomic():
+        occupancy.delete()
+        StoreOccupancy.objects.bulk_create(
+            [StoreOccupancy(store_id=s, date=d, seats=seats) for (s, d), seats in grouped.items()],
+            batch_size=500,
+        )
+    return len(grouped)
@@ -0,0 +1,139 @@
+# commons/page_cache.py
+"""
+ページの共通部分（閲覧者によらない部分）のキャッシュ
+
+キーにバージョン番号を含め、口コミ・店舗などが変わったらシグナルで
+バージョンを上げて無効化する（古いキーは TTL で自然に消える）。
+テンプレート側の {% cache %} にも同じバージョンを渡して使う。
+バージョンは settings.CACHES の共有キャッシュに置くので、どのプロセスで上げても全プロセスに効く。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# 共通部分を保持する秒数（settings で上書き可）
+PAGE_CACHE_TTL = getattr(settings, "PAGE_CACHE_TTL", 300)
+
+# 検索結果の ID 列を保持する秒数（settings で上書き可）
+SEARCH_CACHE_TTL = getattr(settings, "SEARCH_CACHE_TTL", 120)
+
+# 1つの検索条件でキャッシュする ID の上限（先頭から。settings の SEARCH_CACHE_MAX_IDS で上書き可）
+SEARCH_CACHE_MAX_IDS = 500
+
+CUSTOMER_TOP = "customer_top"
+STORE_SEARCH = "store_search"
+
+
+def _version_key(name: str) -> str:
+    return f"page_cache_version:{name}"
+
+
+def get_version(name: str) -> int:
+    """
+    現在のバージョン。キャッシュから消えていた場合は時刻から作り直す
+    （1 に戻すと、以前の 1 のデータを誤って使う恐れがあるため）
+    """
+    version = cache.get(_version_key(name))
+    if version is None:
+        version = int(time.time() * 1000)
+        cache.add(_version_key(name), version, None)
+        version = cache.get(_version_key(name), version)
+    return version
+
+
+def bump(name: str) -> None:
+    """
+    無効化（バージョンを上げる）
+    """
+    try:
+        cache.incr(_version_key(name))
+    except ValueError:
+        # まだ無い
+        get_version(name)
+
+
+def cached(name: str, builder, ttl: int = PAGE_CACHE_TTL, version: int | None = None):
+    """
+    builder() の結果をバージョン付きキーでキャッシュして返す
+    """
+    key = f"page_cache:{name}:{version or get_version(name)}"
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, ttl)
+    return value
+
+
+def signature(params: dict) -> str:
+    """
+    検索条件の正規化キー（空の条件は無視・順不同）
+    """
+    normalized = sorted(
+        (key, str(value).strip())
+        for key, value in params.items()
+        if value is not None and str(value).strip() != ""
+    )
+    raw = json.dumps(normalized, ensure_ascii=False)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+class CachedIds:
+    """
+    キャッシュした先頭の ID 列と総件数から作る、Paginator に渡せる ID 列
+    先頭より後ろを切り出すときだけ fetch(start, stop) で DB から引く
+    """
+
+    def __init__(self, head: list[int], count: int, fetch):
+        self.head = head
+        self.total = count
+        self.fetch = fetch
+
+    def __len__(self) -> int:
+        return self.total
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop, _ = key.indices(self.total)
+        cached = len(self.head)
+        if stop <= cached or cached >= self.total:
+            return self.head[start:stop]
+        return self.head[start:cached] + self.fetch(max(start, cached), stop)
+
+
+def cached_ids(name: str, params: dict, queryset, ttl: int = SEARCH_CACHE_TTL, builder=None, seek=None) -> CachedIds:
+    """
+    検索条件ごとに結果の ID 列（並び順どおり）の先頭 SEARCH_CACHE_MAX_IDS 件と総件数をキャッシュする
+    先頭の範囲のページは ID 列を切り出して主キーで引くだけになり、1回のミスで引く ID も上限までになる。
+    それより後ろのページは都度引く：seek(last_pk) を渡すと「キャッシュした最後の行より後ろ」に
+    並び順のキーで絞ってから数え、無ければ queryset をそのまま OFFSET で切り出す
+    builder を渡すと queryset の代わりに builder() の ID 列を使う（後ろのページも builder() から切り出す）
+    """
+    limit = getattr(settings, "SEARCH_CACHE_MAX_IDS", SEARCH_CACHE_MAX_IDS)
+
+    def build():
+        if builder:
+            ids = builder()
+            return {"ids": ids[:limit], "count": len(ids)}
+        ids = list(queryset.values_list("pk", flat=True)[:limit + 1])
+        if len(ids) <= limit:
+            return {"ids": ids, "count": len(ids)}
+        return {"ids": ids[:limit], "count": queryset.count()}
+
+    value = cached(f"{name}:{signature(params)}", build, ttl, version=get_version(name))
+    head = value["ids"]
+
+    def fetch(start: int, stop: int) -> list[int]:
+        if builder:
+            return builder()[start:stop]
+        if seek and head:
+            offset = len(head)
+            return list(seek(head[-1]).values_list("pk", flat=True)[start - offset:stop - offset])
+        return list(queryset.values_list("pk", flat=True)[start:stop])
+
+    return CachedIds(head, value["count"], fetch)
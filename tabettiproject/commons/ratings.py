@@ -0,0 +1,314 @@
+# commons/ratings.py
+"""
+店舗評価（StoreRatingSummary）の差分更新・再集計
+
+口コミ1件の寄与は (score * weight, weight, 1, score)。
+weight は Review.weight に保存しておき、変化した分だけ店舗集計へ足し引きする。
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+
+from commons.models import CustomerAccount, Review, Store, StoreRatingSummary
+
+# 浮動小数の誤差で「ほぼ0」が残ったときに加重平均を出さないための閾値
+WEIGHT_EPSILON = 1e-9
+
+# レビュアー係数の相対変化がこれ未満なら口コミの重みを付け直さない
+# （ずれは update_trust_scores の一括再計算で解消する。0 なら常に付け直す）
+REVIEW_REWEIGHT_MIN_CHANGE = 0.05
+
+
+def reviewer_factor(trust_score: float, follower_count: int) -> float:
+    """
+    重みのうちレビュアーで決まる部分 (信頼度/10) * (1 + フォロワー数/10)
+    """
+    return (float(trust_score or 0.0) / 10.0) * (1.0 + float(follower_count or 0) / 10.0)
+
+
+def like_factor(like_count: int) -> float:
+    """
+    重みのうち口コミのいいね数で決まる部分 (1 + いいね数/5)^3
+    """
+    base = 1.0 + float(like_count or 0) / 5.0
+    return base * base * base
+
+
+def calc_review_weight(trust_score: float, like_count: int, follower_count: int) -> float:
+    """
+    重み W = (信頼度/10) * (1 + いいね数/5)^3 * (1 + フォロワー数/10)
+    （旧：ExpressionWrapper で毎リクエスト計算していた式と同じ）
+    """
+    return reviewer_factor(trust_score, follower_count) * like_factor(like_count)
+
+
+def _refresh_derived(store_ids) -> None:
+    """
+    合計値から avg_score / weighted_avg_rating を計算し直す
+    （UPDATE は旧値を参照するので合計の更新とは別文で行う）
+    """
+    StoreRatingSummary.objects.filter(store_id__in=store_ids, review_count__lte=0).update(
+        weighted_sum=0.0,
+        weight_total=0.0,
+        review_count=0,
+        total_score=0,
+    )
+    StoreRatingSummary.objects.filter(store_id__in=store_ids).update(
+        avg_score=Case(
+            When(review_count__gt=0, then=Cast("total_score", FloatField()) / F("review_count")),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+        weighted_avg_rating=Case(
+            When(weight_total__gt=WEIGHT_EPSILON, then=F("weighted_sum") / F("weight_total")),
+            default=None,
+            output_field=FloatField(),
+        ),
+    )
+
+
+def apply_store_deltas(deltas: dict[int, list[float]], *, create_missing: bool = True) -> None:
+    """
+    deltas: {store_id: [d_weighted_sum, d_weight_total, d_review_count, d_total_score]}
+    集計行が無い店舗は（create_missing=True なら）その店舗だけ再集計する
+    """
+    if not deltas:
+        return
+
+    missing: list[int] = []
+    with transaction.atomic():
+        for store_id, (d_wsum, d_wt, d_cnt, d_score) in deltas.items():
+            updated = StoreRatingSummary.objects.filter(store_id=store_id).update(
+                weighted_sum=F("weighted_sum") + d_wsum,
+                weight_total=F("weight_total") + d_wt,
+                review_count=F("review_count") + int(d_cnt),
+                total_score=F("total_score") + int(d_score),
+            )
+            if not updated:
+                missing.append(store_id)
+
+        _refresh_derived(list(deltas.keys()))
+
+    # 差分を当てる先が無い → 真値から作る（店舗削除中のカスケードでは作らない）
+    if missing and create_missing:
+        rebuild_store_ratings(store_ids=missing)
+
+
+def review_saved(review: Review, previous: dict | None) -> None:
+    """
+    口コミ保存時：旧い寄与を外し、現在の信頼度で重みを計算して寄与を足す
+    previous: pre_save で退避した {"store_id", "score", "weight"}（新規なら None）
+    """
+    deltas: dict[int, list[float]] = defaultdict(lambda: [0.0, 0.0, 0, 0])
+
+    if previous:
+        prev = deltas[previous["store_id"]]
+        prev[0] -= previous["score"] * previous["weight"]
+        prev[1] -= previous["weight"]
+        prev[2] -= 1
+        prev[3] -= previous["score"]
+
+    reviewer = (
+        CustomerAccount.objects.filter(pk=review.reviewer_id)
+        .values("trust_score", "follower_count")
+        .first()
+    ) or {"trust_score": 0.0, "follower_count": 0}
+    weight = calc_review_weight(reviewer["trust_score"], review.like_count, reviewer["follower_count"])
+
+    cur = deltas[review.store_id]
+    cur[0] += review.score * weight
+    cur[1] += weight
+    cur[2] += 1
+    cur[3] += review.score
+
+    Review.objects.filter(pk=review.pk).update(weight=weight)
+    review.weight = weight
+
+    apply_store_deltas(deltas)
+
+
+def review_deleted(row: dict) -> None:
+    """
+    口コミ削除時：保存済みの重みで寄与を外す（row は pre_delete で退避した値）
+    """
+    score, weight = row["score"], row["weight"] or 0.0
+    apply_store_deltas(
+        {row["store_id"]: [-score * weight, -weight, -1, -score]},
+        create_missing=False,
+    )
+
+
+def needs_reweight(reviewer_id: int, trust_score: float, follower_count: int) -> bool:
+    """
+    口コミの重みを付け直す必要があるか（口コミは1件だけ読む）
+    いちばん古い口コミの重みから前回付け直したときのレビュアー係数を逆算し、
+    新しい係数との相対変化が REVIEW_REWEIGHT_MIN_CHANGE 以上なら True
+    """
+    ref = (
+        Review.objects.filter(reviewer_id=reviewer_id)
+        .order_by("id")
+        .values_list("weight", "like_count")
+        .first()
+    )
+    if ref is None:
+        return False
+
+    old = (ref[0] or 0.0) / like_factor(ref[1])
+    new = reviewer_factor(trust_score, follower_count)
+    if abs(new - old) <= WEIGHT_EPSILON:
+        return False
+
+    min_change = getattr(settings, "REVIEW_REWEIGHT_MIN_CHANGE", REVIEW_REWEIGHT_MIN_CHANGE)
+    if min_change <= 0 or old <= WEIGHT_EPSILON:
+        return True
+    return abs(new - old) / old >= min_change
+
+
+def reweight_reviewer(reviewer_id: int) -> int:
+    """
+    レビュアーの信頼度・フォロワー数が変わったとき、その人の口コミの重みを付け直し
+    依存する店舗集計へ差分を反映する。戻り値: 重みが変わった口コミ数
+    """
+    reviewer = (
+        CustomerAccount.objects.filter(pk=reviewer_id)
+        .values("trust_score", "follower_count")
+        .first()
+    )
+    if reviewer is None:
+        return 0
+
+    rows = Review.objects.filter(reviewer_id=reviewer_id).values_list(
+        "id", "store_id", "score", "like_count", "weight"
+    )
+
+    changed: list[Review] = []
+    deltas: dict[int, list[float]] = defaultdict(lambda: [0.0, 0.0, 0, 0])
+    for rid, store_id, score, like_count, old_weight in rows:
+        new_weight = calc_review_weight(reviewer["trust_score"], like_count, reviewer["follower_count"])
+        diff = new_weight - (old_weight or 0.0)
+        if abs(diff) <= WEIGHT_EPSILON:
+            continue
+        changed.append(Review(id=rid, weight=new_weight))
+        d = deltas[store_id]
+        d[0] += score * diff
+        d[1] += diff
+
+    if not changed:
+        return 0
+
+    with transaction.atomic():
+        Review.objects.bulk_update(changed, ["weight"], batch_size=500)
+        apply_store_deltas(deltas)
+    return len(changed)
+
+
+def display_ratings(store_ids) -> dict[int, float]:
+    """
+    店舗ごとの表示用評価（画面と同じ小数1桁に丸めたもの）
+    """
+    return {
+        summary.store_id: round(summary.display_rating, 1)
+        for summary in StoreRatingSummary.objects.filter(store_id__in=list(store_ids)).only(
+            "store_id", "weighted_avg_rating", "avg_score"
+        )
+    }
+
+
+def reweight_reviews(review_ids) -> int:
+    """
+    指定の口コミだけ重みを付け直して店舗集計へ差分を反映する（いいね数の変化用）
+    戻り値: 重みが変わった口コミ数
+    """
+    rows = Review.objects.filter(pk__in=list(review_ids)).values_list(
+        "id", "store_id", "score", "like_count", "weight", "reviewer__trust_score", "reviewer__follower_count"
+    )
+
+    changed: list[Review] = []
+    deltas: dict[int, list[float]] = defaultdict(lambda: [0.0, 0.0, 0, 0])
+    for rid, store_id, score, like_count, old_weight, trust_score, follower_count in rows:
+        new_weight = calc_review_weight(trust_score, like_count, follower_count)
+        diff = new_weight - (old_weight or 0.0)
+        if abs(diff) <= WEIGHT_EPSILON:
+            continue
+        changed.append(Review(id=rid, weight=new_weight))
+        d = deltas[store_id]
+        d[0] += score * diff
+        d[1] += diff
+
+    if not changed:
+        return 0
+
+    with transaction.atomic():
+        Review.objects.bulk_update(changed, ["weight"])
+        apply_store_deltas(deltas)
+    return len(changed)
+
+
+def rebuild_store_ratings(*, store_ids=None, chunk_size: int = 500) -> int:
+    """
+    真値から作り直す（口コミの重み → 店舗集計の順）
+    store_ids=None なら全店舗。戻り値: 更新した集計行数
+    """
+    reviews = Review.objects.all()
+    if store_ids is not None:
+        store_ids = list(store_ids)
+        reviews = reviews.filter(store_id__in=store_ids)
+
+    # 1) 口コミの重みを現在の信頼度・フォロワー数で付け直す
+    rows = reviews.values_list(
+        "id", "like_count", "weight", "reviewer__trust_score", "reviewer__follower_count"
+    )
+    changed: list[Review] = []
+    for rid, like_count, old_weight, trust_score, follower_count in rows.iterator(chunk_size=chunk_size):
+        new_weight = calc_review_weight(trust_score, like_count, follower_count)
+        if abs(new_weight - (old_weight or 0.0)) > WEIGHT_EPSILON:
+            changed.append(Review(id=rid, weight=new_weight))
+
+    with transaction.atomic():
+        Review.objects.bulk_update(changed, ["weight"], batch_size=chunk_size)
+
+        # 2) 店舗ごとに集計
+        agg = {
+            row["store_id"]: row
+            for row in reviews.values("store_id").annotate(
+                cnt=Count("id"),
+                total=Sum("score"),
+                wsum=Sum(F("score") * F("weight"), output_field=FloatField()),
+                wt=Sum("weight"),
+            )
+        }
+
+        if store_ids is None:
+            target_ids = list(Store.objects.values_list("id", flat=True))
+            existing_qs = StoreRatingSummary.objects.all()
+        else:
+            target_ids = store_ids
+            existing_qs = StoreRatingSummary.objects.filter(store_id__in=target_ids)
+        existing = {s.store_id: s for s in existing_qs}
+
+        to_update: list[StoreRatingSummary] = []
+        to_create: list[StoreRatingSummary] = []
+        for store_id in target_ids:
+            row = agg.get(store_id) or {}
+            summary = existing.get(store_id) or StoreRatingSummary(store_id=store_id)
+            summary.review_count = int(row.get("cnt") or 0)
+            summary.total_score = int(row.get("total") or 0)
+            summary.weighted_sum = float(row.get("wsum") or 0.0)
+            summary.weight_total = float(row.get("wt") or 0.0)
+            summary.avg_score = (summary.total_score / summary.review_count) if summary.review_count else 0.0
+            summary.weighted_avg_rating = (
+                summary.weighted_sum / summary.weight_total
+                if summary.weight_total > WEIGHT_EPSILON else None
+            )
+            (to_update if summary.pk else to_create).append(summary)
+
+        fields = ["review_count", "total_score", "weighted_sum", "weight_total", "avg_score", "weighted_avg_rating"]
+        StoreRatingSummary.objects.bulk_update(to_update, fields, batch_size=chunk_size)
+        StoreRatingSummary.objects.bulk_create(to_create, batch_size=chunk_size, ignore_conflicts=True)
+
+    return len(to_update) + len(to_create)
@@ -0,0 +1,140 @@
+# commons/reviewer_stats.py
+"""
+レビュアーのプロフィール見出し（口コミ数・フォロー数・フォロワー数・写真数・いいね数・店舗数）
+
+どれも CustomerAccount のカウンタ列から読むので、プロフィール表示は顧客の1行だけで済む。
+  - 口コミ数・いいね合計・フォロワー数 : commons.trust が信頼度用に維持しているもの
+  - フォロー数・写真数・口コミした店舗数 : ここでイベントごとに F() で足し引きする
+実データとの照合は check_reviewer_stats で行う。
+"""
+from __future__ import annotations
+
+from django.db.models import Count, F, Sum
+
+from commons.models import CustomerAccount, Follow, Review, ReviewPhoto
+
+# ここで維持するカウンタ
+STAT_FIELDS = ("following_count", "photo_count", "visited_store_count")
+# プロフィール見出しに出すカウンタ（trust が維持するものを含む）
+PROFILE_FIELDS = (
+    "review_count", "following_count", "follower_count", "photo_count", "total_likes", "visited_store_count",
+)
+
+
+def _add(customer_id: int | None, **deltas: int) -> None:
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if customer_id and deltas:
+        CustomerAccount.objects.filter(pk=customer_id).update(
+            **{name: F(name) + delta for name, delta in deltas.items()}
+        )
+
+
+def _has_review(reviewer_id, store_id, exclude_pk=None) -> bool:
+    qs = Review.objects.filter(reviewer_id=reviewer_id, store_id=store_id)
+    if exclude_pk:
+        qs = qs.exclude(pk=exclude_pk)
+    return qs.exists()
+
+
+# =====================================================
+# イベント
+# =====================================================
+def follow_changed(follower_id: int | None, delta: int) -> None:
+    """
+    フォロー(+1) / フォロー解除(-1)：フォローした側のフォロー数
+    """
+    _add(follower_id, following_count=delta)
+
+
+def photo_changed(reviewer_id: int | None, delta: int) -> None:
+    """
+    口コミ写真の追加(+1) / 削除(-1)
+    """
+    _add(reviewer_id, photo_count=delta)
+
+
+def review_saved(review, previous: dict | None) -> None:
+    """
+    口コミ保存時：その店舗への初めての口コミなら店舗数を足す
+    previous: pre_save で退避した値（新規なら None）
+    """
+    if previous and (previous["reviewer_id"], previous["store_id"]) == (review.reviewer_id, review.store_id):
+        return
+
+    if previous:
+        # 店舗・投稿者の付け替え：元の組み合わせに口コミが残っていなければ引く
+        if not _has_review(previous["reviewer_id"], previous["store_id"]):
+            _add(previous["reviewer_id"], visited_store_count=-1)
+        if previous["reviewer_id"] != review.reviewer_id:
+            photos = ReviewPhoto.objects.filter(review_id=review.pk).count()
+            _add(previous["reviewer_id"], photo_count=-photos)
+            _add(review.reviewer_id, photo_count=photos)
+
+    if not _has_review(review.reviewer_id, review.store_id, exclude_pk=review.pk):
+        _add(review.reviewer_id, visited_store_count=1)
+
+
+def review_deleted(row: dict) -> None:
+    """
+    口コミ削除時：その店舗への口コミが無くなれば店舗数を引く（row は pre_delete で退避した値）
+    """
+    if not _has_review(row["reviewer_id"], row["store_id"]):
+        _add(row["reviewer_id"], visited_store_count=-1)
+
+
+# =====================================================
+# 表示・照合
+# =====================================================
+def profile_context(customer: CustomerAccount) -> dict:
+    """
+    プロフィール見出しのテンプレート変数（DB は読まない）
+    """
+    return {
+        "stats_reviews": customer.review_count,
+        "stats_photos": customer.photo_count,
+        "stats_visitors": customer.visited_store_count,
+        "stats_likes": customer.total_likes,
+        "count_reviews": customer.review_count,
+        "count_following": customer.following_count,
+        "count_followers": customer.follower_count,
+    }
+
+
+def true_stats(customer_ids=None) -> dict[int, dict]:
+    """
+    口コミ・写真・フォローから集計し直したプロフィールのカウンタ（照合用）
+    {customer_id: {PROFILE_FIELDS}}（何も無いユーザーは含めない）
+    """
+    reviews = Review.objects.all()
+    photos = ReviewPhoto.objects.all()
+    follows = Follow.objects.all()
+    if customer_ids is not None:
+        customer_ids = list(customer_ids)
+        reviews = reviews.filter(reviewer_id__in=customer_ids)
+        photos = photos.filter(review__reviewer_id__in=customer_ids)
+        follows_out = follows.filter(follower_id__in=customer_ids)
+        follows_in = follows.filter(followee_id__in=customer_ids)
+    else:
+        follows_out = follows_in = follows
+
+    result: dict[int, dict] = {}
+
+    def _row(cid):
+        return result.setdefault(cid, dict.fromkeys(PROFILE_FIELDS, 0))
+
+    for row in reviews.values("reviewer_id").annotate(
+        cnt=Count("id"), likes=Sum("like_count"), stores=Count("store_id", distinct=True),
+    ):
+        r = _row(row["reviewer_id"])
+        r["review_count"] = row["cnt"]
+        r["total_likes"] = row["likes"] or 0
+        r["visited_store_count"] = row["stores"]
+    for cid, cnt in photos.values("review__reviewer_id").annotate(cnt=Count("id")).values_list(
+        "review__reviewer_id", "cnt"
+    ):
+        _row(cid)["photo_count"] = cnt
+    for cid, cnt in follows_out.values("follower_id").annotate(cnt=Count("id")).values_list("follower_id", "cnt"):
+        _row(cid)["following_count"] = cnt
+    for cid, cnt in follows_in.values("followee_id").annotate(cnt=Count("id")).values_list("followee_id", "cnt"):
+        _row(cid)["follower_count"] = cnt
+    return result
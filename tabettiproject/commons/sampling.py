@@ -0,0 +1,83 @@
+# commons/sampling.py
+"""
+トップページの「ランダムピックアップ」用のサンプルプール
+
+order_by("?") は毎回テーブル全体を並べ替えるので、対象 ID を一定数だけ
+キャッシュに置いておき（SAMPLE_POOL_TTL 秒ごとに作り直し）、そこから引く。
+"""
+from __future__ import annotations
+
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+from commons.models import CustomerAccount, Review
+
+# プールに置く ID 数の上限・作り直す間隔（settings で上書き可）
+POOL_SIZE = getattr(settings, "SAMPLE_POOL_SIZE", 500)
+POOL_TTL = getattr(settings, "SAMPLE_POOL_TTL", 300)
+
+CACHE_KEY_PREFIX = "sample_pool:"
+
+
+def _review_ids_with_photos() -> list[int]:
+    return list(
+        Review.objects.filter(photos__isnull=False)
+        .order_by()
+        .values_list("id", flat=True)
+        .distinct()
+    )
+
+
+def _review_ids() -> list[int]:
+    return list(Review.objects.order_by().values_list("id", flat=True))
+
+
+def _customer_ids() -> list[int]:
+    return list(CustomerAccount.objects.order_by().values_list("pk", flat=True))
+
+
+# プール名 -> 対象 ID の読み込み
+LOADERS = {
+    "reviews_with_photos": _review_ids_with_photos,
+    "reviews": _review_ids,
+    "customers": _customer_ids,
+}
+
+
+def get_pool(name: str) -> list[int]:
+    """
+    キャッシュ済みのプール（無ければ作る）。上限を超える分はランダムに間引く
+    """
+    key = CACHE_KEY_PREFIX + name
+    pool = cache.get(key)
+    if pool is None:
+        pool = refresh_pool(name)
+    return pool
+
+
+def refresh_pool(name: str) -> list[int]:
+    ids = LOADERS[name]()
+    if len(ids) > POOL_SIZE:
+        ids = random.sample(ids, POOL_SIZE)
+    cache.set(CACHE_KEY_PREFIX + name, ids, POOL_TTL)
+    return ids
+
+
+def draw(name: str, k: int, exclude=()) -> list[int]:
+    """
+    プールから k 件（重複なし）を引く。削除済みの ID が混ざる分を見込んで少し多めに返す
+    """
+    exclude = set(exclude)
+    pool = [i for i in get_pool(name) if i not in exclude] if exclude else get_pool(name)
+    return random.sample(pool, min(len(pool), k * 2))
+
+
+def pick(queryset, name: str, k: int, exclude=()) -> list:
+    """
+    プールから引いた ID でオブジェクトを取得（引いた順のまま k 件）
+    """
+    ids = draw(name, k, exclude)
+    by_id = queryset.in_bulk(ids)
+    return [by_id[i] for i in ids if i in by_id][:k]
@@ -0,0 +1,174 @@
+# commons/schedule.py
+"""
+店舗の営業時間（Store.open/close 1・2枠）の判定
+
+予約作成・予約変更・予約台帳・時間候補の各画面で共通に使う。
+StoreSchedule.for_store(store) は (店舗ID, 営業時間) ごとに1度だけ作ってプロセス内で使い回す。
+「分 -> その分を含む営業区間の終了分」の配列を持つので、
+「開始〜終了が1つの営業区間に収まるか（中休み跨ぎ不可）」は配列を1回引くだけで判定できる。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+DAY_MINUTES = 24 * 60
+
+# 営業時間が未設定のときの台帳の表示レンジ
+DEFAULT_LEDGER_RANGE = (time(11, 0), time(23, 0))
+
+COURSE_MINUTES_CHOICES = (30, 60, 90, 120, 150)
+
+
+@dataclass(frozen=True)
+class TimeInterval:
+    start: time
+    end: time
+
+
+def time_to_minutes(t: time) -> int:
+    return t.hour * 60 + t.minute
+
+
+def minutes_to_time(m: int) -> time:
+    m = max(0, min(DAY_MINUTES - 1, m))
+    return time(m // 60, m % 60)
+
+
+def _raw_intervals(store) -> tuple[tuple[int, int], ...]:
+    """
+    Store の open/close から営業時間区間（分）を返す（最大2区間）
+    - start>=end は無効として捨てる
+    """
+    intervals = []
+    for a, b in (
+        (getattr(store, "open_time_1", None), getattr(store, "close_time_1", None)),
+        (getattr(store, "open_time_2", None), getattr(store, "close_time_2", None)),
+    ):
+        if isinstance(a, time) and isinstance(b, time) and time_to_minutes(b) > time_to_minutes(a):
+            intervals.append((time_to_minutes(a), time_to_minutes(b)))
+    return tuple(sorted(intervals))
+
+
+class StoreSchedule:
+    """
+    1店舗の営業時間（作成後は変更しない）
+
+        schedule = StoreSchedule.for_store(store)
+        schedule.contains(start, end)
+    """
+
+    __slots__ = ("store_id", "intervals", "closed", "_open_until")
+
+    def __init__(self, store_id: int | None, intervals: tuple[tuple[int, int], ...]):
+        self.store_id = store_id
+        self.intervals = intervals
+        # 中休み（区間と区間のすき間）
+        self.closed = tuple(
+            (a_end, b_start)
+            for (_, a_end), (b_start, _) in zip(intervals, intervals[1:])
+            if b_start > a_end
+        )
+        # 分 -> その分から始まる予約が終われる最遅の分（営業外は 0）
+        open_until = [0] * (DAY_MINUTES + 1)
+        for a, b in intervals:
+            for m in range(a, b):
+                open_until[m] = max(open_until[m], b)
+        self._open_until = tuple(open_until)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "_open_until"):
+            raise AttributeError("StoreSchedule は変更できません")
+        super().__setattr__(name, value)
+
+    def __bool__(self) -> bool:
+        return bool(self.intervals)
+
+    def __repr__(self) -> str:
+        return f"StoreSchedule(store_id={self.store_id}, intervals={self.intervals})"
+
+    @classmethod
+    def for_store(cls, store) -> "StoreSchedule":
+        return _compiled(getattr(store, "pk", None), _raw_intervals(store))
+
+    @property
+    def fingerprint(self) -> str:
+        return ",".join(f"{a}-{b}" for a, b in self.intervals)
+
+    # ----------------------------
+    # 判定
+    # ----------------------------
+    def contains_minutes(self, start_m: int, end_m: int) -> bool:
+        """
+        開始〜終了（分）が「どれか1つの営業時間区間」に完全に収まるか
+        中休み跨ぎ・日跨ぎ（end <= start）はNG／閉店ぴったりはOK
+        """
+        if end_m <= start_m or not 0 <= start_m < DAY_MINUTES:
+            return False
+        return self._open_until[start_m] >= end_m
+
+    def contains(self, start: time, end: time) -> bool:
+        return self.contains_minutes(time_to_minutes(start), time_to_minutes(end))
+
+    def validate(self, visit_date: date, visit_time: time, course_minutes: int) -> tuple[bool, str, time | None]:
+        """
+        顧客予約の「営業時間」検証：
+        - 店舗の営業時間が未設定ならNG
+        - コース終了が営業時間超え / 中休み跨ぎ はNG
+        - 日跨ぎはNG
+        戻り値: (ok, reason, end_time)
+        """
+        if not self.intervals:
+            return False, "営業時間が未設定のため予約できません。店舗へお問い合わせください。", None
+
+        if course_minutes not in COURSE_MINUTES_CHOICES:
+            return False, "コースが不正です。", None
+
+        end_dt = datetime.combine(visit_date, visit_time) + timedelta(minutes=course_minutes)
+        if end_dt.date() != visit_date:
+            return False, "営業時間外の予約はできません（終了時刻が翌日になります）。", None
+
+        end_time = end_dt.time()
+        if not self.contains(visit_time, end_time):
+            return False, "営業時間外、または中休みをまたぐ時間帯は予約できません。", None
+
+        return True, "", end_time
+
+    # ----------------------------
+    # 表示用
+    # ----------------------------
+    @property
+    def time_intervals(self) -> list[TimeInterval]:
+        return [TimeInterval(minutes_to_time(a), minutes_to_time(b)) for a, b in self.intervals]
+
+    @property
+    def closed_ranges(self) -> list[TimeInterval]:
+        """
+        営業時間レンジ内の「中休み」区間
+        例: (11-15),(17-22) -> (15-17)
+        """
+        return [TimeInterval(minutes_to_time(a), minutes_to_time(b)) for a, b in self.closed]
+
+    def intervals_for_js(self) -> list[dict[str, str]]:
+        return format_intervals_for_js(self.time_intervals)
+
+    def closed_ranges_for_js(self) -> list[dict[str, str]]:
+        return format_intervals_for_js(self.closed_ranges)
+
+    def ledger_range(self) -> tuple[time, time]:
+        """
+        台帳の表示レンジ（最小start〜最大end）。営業時間が無い場合は 11-23
+        """
+        if not self.intervals:
+            return DEFAULT_LEDGER_RANGE
+        return minutes_to_time(self.intervals[0][0]), minutes_to_time(max(b for _, b in self.intervals))
+
+
+def format_intervals_for_js(intervals: list[TimeInterval]) -> list[dict[str, str]]:
+    return [{"start": itv.start.strftime("%H:%M"), "end": itv.end.strftime("%H:%M")} for itv in intervals]
+
+
+@lru_cache(maxsize=2048)
+def _compiled(store_id: int | None, intervals: tuple[tuple[int, int], ...]) -> StoreSchedule:
+    return StoreSchedule(store_id, intervals)
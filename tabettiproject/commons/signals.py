@@ -1,57 +1,288 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
 from django.dispatch import receiver
-from commons.models import Review, CustomerAccount, Follow
+from commons.models import (
+    Review, CustomerAccount, Follow, ReviewPhoto, Store, StoreImage, StoreMenu, Area, Scene, Reservation,
+)
+from commons import (
+    fulltext, geo, images, likes, occupancy, page_cache, ratings, reviewer_stats, timeline, trust,
+)
+
+# 差分計算に使う口コミの列
+REVIEW_TRACKED_FIELDS = ("store_id", "reviewer_id", "score", "like_count", "weight")
+
+
+# トップページに表示する顧客の列（これ以外だけの保存ではキャッシュを残す）
+CUSTOMER_TOP_ACCOUNT_FIELDS = {"nickname", "icon_image", "subtitle", "review_count", "total_likes"}
+
+
+def _review_row(instance):
+    return {name: getattr(instance, name) for name in REVIEW_TRACKED_FIELDS}
+
+
+@receiver(pre_save, sender=Review)
+def stash_previous_review(sender, instance, **kwargs):
+    """
+    更新前の値を退避（信頼度・店舗評価の差分計算用）
+    """
+    instance._tracked_previous = None
+    if instance.pk:
+        instance._tracked_previous = (
+            Review.objects.filter(pk=instance.pk).values(*REVIEW_TRACKED_FIELDS).first()
+        )
 
 
 @receiver(post_save, sender=Review)
 def update_reviewer_trust_score_on_review_save(sender, instance, created, **kwargs):
     """
-    レビュー投稿時に投稿者の信頼度スコアを更新
+    レビュー投稿・更新時に店舗評価と投稿者の信頼度スコアを差分更新
+    """
+    previous = getattr(instance, "_tracked_previous", None)
+    # 店舗評価：この口コミの寄与を差し替え
+    ratings.review_saved(instance, previous)
+    # 信頼度：カウンタに差分を足す（変われば投稿者の口コミの重みも付け直す）
+    trust.review_saved(instance, previous)
+    # プロフィール：口コミした店舗数
+    reviewer_stats.review_saved(instance, previous)
+
+
+@receiver(pre_delete, sender=Review)
+def stash_deleted_review(sender, instance, **kwargs):
+    """
+    削除前の値を DB から退避（メモリ上のインスタンスが古い場合に備える）
     """
-    if instance.reviewer:
-        # review_count と total_likes を更新
-        reviews = Review.objects.filter(reviewer=instance.reviewer)
-        instance.reviewer.review_count = reviews.count()
-        instance.reviewer.total_likes = sum(r.like_count for r in reviews)
-        instance.reviewer.save(update_fields=['review_count', 'total_likes'])
-        
-        # 信頼度スコアを更新
-        instance.reviewer.update_trust_score()
+    instance._tracked_previous = (
+        Review.objects.filter(pk=instance.pk).values(*REVIEW_TRACKED_FIELDS).first()
+    )
 
 
 @receiver(post_delete, sender=Review)
 def update_reviewer_trust_score_on_review_delete(sender, instance, **kwargs):
     """
-    レビュー削除時に投稿者の信頼度スコアを更新
+    レビュー削除時に店舗評価と投稿者の信頼度スコアを差分更新
     """
-    if instance.reviewer:
-        # review_count と total_likes を更新
-        reviews = Review.objects.filter(reviewer=instance.reviewer)
-        instance.reviewer.review_count = reviews.count()
-        instance.reviewer.total_likes = sum(r.like_count for r in reviews)
-        instance.reviewer.save(update_fields=['review_count', 'total_likes'])
-        
-        # 信頼度スコアを更新
-        instance.reviewer.update_trust_score()
+    row = getattr(instance, "_tracked_previous", None) or _review_row(instance)
+    ratings.review_deleted(row)
+    trust.review_deleted(row)
+    reviewer_stats.review_deleted(row)
 
 
 @receiver(post_save, sender=Follow)
 def update_follower_count_on_follow_save(sender, instance, created, **kwargs):
     """
-    フォロー時に被フォロー者のフォロワー数と信頼度スコアを更新
+    フォロー時に被フォロー者のフォロワー数と信頼度スコア、フォローした側のフォロー数を更新
     """
-    if instance.followee:
-        instance.followee.follower_count = Follow.objects.filter(followee=instance.followee).count()
-        instance.followee.save(update_fields=['follower_count'])
-        instance.followee.update_trust_score()
+    if created:
+        trust.follow_changed(instance.followee_id, 1)
+        reviewer_stats.follow_changed(instance.follower_id, 1)
 
 
 @receiver(post_delete, sender=Follow)
 def update_follower_count_on_follow_delete(sender, instance, **kwargs):
     """
-    フォロー解除時に被フォロー者のフォロワー数と信頼度スコアを更新
+    フォロー解除時に被フォロー者のフォロワー数と信頼度スコア、フォローした側のフォロー数を更新
+    """
+    trust.follow_changed(instance.followee_id, -1)
+    reviewer_stats.follow_changed(instance.follower_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def sync_timeline_on_follow_save(sender, instance, created, **kwargs):
+    """
+    フォロー・ミュート・ブロックの変更をタイムラインに反映（フォロワー数は上の受信側で更新済み）
+    """
+    timeline.follow_changed(instance.follower_id, instance.followee_id, 1 if created else 0)
+
+
+@receiver(post_delete, sender=Follow)
+def sync_timeline_on_follow_delete(sender, instance, **kwargs):
+    """
+    フォロー解除をタイムラインに反映（フォロワー数は上の受信側で更新済み）
+    """
+    timeline.follow_changed(instance.follower_id, instance.followee_id, -1)
+
+
+@receiver(post_save, sender=Review)
+def fan_out_review_to_timelines(sender, instance, created, **kwargs):
+    """
+    新しい口コミをフォロワーのタイムラインに配る（フォロワーの多い投稿者は読むときに引く）
+    """
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=ReviewPhoto)
+def update_photo_count_on_photo_save(sender, instance, created, **kwargs):
+    """
+    口コミ写真の追加時に投稿者の写真数を更新
+    """
+    if created:
+        reviewer_stats.photo_changed(
+            Review.objects.filter(pk=instance.review_id).values_list("reviewer_id", flat=True).first(), 1
+        )
+
+
+@receiver(pre_delete, sender=ReviewPhoto)
+def stash_deleted_review_photo(sender, instance, **kwargs):
+    """
+    削除前に投稿者を退避（口コミごと消える場合も口コミより先に呼ばれる）
+    """
+    instance._reviewer_id = (
+        Review.objects.filter(pk=instance.review_id).values_list("reviewer_id", flat=True).first()
+    )
+
+
+@receiver(post_delete, sender=ReviewPhoto)
+def update_photo_count_on_photo_delete(sender, instance, **kwargs):
+    reviewer_stats.photo_changed(getattr(instance, "_reviewer_id", None), -1)
+
+
+@receiver(likes.review_likes_changed)
+def update_on_review_likes_changed(sender, deltas, **kwargs):
+    """
+    いいね数の変化だけを反映（口コミの save() を通さないので全文検索の索引などは触らない）
+    信頼度（いいね合計）→ 対象の口コミの重み → 店舗評価の順
+    ページキャッシュは表示する評価（小数1桁）が変わった店舗があるときだけ無効化し、
+    それ以外の細かな順位の揺れは TTL に任せる
+    """
+    store_ids = set(Review.objects.filter(pk__in=list(deltas.keys())).values_list("store_id", flat=True))
+    before = ratings.display_ratings(store_ids)
+
+    trust.likes_changed(deltas)
+    ratings.reweight_reviews(deltas.keys())
+
+    if ratings.display_ratings(store_ids) != before:
+        page_cache.bump(page_cache.CUSTOMER_TOP)
+        page_cache.bump(page_cache.STORE_SEARCH)
+
+
+@receiver(pre_save, sender=Reservation)
+def stash_previous_reservation(sender, instance, **kwargs):
+    """
+    更新前の値を退避（使用席数タイムラインの差分計算用）
+    """
+    instance._occupancy_previous = None
+    if instance.pk:
+        instance._occupancy_previous = (
+            Reservation.objects.filter(pk=instance.pk).values(*occupancy.TRACKED_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=Reservation)
+def update_occupancy_on_reservation_save(sender, instance, **kwargs):
+    """
+    予約の作成・変更・キャンセル時に店舗の使用席数を差分更新
+    """
+    occupancy.reservation_saved(instance, getattr(instance, "_occupancy_previous", None))
+
+
+@receiver(pre_delete, sender=Reservation)
+def stash_deleted_reservation(sender, instance, **kwargs):
+    instance._occupancy_previous = (
+        Reservation.objects.filter(pk=instance.pk).values(*occupancy.TRACKED_FIELDS).first()
+    )
+
+
+@receiver(post_delete, sender=Reservation)
+def update_occupancy_on_reservation_delete(sender, instance, **kwargs):
+    """
+    予約削除時に店舗の使用席数から差し引く
+    """
+    row = getattr(instance, "_occupancy_previous", None) or occupancy.reservation_row(instance)
+    occupancy.reservation_deleted(row)
+
+
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=ReviewPhoto)
+@receiver([post_save, post_delete], sender=Store)
+@receiver([post_save, post_delete], sender=StoreImage)
+@receiver([post_save, post_delete], sender=Area)
+@receiver([post_save, post_delete], sender=Scene)
+def invalidate_customer_top_cache(sender, **kwargs):
+    """
+    トップページの共通部分（ランキング・ピックアップ等）のキャッシュを無効化
+    """
+    page_cache.bump(page_cache.CUSTOMER_TOP)
+
+
+@receiver(post_save, sender=CustomerAccount)
+@receiver(post_delete, sender=CustomerAccount)
+def invalidate_customer_top_cache_on_account(sender, update_fields=None, **kwargs):
+    """
+    ピックアップの口コミ・おすすめユーザーに出すニックネーム・アイコン等の変更でトップページのキャッシュを無効化
+    （last_login だけの保存など、表示しない列の更新では無効化しない）
+    """
+    if update_fields is not None and not set(update_fields) & CUSTOMER_TOP_ACCOUNT_FIELDS:
+        return
+    page_cache.bump(page_cache.CUSTOMER_TOP)
+
+
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=Store)
+@receiver([post_save, post_delete], sender=Area)
+@receiver([post_save, post_delete], sender=Scene)
+def invalidate_store_search_cache(sender, **kwargs):
+    """
+    店舗検索の結果 ID 列（絞り込み・評価順）のキャッシュを無効化
+    """
+    page_cache.bump(page_cache.STORE_SEARCH)
+
+
+@receiver(post_save, sender=Store)
+def update_store_search_index(sender, instance, **kwargs):
+    """
+    店舗の全文検索索引を入れ替え
+    """
+    fulltext.index_stores([instance.pk])
+
+
+@receiver(post_delete, sender=Store)
+def remove_store_search_index(sender, instance, **kwargs):
+    fulltext.remove_store(instance.pk)
+
+
+@receiver(post_save, sender=Scene)
+def update_scene_store_search_index(sender, instance, created, **kwargs):
+    """
+    シーン名の変更をそのシーンの店舗の索引に反映
+    """
+    if not created:
+        fulltext.index_stores(Store.objects.filter(scene=instance).values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Review)
+def update_review_search_index(sender, instance, **kwargs):
+    """
+    口コミの全文検索索引を入れ替え
+    """
+    fulltext.index_reviews([instance.pk])
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_search_index(sender, instance, **kwargs):
+    fulltext.remove_review(instance.pk)
+
+
+@receiver(post_save, sender=Store)
+def update_store_geo_index(sender, instance, **kwargs):
+    """
+    店舗の位置索引（地図の表示範囲検索用）を入れ替え
+    """
+    geo.index_stores([instance.pk])
+
+
+@receiver(post_delete, sender=Store)
+def remove_store_geo_index(sender, instance, **kwargs):
+    geo.remove_store(instance.pk)
+
+
+@receiver(post_save, sender=StoreImage)
+@receiver(post_save, sender=StoreMenu)
+@receiver(post_save, sender=ReviewPhoto)
+@receiver(post_save, sender=CustomerAccount)
+def schedule_image_derivatives(sender, instance, **kwargs):
+    """
+    アップロード画像の縮小版（thumb / card / full）をコミット後にプロセスプールで作る
     """
-    if instance.followee:
-        instance.followee.follower_count = Follow.objects.filter(followee=instance.followee).count()
-        instance.followee.save(update_fields=['follower_count'])
-        instance.followee.update_trust_score()
+    for model, field in images.IMAGE_FIELDS:
+        if isinstance(instance, model):
+            images.schedule(getattr(instance, field))
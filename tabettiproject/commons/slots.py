@@ -0,0 +1,143 @@
+# commons/slots.py
+"""
+予約の開始時刻候補（15分刻み）の計算
+
+店舗の営業時間（commons.schedule.StoreSchedule）から、コース分ごとに「開始できる分」のビット列
+（bit m が 0:00 から m 分後の開始）を一度だけ作り、営業時間の内容をキーにキャッシュする。
+リクエストごとの処理は、そのビット列と「その日の受付・空席（commons.occupancy の
+15分枠タイムライン）」「現在時刻以降」のビット列との AND だけになる。
+"""
+from __future__ import annotations
+
+import hashlib
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.cache import cache
+
+from commons import occupancy
+from commons.schedule import COURSE_MINUTES_CHOICES, DAY_MINUTES, StoreSchedule
+
+SLOT_STEP = 15
+ALL_MINUTES = (1 << DAY_MINUTES) - 1
+
+# ビット列を保持する秒数（営業時間が変わればキー自体が変わる。settings で上書き可）
+SLOT_CACHE_TTL = getattr(settings, "SLOT_CACHE_TTL", 60 * 60 * 24)
+
+
+def _fingerprint(schedule: StoreSchedule) -> str:
+    return hashlib.md5(schedule.fingerprint.encode()).hexdigest()[:12]
+
+
+def _build_bitmaps(intervals) -> dict[int, int]:
+    """
+    コース分 -> 開始可能な分のビット列
+    各区間の開始から 15 分刻みで、コース終了がその区間内に収まるものだけ（中休み跨ぎ不可）
+    """
+    bitmaps = {}
+    for course in COURSE_MINUTES_CHOICES:
+        bitmap = 0
+        for a, b in intervals:
+            for m in range(a, b - course + 1, SLOT_STEP):
+                bitmap |= 1 << m
+        bitmaps[course] = bitmap
+    return bitmaps
+
+
+def start_bitmaps(store) -> dict[int, int]:
+    """
+    店舗のコース分ごとのビット列（営業時間の内容が同じ間はキャッシュを使う）
+    """
+    schedule = StoreSchedule.for_store(store)
+    if not schedule:
+        return {course: 0 for course in COURSE_MINUTES_CHOICES}
+
+    key = f"slots:{store.pk}:{_fingerprint(schedule)}"
+    bitmaps = cache.get(key)
+    if bitmaps is None:
+        bitmaps = _build_bitmaps(schedule.intervals)
+        cache.set(key, bitmaps, SLOT_CACHE_TTL)
+    return bitmaps
+
+
+def not_before_mask(target_date: date, now: datetime) -> int:
+    """
+    当日の現在時刻より前の開始を落とすマスク（当日以外は全て）
+    """
+    if target_date != now.date():
+        return ALL_MINUTES if target_date > now.date() else 0
+    first = now.hour * 60 + now.minute + (1 if (now.second or now.microsecond) else 0)
+    if first >= DAY_MINUTES:
+        return 0
+    return ALL_MINUTES & ~((1 << first) - 1)
+
+
+def capacity_mask(
+    store,
+    target_date: date,
+    course_minutes: int,
+    setting,
+    party_size: int = 1,
+    exclude_reservation_id: int | None = None,
+) -> int:
+    """
+    空席のマスク：コース中に使う全ての15分枠で「使用席数 + 人数 <= 受付席数」となる開始だけ残す
+    （受付していない日は 0。席数 0 は無制限）
+    exclude_reservation_id: 変更中の予約自身は席数に数えない
+    """
+    if setting is None or not setting.booking_status:
+        return 0
+    capacity = int(setting.available_seats or 0)
+    if not capacity:
+        return ALL_MINUTES
+    if party_size > capacity:
+        return 0
+
+    seats = occupancy.timeline(store.pk, target_date, exclude_reservation_id)
+    mask = ALL_MINUTES
+    width = occupancy.BUCKET_MINUTES
+    for i, used in enumerate(seats):
+        if used + party_size <= capacity:
+            continue
+        # 枠 i（[i*15, i*15+15)）に掛かる開始 m：i*15 - course < m < i*15 + 15
+        lo = max(0, i * width - course_minutes + 1)
+        hi = min(DAY_MINUTES, i * width + width)
+        mask &= ~(((1 << (hi - lo)) - 1) << lo)
+    return mask
+
+
+def bitmap_to_times(bitmap: int) -> list[str]:
+    times = []
+    while bitmap:
+        low = bitmap & -bitmap
+        m = low.bit_length() - 1
+        times.append(f"{m // 60:02d}:{m % 60:02d}")
+        bitmap ^= low
+    return times
+
+
+def available_start_times(
+    store,
+    target_date: date,
+    course_minutes: int,
+    *,
+    setting,
+    now: datetime | None = None,
+    party_size: int = 1,
+    exclude_reservation_id: int | None = None,
+) -> list[str]:
+    """
+    開始時刻候補（"HH:MM" の昇順）
+    setting: commons.availability.get_day_setting の結果（受付しない日は None）
+    now: 渡すと当日の過去時刻を除外する
+    party_size: この人数が入れる時間だけを返す
+    """
+    bitmap = start_bitmaps(store).get(course_minutes, 0)
+    if now is not None:
+        bitmap &= not_before_mask(target_date, now)
+    if bitmap:
+        bitmap &= capacity_mask(
+            store, target_date, course_minutes, setting, party_size, exclude_reservation_id
+        )
+    return bitmap_to_times(bitmap)
+
@@ -0,0 +1,46 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from commons import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_url(image, size="card", ext="jpg"):
+    """
+    派生画像（thumb / card / full）の URL。まだ作られていなければ元画像の URL
+    例: <img src="{% image_url store.thumb_path 'thumb' %}">
+    """
+    return images.url(image, size, ext)
+
+
+@register.simple_tag
+def responsive_image(image, size="card", alt="", css_class="", sizes=""):
+    """
+    WebP（対応ブラウザ）と JPEG の <picture>。srcset に thumb / card / full を並べ、
+    既定の src は size の JPEG。派生画像がまだ無ければ元画像の <img>
+    例: {% responsive_image review.reviewer.icon_image "thumb" alt="icon" css_class="review-user-icon" %}
+    """
+    source = images.source_name(image)
+    if not source:
+        return ""
+    variants = images.variants_for([source]).get(source)
+    if not variants or size not in variants:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy">',
+            default_storage.url(source), alt, css_class,
+        )
+
+    variant = variants[size]
+    sizes = sizes or f"{variant['width']}px"
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" loading="lazy">'
+        '</picture>',
+        images.srcset(variants, "webp"), sizes,
+        default_storage.url(variant["jpg"]), images.srcset(variants, "jpg"), sizes,
+        variant["width"], variant["height"], alt, css_class,
+    )
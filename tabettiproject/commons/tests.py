@@ -1,3 +1,874 @@
-from django.test import TestCase
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from commons.models import (
+    AccountType, AgeGroup, Area, CustomerAccount, Follow, Gender, ImageDerivative, ImageStatus,
+    ImageUpload, Reservation, ReservationStatus,
+    Reservator,
+    Review, ReviewPhoto, Scene, Store, StoreAccount, StoreAccessDaily, StoreAccessLog, StoreOccupancy, StoreOnlineReservation,
+    StoreRatingSummary, StoreReservationRule,
+)
+from commons import (
+    access_log, availability, booking, geo, images, likes, occupancy, page_cache, reviewer_stats, sampling, slots,
+    uploads,
+)
+from commons.ratings import calc_review_weight, rebuild_store_ratings
+from commons.schedule import StoreSchedule
+from commons.trust import compute_trust_score, recompute_all, true_counters
+
+# クエリ数を数えるテストでは、キャッシュの読み書き（DatabaseCache）を数に入れない
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(REVIEW_REWEIGHT_MIN_CHANGE=0)
+class StoreRatingSummaryTest(TestCase):
+    def setUp(self):
+        # マスタデータ作成
+        self.account_type = AccountType.objects.create(account_type="顧客")
+        self.age_group = AgeGroup.objects.create(age_range="20代")
+        self.gender = Gender.objects.create(gender="男性")
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+
+        self.store_a = Store.objects.create(store_name="店舗A", area=area, scene=scene, seats=10, budget=1000)
+        self.store_b = Store.objects.create(store_name="店舗B", area=area, scene=scene, seats=10, budget=1000)
+
+        self.alice = self._customer("alice")
+        self.bob = self._customer("bob")
+
+    def _customer(self, name):
+        return CustomerAccount.objects.create(
+            username=f"{name}@example.com",
+            email=f"{name}@example.com",
+            account_type=self.account_type,
+            nickname=name,
+            age_group=self.age_group,
+            gender=self.gender,
+            birth_date=date(1990, 1, 1),
+        )
+
+    def _snapshot(self):
+        return {
+            s.store_id: (s.review_count, s.total_score, round(s.weighted_sum, 6), round(s.weight_total, 6))
+            for s in StoreRatingSummary.objects.all()
+        }
+
+    def test_incremental_matches_rebuild(self):
+        """差分更新の結果が再集計（真値）と一致するか"""
+        r1 = Review.objects.create(reviewer=self.alice, store=self.store_a, score=5, review_text="a", like_count=3)
+        Review.objects.create(reviewer=self.alice, store=self.store_b, score=2, review_text="b")
+        Review.objects.create(reviewer=self.bob, store=self.store_a, score=4, review_text="c", like_count=1)
+        Review.objects.create(reviewer=self.alice, store=self.store_a, score=3, review_text="d")
+        Follow.objects.create(follower=self.bob, followee=self.alice)
+
+        # 店舗の付け替え・点数変更・削除
+        r1.store = self.store_b
+        r1.score = 1
+        r1.save()
+        Review.objects.filter(reviewer=self.bob).first().delete()
+
+        incremental = self._snapshot()
+        rebuild_store_ratings()
+        self.assertEqual(incremental, self._snapshot())
+
+        summary = StoreRatingSummary.objects.get(store=self.store_b)
+        self.assertEqual(summary.review_count, 2)
+        self.assertEqual(summary.total_score, 3)
+
+    def test_store_context_uses_summary(self):
+        """店舗詳細の評価コンテキストが集計テーブルから作られるか"""
+        Review.objects.create(reviewer=self.alice, store=self.store_a, score=4, review_text="a")
+        ctx = self.store_a.get_weighted_rating_context()
+        self.assertEqual(ctx["review_count"], 1)
+        self.assertEqual(ctx["avg_rating"], StoreRatingSummary.objects.get(store=self.store_a).display_rating)
+
+    def test_trust_counters_match_reviews(self):
+        """信頼度カウンタの差分更新が口コミ・フォローの実データと一致するか"""
+        reviews = [
+            Review.objects.create(reviewer=self.alice, store=self.store_a, score=s, review_text="x", like_count=s)
+            for s in (5, 3, 4, 1)
+        ]
+        Follow.objects.create(follower=self.bob, followee=self.alice)
+        reviews[0].like_count = 10
+        reviews[0].save()
+        reviews[1].delete()
+
+        self.alice.refresh_from_db()
+        expected = true_counters()[self.alice.pk]
+        for name, value in expected.items():
+            self.assertEqual(getattr(self.alice, name), value, name)
+
+        self.assertEqual(self.alice.follower_count, 1)
+        self.assertEqual(self.alice.trust_score, compute_trust_score(
+            self.alice.date_joined, 3, 15, 10, 42, 1,
+        ))
+
+    def test_recompute_all_repairs_drift(self):
+        """一括再計算でずれたカウンタと信頼度が実データどおりに戻るか"""
+        for s in (5, 4, 4):
+            Review.objects.create(reviewer=self.alice, store=self.store_a, score=s, review_text="x", like_count=2)
+        expected = CustomerAccount.objects.get(pk=self.alice.pk).trust_score
+
+        CustomerAccount.objects.filter(pk=self.alice.pk).update(review_count=99, follower_count=7, trust_score=0)
+        # alice（ずれ）と bob（信頼度が初期値 50.0 のまま）の2人
+        self.assertEqual(recompute_all(chunk_size=1), 2)
+
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.review_count, 3)
+        self.assertEqual(self.alice.follower_count, 0)
+        self.assertEqual(self.alice.trust_score, expected)
+
+    @override_settings(REVIEW_REWEIGHT_MIN_CHANGE=0.05)
+    def test_small_trust_change_defers_reweight(self):
+        """信頼度の変化が小さい口コミ投稿では既存の口コミの重みを付け直さず、一括再計算で揃うか"""
+        first = Review.objects.create(reviewer=self.alice, store=self.store_a, score=4, review_text="x", like_count=2)
+        for _ in range(4):
+            Review.objects.create(reviewer=self.alice, store=self.store_a, score=4, review_text="x", like_count=2)
+        first.refresh_from_db()
+        before = first.weight
+
+        Review.objects.create(reviewer=self.alice, store=self.store_b, score=4, review_text="y", like_count=2)
+        self.alice.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual(first.weight, before)
+        self.assertNotEqual(before, calc_review_weight(self.alice.trust_score, 2, 0))
+
+        # フォロワーが付くと係数が 1.1 倍になるので、その場で付け直す
+        Follow.objects.create(follower=self.bob, followee=self.alice)
+        self.alice.refresh_from_db()
+        first.refresh_from_db()
+        self.assertAlmostEqual(first.weight, calc_review_weight(self.alice.trust_score, 2, 1))
+
+        # 持ち越したずれは一括再計算で真値に戻る
+        Review.objects.create(reviewer=self.alice, store=self.store_b, score=4, review_text="z", like_count=2)
+        recompute_all()
+        self.alice.refresh_from_db()
+        first.refresh_from_db()
+        self.assertAlmostEqual(first.weight, calc_review_weight(self.alice.trust_score, 2, 1))
+        incremental = self._snapshot()
+        rebuild_store_ratings()
+        self.assertEqual(incremental, self._snapshot())
+
+    def test_like_toggle_updates_counters(self):
+        """いいねの切り替えで、いいね数・信頼度カウンタ・店舗評価が再集計と一致するか"""
+        review = Review.objects.create(reviewer=self.alice, store=self.store_a, score=4, review_text="a")
+
+        self.assertEqual(likes.toggle(review.pk, self.bob.pk), (True, 1))
+        self.assertTrue(likes.is_liked(review.pk, self.bob.pk))
+        review.refresh_from_db()
+        self.alice.refresh_from_db()
+        self.assertEqual(review.like_count, 1)
+        self.assertEqual(self.alice.total_likes, true_counters()[self.alice.pk]["total_likes"])
+
+        incremental = self._snapshot()[self.store_a.pk]
+        rebuild_store_ratings()
+        self.assertEqual(incremental, self._snapshot()[self.store_a.pk])
+
+        self.assertEqual(likes.toggle(review.pk, self.bob.pk), (False, 0))
+        self.assertFalse(review.liked_users.exists())
+        self.assertEqual(CustomerAccount.objects.get(pk=self.alice.pk).total_likes, 0)
+
+    def test_like_bumps_page_cache_only_when_rating_moves(self):
+        """いいねでページキャッシュを無効化するのは、表示する店舗評価が変わったときだけか"""
+        solo = Review.objects.create(reviewer=self.alice, store=self.store_b, score=4, review_text="a")
+        high = Review.objects.create(reviewer=self.alice, store=self.store_a, score=5, review_text="b")
+        Review.objects.create(reviewer=self.bob, store=self.store_a, score=1, review_text="c")
+
+        def versions():
+            return page_cache.get_version(page_cache.CUSTOMER_TOP), page_cache.get_version(page_cache.STORE_SEARCH)
+
+        # 口コミ1件の店舗は、いいねで重みが変わっても評価は 4.0 のまま
+        before = versions()
+        likes.toggle(solo.pk, self.bob.pk)
+        self.assertEqual(versions(), before)
+
+        likes.toggle(high.pk, self.bob.pk)
+        after = versions()
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+
+    def test_coalesced_likes_apply_once(self):
+        """まとめ書きでは、いいねの行だけ即時に入り、いいね数は flush でまとめて反映されるか"""
+        review = Review.objects.create(reviewer=self.bob, store=self.store_a, score=5, review_text="a")
+        carol = self._customer("carol")
+        self.addCleanup(likes.flush)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            likes.toggle(review.pk, self.alice.pk, window=60)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(likes.toggle(review.pk, carol.pk, window=60), (True, 2))
+
+        self.assertEqual(review.liked_users.count(), 2)
+        self.assertEqual(Review.objects.get(pk=review.pk).like_count, 0)
+
+        self.assertEqual(likes.flush(), 1)
+        self.assertEqual(Review.objects.get(pk=review.pk).like_count, 2)
+        self.assertEqual(CustomerAccount.objects.get(pk=self.bob.pk).total_likes, 2)
+        self.assertEqual(likes.like_count(review.pk), 2)
+
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_liked_by_is_one_query_and_cached(self):
+        """いいね済みの判定が1クエリでまとめて引け、キャッシュされ、切り替えで捨てられるか"""
+        cache.clear()
+        reviews = [
+            Review.objects.create(reviewer=self.alice, store=self.store_a, score=4, review_text=str(i))
+            for i in range(5)
+        ]
+        ids = [r.pk for r in reviews]
+        likes.toggle(ids[0], self.bob.pk)
+        likes.toggle(ids[3], self.bob.pk)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(likes.liked_by(self.bob, ids), {ids[0], ids[3]})
+        with self.assertNumQueries(0):
+            self.assertEqual(likes.liked_by(self.bob, ids[:2]), {ids[0]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            likes.toggle(ids[1], self.bob.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(likes.liked_by(self.bob, ids), {ids[0], ids[1], ids[3]})
+        self.assertEqual(likes.liked_context(self.alice, reviews), {"liked_review_ids": set()})
+
+    def test_profile_counters_match_ground_truth(self):
+        """口コミ・写真・フォロー・いいねのイベントで、プロフィールのカウンタが実データと一致するか"""
+        r1 = Review.objects.create(reviewer=self.alice, store=self.store_a, score=4, review_text="a")
+        r2 = Review.objects.create(reviewer=self.alice, store=self.store_a, score=3, review_text="b")
+        photo = ReviewPhoto.objects.create(review=r1, image_path="review/photos/a.jpg")
+        ReviewPhoto.objects.create(review=r2, image_path="review/photos/b.jpg")
+        Follow.objects.create(follower=self.alice, followee=self.bob)
+        likes.toggle(r1.pk, self.bob.pk)
+
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.visited_store_count, 1)
+        self.assertEqual(self.alice.photo_count, 2)
+        self.assertEqual(self.alice.following_count, 1)
+
+        # 店舗の付け替え・写真の削除・口コミごとの削除
+        r2.store = self.store_b
+        r2.save()
+        photo.delete()
+        r1.delete()
+
+        expected = reviewer_stats.true_stats()
+        for customer in CustomerAccount.objects.all():
+            want = expected.get(customer.pk, dict.fromkeys(reviewer_stats.PROFILE_FIELDS, 0))
+            for name in reviewer_stats.PROFILE_FIELDS:
+                self.assertEqual(getattr(customer, name), want[name], f"{customer.nickname} {name}")
+        self.assertEqual(CustomerAccount.objects.get(pk=self.alice.pk).visited_store_count, 1)
+
+
+class StoreAccessBufferTest(TestCase):
+    def setUp(self):
+        # 前のテストの未書き込み分（ロールバック済みの店舗）を持ち込まない
+        access_log.clear()
+        self.addCleanup(access_log.clear)
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+        self.store = Store.objects.create(store_name="店舗A", area=area, scene=scene, seats=10, budget=1000)
+
+    def test_flush_writes_logs_and_daily_rollup(self):
+        """バッファの書き込みで生ログと日次集計が揃い、保持期間外の生ログだけ消えるか"""
+        now = timezone.now()
+        today = timezone.localdate(now)
+        for days_ago in (0, 0, 0, 1, 120):
+            access_log.record_access(self.store.pk, at=now - timedelta(days=days_ago))
+        # 書き込み前でも、読むときにバッファの分が足される
+        self.assertEqual(access_log.daily_counts(self.store.pk, today, today), {today: 3})
+        self.assertFalse(StoreAccessLog.objects.exists())
+        access_log.flush()
+
+        self.assertEqual(StoreAccessLog.objects.filter(store=self.store).count(), 5)
+        counts = access_log.daily_counts(self.store.pk, today - timedelta(days=1), today)
+        self.assertEqual(counts.get(today), 3)
+
+        self.assertEqual(access_log.prune_raw_logs(days=90), 1)
+        self.assertEqual(StoreAccessDaily.objects.filter(store=self.store).count(), 3)
+
+
+class HotQueryPlanTest(TestCase):
+    """
+    画面でよく使うクエリが全件スキャンにならないか、実際に画面を開いて発行された SQL を
+    EXPLAIN QUERY PLAN で確認する（SQLite の "SCAN <table>"（USING INDEX なし）を全件スキャンとみなす。
+    並び替えを索引で済ませたいクエリは一時 B-tree でのソートも不可）
+    """
+
+    def setUp(self):
+        account_type = AccountType.objects.create(account_type="顧客")
+        age_group = AgeGroup.objects.create(age_range="20代")
+        gender = Gender.objects.create(gender="男性")
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(id=2, scene_name="お一人様")
+        self.store = Store.objects.create(store_name="店舗A", area=area, scene=scene, seats=10, budget=1000)
+        self.alice, self.bob = [
+            CustomerAccount.objects.create(
+                username=f"{name}@example.com", email=f"{name}@example.com", account_type=account_type,
+                nickname=name, age_group=age_group, gender=gender, birth_date=date(1990, 1, 1),
+            )
+            for name in ("alice", "bob")
+        ]
+        Follow.objects.create(follower=self.bob, followee=self.alice)
+        Follow.objects.create(follower=self.alice, followee=self.bob)
+        Review.objects.create(reviewer=self.alice, store=self.store, score=4, review_text="おいしい")
+        reservator = Reservator.objects.create(
+            customer_account=self.alice, full_name="alice", full_name_kana="ありす",
+            email="alice@example.com", phone_number="000",
+        )
+        Reservation.objects.create(
+            booking_user=reservator, store=self.store, visit_date=timezone.localdate(), visit_time=time(12, 0),
+            visit_count=1, course="1時間コース",
+            booking_status=ReservationStatus.objects.create(status="保存済み"),
+        )
+        self.store_user = StoreAccount.objects.create(
+            username="store@example.com", email="store@example.com",
+            account_type=AccountType.objects.create(account_type="店舗"),
+            store=self.store, admin_email="store@example.com",
+        )
+
+    def _captured(self, run):
+        with CaptureQueriesContext(connection) as ctx:
+            run()
+        return [query["sql"] for query in ctx.captured_queries]
+
+    def _page(self, user, url, params=None):
+        def run():
+            self.client.logout()
+            if user is not None:
+                self.client.force_login(user)
+            self.assertEqual(self.client.get(url, params or {}).status_code, 200)
+        return run
+
+    def _plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN は SQLite 用")
+
+        store_top = self._page(self.store_user, reverse("stores:store_top"))
+        review_list = self._page(self.alice, reverse("reviews:customer_review_list"), {"store_id": self.store.pk})
+        user_page = self._page(self.bob, reverse("follows:customer_user_page", args=[self.alice.pk]))
+        follower_list = self._page(self.alice, reverse("follows:customer_follower_list"))
+        store_info = self._page(self.alice, reverse("stores:customer_store_info", args=[self.store.pk]))
+        search = self._page(None, reverse("search:customer_search_list"), {"people": 1})
+        prune = lambda: access_log.prune_raw_logs(days=90)
+
+        # 名前: (画面・処理, 対象の SQL のパターン, 並び替えも索引で済ませるか)
+        hot_queries = {
+            # 予約台帳・空席計算（店舗トップ）
+            "reservation_store_date": (
+                store_top, r'FROM "reservations" WHERE \("reservations"\."store_id" = \S+ AND "reservations"\."visit_date" = ', False,
+            ),
+            "reservation_store_month": (
+                store_top, r'FROM "reservations" WHERE \("reservations"\."store_id" = \S+ AND "reservations"\."visit_date" >= ', False,
+            ),
+            # 保存済み判定（口コミ一覧・店舗ページ）
+            "reservation_saved_review_list": (review_list, r'FROM "reservations" WHERE \("reservations"\."booking_status_id" = ', False),
+            "reservation_saved_store_info": (store_info, r'FROM "reservations" WHERE \("reservations"\."booking_status_id" = ', False),
+            # 店舗の口コミ一覧・レビュアーの最新口コミ
+            "review_store_latest": (review_list, r'FROM "reviews" .*WHERE .*"reviews"\."store_id" = .*ORDER BY', True),
+            "review_reviewer_latest": (user_page, r'FROM "reviews" WHERE "reviews"\."reviewer_id" = \S+ ORDER BY', True),
+            # フォロワー一覧・相互フォロー判定
+            "follow_followee": (follower_list, r'FROM "follows" .*WHERE .*"follows"\."followee_id" = ', False),
+            "follow_pair": (follower_list, r'FROM "follows" WHERE \("follows"\."follower_id" = \S+ AND "follows"\."followee_id" IN', False),
+            # アクセス数（ダッシュボードの日次集計・生ログの削除）
+            "access_daily_range": (store_top, r'FROM "store_access_daily" WHERE ', False),
+            "access_prune": (prune, r'FROM "store_access_logs" WHERE "store_access_logs"\."accessed_at" < ', False),
+            # 検索：利用シーン + 人数
+            "store_scene_seats": (search, r'FROM "stores" WHERE \("stores"\."seats" >= ', False),
+        }
+        captured = {}
+        for name, (run, pattern, ordered) in hot_queries.items():
+            with self.subTest(query=name):
+                if run not in captured:
+                    captured[run] = self._captured(run)
+                statements = [sql for sql in captured[run] if re.search(pattern, sql, re.S)]
+                # 画面のクエリが変わってパターンに合わなくなったら気付けるように
+                self.assertTrue(statements, f"{name}: 対象のクエリが発行されていません")
+                for sql in statements:
+                    plan = self._plan(sql)
+                    bad = [line for line in plan if re.fullmatch(r"SCAN \S+", line)]
+                    if ordered:
+                        bad += [line for line in plan if "TEMP B-TREE FOR ORDER BY" in line]
+                    self.assertFalse(bad, sql + "\n" + "\n".join(plan))
+
+
+class SamplePoolTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+        self.stores = [
+            Store.objects.create(store_name=f"店舗{i}", area=area, scene=scene, seats=10, budget=1000)
+            for i in range(8)
+        ]
+
+    def test_pick_skips_deleted_and_excluded(self):
+        """プールから引いた結果に削除済み・除外 ID が混ざらず、重複しないか"""
+        sampling.LOADERS["stores_for_test"] = lambda: list(Store.objects.values_list("id", flat=True))
+        self.addCleanup(sampling.LOADERS.pop, "stores_for_test")
+        ids = [s.pk for s in self.stores]
+        sampling.get_pool("stores_for_test")
+        self.stores[0].delete()
+
+        picked = sampling.pick(Store.objects.all(), "stores_for_test", 5, exclude=[ids[1]])
+        picked_ids = [s.pk for s in picked]
+        self.assertEqual(len(picked_ids), 5)
+        self.assertEqual(len(set(picked_ids)), 5)
+        self.assertNotIn(ids[0], picked_ids)
+        self.assertNotIn(ids[1], picked_ids)
+
+
+class StoreReservationRuleTest(TestCase):
+    def setUp(self):
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+        self.auto_store = Store.objects.create(id=209, store_name="自動予約店", area=area, scene=scene, seats=12, budget=1000)
+        self.store = Store.objects.create(id=500, store_name="通常店", area=area, scene=scene, seats=8, budget=1000)
+        # 月曜始まりの1週間
+        self.monday = date(2030, 1, 7)
+
+    def test_virtual_default_without_rows(self):
+        """ID209-390 は行が無くても受付中で、読み取りで行が増えないか"""
+        setting = availability.get_day_setting(self.auto_store, self.monday)
+        self.assertTrue(setting.booking_status)
+        self.assertEqual(setting.available_seats, 12)
+        self.assertIsNone(availability.get_day_setting(self.store, self.monday))
+        self.assertEqual(len(availability.open_dates(self.auto_store, self.monday, self.monday + timedelta(days=30))), 31)
+        self.assertEqual(StoreOnlineReservation.objects.count(), 0)
+
+    def test_weekly_rule_and_overrides(self):
+        """曜日ルール＋上書きで判定され、ルールと同じ設定は行として残らないか"""
+        # 月〜金のみ受付
+        StoreReservationRule.objects.create(store=self.store, open_weekdays=0b0011111, available_seats=6)
+        week = [self.monday + timedelta(days=i) for i in range(7)]
+        self.assertEqual(availability.open_dates(self.store, week[0], week[-1]), week[:5])
+
+        # 水曜を休み・日曜を受付に上書き
+        availability.set_day_setting(self.store, week[2], False, 0)
+        availability.set_day_setting(self.store, week[6], True, 4)
+        # ルールと同じ内容は上書き行を持たない
+        availability.set_day_setting(self.store, week[0], True, 6)
+        self.assertEqual(StoreOnlineReservation.objects.filter(store=self.store).count(), 2)
+
+        expected = [week[0], week[1], week[3], week[4], week[6]]
+        self.assertEqual(availability.open_dates(self.store, week[0], week[-1]), expected)
+        window = availability.AvailabilityWindow.load([self.store, self.auto_store], week[0], week[-1])
+        self.assertEqual(window.open_dates(self.store.pk), expected)
+        self.assertEqual(window.open_dates(self.auto_store.pk), week)
+
+        # 上書きを戻すと行が消える
+        availability.set_day_setting(self.store, week[2], True, 6)
+        self.assertEqual(StoreOnlineReservation.objects.filter(store=self.store).count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SlotEngineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+        # 11:00-15:00 / 17:00-22:00（中休みあり）
+        self.store = Store.objects.create(
+            id=209, store_name="自動予約店", area=area, scene=scene, seats=4, budget=1000,
+            open_time_1=time(11, 0), close_time_1=time(15, 0),
+            open_time_2=time(17, 0), close_time_2=time(22, 0),
+        )
+        self.day = date(2030, 1, 7)
+
+    def _times(self, course, now=None):
+        setting = availability.get_day_setting(self.store, self.day)
+        return slots.available_start_times(self.store, self.day, course, setting=setting, now=now)
+
+    def test_start_times_follow_intervals(self):
+        """コース終了が1つの営業区間に収まる開始時刻だけが出るか"""
+        times = self._times(120)
+        self.assertEqual(times[0], "11:00")
+        self.assertIn("13:00", times)
+        self.assertNotIn("13:15", times)  # 中休み跨ぎ
+        self.assertEqual(times[-1], "20:00")
+        self.assertEqual(len(times), 9 + 13)
+
+        # 当日は現在時刻以降だけ
+        now = datetime(2030, 1, 7, 18, 5)
+        self.assertEqual(self._times(120, now=now)[0], "18:15")
+
+    def test_bitmaps_are_cached_and_follow_hours(self):
+        """ビット列はキャッシュから引き、営業時間が変わると作り直されるか"""
+        self._times(60)
+        with self.assertNumQueries(0):
+            slots.start_bitmaps(self.store)
+
+        self.store.close_time_2 = time(21, 0)
+        self.store.save()
+        self.assertEqual(self._times(60)[-1], "20:00")
+
+    def test_slots_follow_occupancy_timeline(self):
+        """重なる時間帯だけが埋まり、キャンセルで空き、変更中の予約自身は数えないか"""
+        reservator = Reservator.objects.create(
+            full_name="予約者", full_name_kana="よやくしゃ", email="r@example.com", phone_number="000",
+        )
+        confirmed = ReservationStatus.objects.create(status="予約確定")
+        cancelled = ReservationStatus.objects.create(status="キャンセル")
+        reservation = Reservation.objects.create(
+            booking_user=reservator, store=self.store, visit_date=self.day, visit_time=time(12, 0),
+            visit_count=3, course="1時間コース", booking_status=confirmed,
+        )
+        timeline = occupancy.timeline(self.store.pk, self.day)
+        self.assertEqual(timeline[47:53], [0, 3, 3, 3, 3, 0])
+
+        setting = availability.get_day_setting(self.store, self.day)
+        times = slots.available_start_times(self.store, self.day, 60, setting=setting, party_size=2)
+        self.assertIn("11:00", times)
+        self.assertNotIn("11:15", times)
+        self.assertNotIn("12:45", times)
+        self.assertIn("13:00", times)
+        self.assertIn("11:15", slots.available_start_times(self.store, self.day, 60, setting=setting))
+        self.assertEqual(slots.available_start_times(self.store, self.day, 60, setting=setting, party_size=5), [])
+        self.assertIn("12:00", slots.available_start_times(
+            self.store, self.day, 60, setting=setting, party_size=4, exclude_reservation_id=reservation.pk,
+        ))
+        self.assertFalse(occupancy.fits(self.store.pk, self.day, time(12, 30), 60, 2, 4))
+        self.assertTrue(occupancy.fits(self.store.pk, self.day, time(13, 0), 60, 4, 4))
+
+        # 時間変更で枠が移り、キャンセルで空く
+        reservation.visit_time = time(18, 0)
+        reservation.save()
+        self.assertEqual(occupancy.timeline(self.store.pk, self.day)[72:76], [3, 3, 3, 3])
+        self.assertEqual(sum(occupancy.timeline(self.store.pk, self.day)[44:56]), 0)
+        reservation.booking_status = cancelled
+        reservation.save()
+        self.assertFalse(StoreOccupancy.objects.exists())
+
+        reservation.booking_status = confirmed
+        reservation.save()
+        occupancy.rebuild()
+        self.assertEqual(sum(occupancy.timeline(self.store.pk, self.day)), 12)
+
+
+class StoreScheduleTest(TestCase):
+    def setUp(self):
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+        self.store = Store.objects.create(
+            store_name="中休み店", area=area, scene=scene, seats=10, budget=1000,
+            open_time_1=time(17, 0), close_time_1=time(22, 0),
+            open_time_2=time(11, 0), close_time_2=time(15, 0),
+        )
+
+    def test_contains_and_ranges(self):
+        """1つの営業区間に収まるか（閉店ぴったりOK・中休み跨ぎNG）と表示用の区間"""
+        schedule = StoreSchedule.for_store(self.store)
+        self.assertTrue(schedule.contains(time(11, 0), time(15, 0)))
+        self.assertFalse(schedule.contains(time(14, 30), time(15, 30)))
+        self.assertFalse(schedule.contains(time(15, 30), time(16, 30)))
+        self.assertFalse(schedule.contains(time(21, 0), time(21, 0)))
+        self.assertEqual(schedule.closed_ranges_for_js(), [{"start": "15:00", "end": "17:00"}])
+        self.assertEqual(schedule.ledger_range(), (time(11, 0), time(22, 0)))
+        self.assertEqual(schedule.validate(date(2030, 1, 7), time(21, 30), 60)[0], False)
+        self.assertEqual(schedule.validate(date(2030, 1, 7), time(21, 0), 60), (True, "", time(22, 0)))
+
+    def test_memoized_per_hours(self):
+        """同じ営業時間なら同じオブジェクトを使い、変わると作り直されるか"""
+        schedule = StoreSchedule.for_store(self.store)
+        self.assertIs(StoreSchedule.for_store(Store.objects.get(pk=self.store.pk)), schedule)
+        with self.assertRaises(AttributeError):
+            schedule.intervals = ()
+
+        self.store.open_time_2 = None
+        self.assertFalse(StoreSchedule.for_store(self.store).contains(time(11, 0), time(12, 0)))
+
+
+class StoreGeoIndexTest(TestCase):
+    def setUp(self):
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+        # 東京駅周辺に3件、大阪に1件、座標なし1件
+        self.tokyo = [
+            Store.objects.create(
+                store_name=f"東京{i}", area=area, scene=scene, seats=10, budget=1000,
+                latitude=35.680 + i * 0.001, longitude=139.766 + i * 0.001,
+            )
+            for i in range(3)
+        ]
+        self.osaka = Store.objects.create(
+            store_name="大阪", area=area, scene=scene, seats=10, budget=1000, latitude=34.702, longitude=135.495,
+        )
+        Store.objects.create(store_name="座標なし", area=area, scene=scene, seats=10, budget=1000)
+        self.url = reverse("stores:map_stores_json")
+        self.tokyo_bbox = {"south": 35.67, "west": 139.75, "north": 35.69, "east": 139.78}
+
+    def test_bbox_follows_store_changes(self):
+        """表示範囲の店舗だけを返し、座標の変更・削除が索引に反映されるか"""
+        data = self.client.get(self.url, {**self.tokyo_bbox, "zoom": 15}).json()
+        self.assertEqual(data["mode"], "stores")
+        self.assertEqual([s["id"] for s in data["stores"]], [s.pk for s in self.tokyo])
+
+        self.osaka.latitude, self.osaka.longitude = 35.681, 139.767
+        self.osaka.save()
+        self.tokyo[0].delete()
+        bbox = geo.BoundingBox(**self.tokyo_bbox)
+        self.assertEqual(
+            sorted(geo.in_bbox(Store.objects.all(), bbox).values_list("pk", flat=True)),
+            [self.tokyo[1].pk, self.tokyo[2].pk, self.osaka.pk],
+        )
+
+    def test_low_zoom_returns_clusters(self):
+        """引いた地図ではマスごとの件数だけを返すか（日本全体 → 東京3件・大阪1件）"""
+        data = self.client.get(
+            self.url, {"south": 30, "west": 128, "north": 46, "east": 146, "zoom": 5}
+        ).json()
+        self.assertEqual(data["mode"], "clusters")
+        self.assertEqual(data["total"], 4)
+        self.assertEqual(sorted(c["count"] for c in data["clusters"]), [1, 3])
+        self.assertEqual(next(c for c in data["clusters"] if c["count"] == 1)["store_id"], self.osaka.pk)
+
+        self.assertEqual(self.client.get(self.url, {"south": "x", "zoom": 5}).status_code, 400)
+
+
+class ImageDerivativeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _write_image(self, name, size=(2000, 1000), color=(200, 80, 40)):
+        from PIL import Image
+
+        path = os.path.join(self.media_root.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new("RGB", size, color).save(path, "JPEG")
+        return name
+
+    def test_derivatives_use_content_hashed_paths(self):
+        """3サイズ × WebP/JPEG を作り、同じ内容の画像は同じファイルを使うか"""
+        first = images.process(self._write_image("store/images/a.jpg"))
+        second = images.process(self._write_image("review/photos/copy.jpg"))
+
+        self.assertEqual((first.width, first.height), (2000, 1000))
+        self.assertEqual(first.variants["thumb"]["width"], 160)
+        self.assertEqual(first.variants["card"]["height"], 240)
+        self.assertEqual(first.variants, second.variants)
+        self.assertTrue(first.variants["full"]["webp"].startswith(f"derived/{first.content_hash[:2]}/"))
+        for variant in first.variants.values():
+            self.assertTrue(os.path.exists(os.path.join(self.media_root.name, variant["jpg"])))
+
+        self.assertEqual(ImageDerivative.objects.count(), 2)
+
+    def test_template_helpers_fall_back_to_original(self):
+        """派生画像があれば縮小版、まだ無ければ元画像の URL を出すか。作成はコミット後に予約されるか"""
+        name = self._write_image("store/images/b.jpg")
+        template = Template("{% load image_extras %}{% image_url name 'thumb' %}")
+
+        self.assertEqual(template.render(Context({"name": name})), "/media/store/images/b.jpg")
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertTrue(images.schedule(name))
+        self.assertEqual(len(callbacks), 1)
+
+        derivative = images.process(name)
+        self.assertEqual(
+            template.render(Context({"name": name})), "/media/" + derivative.variants["thumb"]["jpg"]
+        )
+        self.assertFalse(images.schedule(name))
+
+        html = Template("{% load image_extras %}{% responsive_image name 'card' alt='店舗' %}").render(
+            Context({"name": name})
+        )
+        self.assertIn('type="image/webp"', html)
+        self.assertIn("160w", html)
+
+
+class ImageUploadTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.TemporaryDirectory()
+        self.staging_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.addCleanup(self.staging_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name, UPLOAD_STAGING_ROOT=self.staging_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+        self.store = Store.objects.create(store_name="店舗A", area=area, scene=scene, seats=10, budget=1000)
+        self.customer = CustomerAccount.objects.create(
+            username="alice@example.com",
+            email="alice@example.com",
+            account_type=AccountType.objects.create(account_type="顧客"),
+            nickname="alice",
+            age_group=AgeGroup.objects.create(age_range="20代"),
+            gender=Gender.objects.create(gender="男性"),
+            birth_date=date(1990, 1, 1),
+        )
+        self.review = Review.objects.create(reviewer=self.customer, store=self.store, score=4, review_text="a")
+
+    def _jpeg_with_gps(self):
+        from io import BytesIO
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif[0x0112] = 6  # 向き：右に90度
+        exif[0x8825] = {2: (35.0, 41.0, 0.0), 4: (139.0, 41.0, 0.0)}  # GPS
+        buf = BytesIO()
+        Image.new("RGB", (300, 200), (200, 80, 40)).save(buf, "JPEG", exif=exif)
+        return SimpleUploadedFile("ランチ.jpg", buf.getvalue(), content_type="image/jpeg")
+
+    def test_staged_upload_is_sanitized_by_worker(self):
+        """受付時はステージングに置くだけで、ワーカーが EXIF を落として口コミ写真を作るか"""
+        from PIL import Image
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            upload = uploads.stage(
+                self._jpeg_with_gps(), ImageUpload.KIND_REVIEW_PHOTO, uploaded_by=self.customer, review=self.review,
+            )
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(upload.state, ImageUpload.STATE_PENDING)
+        self.assertFalse(self.review.photos.exists())
+        staged = os.path.join(self.staging_root.name, upload.staged_name)
+        self.assertTrue(os.path.exists(staged))
+
+        self.assertEqual(uploads.process_pending(), (1, 0))
+        upload.refresh_from_db()
+        self.assertEqual(upload.state, ImageUpload.STATE_DONE)
+        self.assertEqual(upload.attempts, 1)
+        self.assertFalse(os.path.exists(staged))
+
+        photo = self.review.photos.get()
+        self.assertEqual(upload.review_photo, photo)
+        self.assertTrue(photo.image_path.name.startswith("review/photos/"))
+        with Image.open(photo.image_path.path) as saved:
+            # 向きは画素に反映済み、EXIF は残っていない
+            self.assertEqual(saved.size, (200, 300))
+            self.assertEqual(len(saved.getexif()), 0)
+
+        # 処理済みの行は取り直さない
+        self.assertFalse(uploads.process(upload.pk))
+
+    def test_invalid_file_is_marked_failed(self):
+        """画像ではないファイルは失敗になり、店舗写真は作られないか"""
+        status = ImageStatus.objects.create(status="公開")
+        upload = uploads.stage(
+            SimpleUploadedFile("photo.jpg", b"not an image", content_type="image/jpeg"),
+            ImageUpload.KIND_STORE_IMAGE, uploaded_by=self.customer, store=self.store, image_status=status,
+        )
+
+        self.assertEqual(uploads.process_pending(), (0, 1))
+        upload.refresh_from_db()
+        self.assertEqual(upload.state, ImageUpload.STATE_FAILED)
+        self.assertIn("画像として読み込めません", upload.error)
+        self.assertFalse(self.store.images.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.staging_root.name, upload.staged_name)))
+
+
+class ConcurrentBookingTest(TransactionTestCase):
+    def setUp(self):
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+        self.store = Store.objects.create(
+            id=209, store_name="人気店", area=area, scene=scene, seats=4, budget=1000,
+            open_time_1=time(11, 0), close_time_1=time(22, 0),
+        )
+        self.status = ReservationStatus.objects.create(status="予約確定")
+        self.reservators = [
+            Reservator.objects.create(
+                full_name=f"予約者{i}", full_name_kana="よやくしゃ", email=f"r{i}@example.com", phone_number="000",
+            )
+            for i in range(12)
+        ]
+        self.day = date(2030, 1, 7)
+
+    def _book(self, reservator, visit_time):
+        try:
+            booking.book(
+                booking.BookingRequest(
+                    store=self.store, visit_date=self.day, visit_time=visit_time,
+                    end_time=time(visit_time.hour + 1, visit_time.minute),
+                    course_minutes=60, course_name="1時間コース", party_size=1,
+                ),
+                booking_user=reservator,
+                status=self.status,
+            )
+            return True
+        except booking.BookingError:
+            return False
+        finally:
+            connections.close_all()
+
+    def test_parallel_bookings_never_exceed_capacity(self):
+        """同じ時間帯への同時予約で席数（4席）を超えないか"""
+        # 12:00 と 12:30 開始を交互に（12:30-13:00 の枠を両方が使う）
+        starts = [time(12, 0) if i % 2 == 0 else time(12, 30) for i in range(12)]
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(self._book, self.reservators, starts))
+
+        self.assertEqual(sum(results), 4)
+        self.assertEqual(Reservation.objects.count(), 4)
+        timeline = occupancy.timeline(self.store.pk, self.day)
+        self.assertEqual(max(timeline), 4)
+        # タイムラインと予約の実数が一致する
+        occupancy.rebuild()
+        self.assertEqual(occupancy.timeline(self.store.pk, self.day), timeline)
+
+    def test_parallel_reschedules_never_exceed_capacity(self):
+        """予約の変更（別の日から満席間近の枠へ）が同時に来ても席数を超えず、元の日の席は返るか"""
+        other_day = self.day + timedelta(days=1)
+        # 12:00 の枠に 3 席
+        for reservator in self.reservators[:3]:
+            self.assertTrue(self._book(reservator, time(12, 0)))
+        # 別の日の予約 6 件を同時に 12:00 へ移す（空きは 1 席だけ）
+        moving = [
+            booking.book(
+                booking.BookingRequest(
+                    store=self.store, visit_date=other_day, visit_time=time(hour, 0), end_time=time(hour + 1, 0),
+                    course_minutes=60, course_name="1時間コース", party_size=1,
+                ),
+                booking_user=reservator,
+                status=self.status,
+            ).pk
+            for reservator, hour in zip(self.reservators[3:9], (11, 13, 15, 17, 19, 20))
+        ]
+
+        def reschedule(reservation_id):
+            try:
+                booking.reschedule(
+                    reservation_id,
+                    booking.BookingRequest(
+                        store=self.store, visit_date=self.day, visit_time=time(12, 0), end_time=time(13, 0),
+                        course_minutes=60, course_name="1時間コース", party_size=1,
+                    ),
+                )
+                return True
+            except booking.BookingError:
+                return False
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(reschedule, moving))
+
+        self.assertEqual(sum(results), 1)
+        self.assertEqual(Reservation.objects.filter(visit_date=self.day).count(), 4)
+        self.assertEqual(max(occupancy.timeline(self.store.pk, self.day)), 4)
+        self.assertEqual(sum(occupancy.timeline(self.store.pk, other_day)), 5 * 4)
+        # タイムラインと予約の実数が一致する
+        expected = {d: occupancy.timeline(self.store.pk, d) for d in (self.day, other_day)}
+        occupancy.rebuild()
+        self.assertEqual({d: occupancy.timeline(self.store.pk, d) for d in (self.day, other_day)}, expected)
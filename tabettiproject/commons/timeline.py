@@ -0,0 +1,203 @@
+# commons/timeline.py
+"""
+フォロー中のユーザーの口コミのタイムライン
+
+ふつうのユーザーの口コミは、投稿時にフォロワーごとの TimelineEntry に配っておく（書き込み時の配信）。
+フォロワーが TIMELINE_FANOUT_MAX_FOLLOWERS 人以上のユーザーは配ると行が増えすぎるので配らず、
+読むときにその人たちの口コミを (reviewer, posted_at) の索引から引いて混ぜる（読み込み時の取得）。
+どちらも (投稿日時, 口コミID) の降順で、カーソルは commons.keyset と同じもの。
+
+表示しないフォロー：
+  - 自分がミュート・ブロックしているフォロー（Follow.is_muted / is_blocked）
+  - 相手が自分をブロックしている（相手 → 自分の Follow.is_blocked）
+フォロー・ミュート・ブロックが変わったら、その2人の間の行を配り直す（最近の BACKFILL_REVIEWS 件）か消す。
+フォロー・フォロー解除で投稿者のフォロワー数が閾値をまたいだら、その投稿者の行を全員分消すか配り直す
+（配らなかった期間の口コミがタイムラインから抜けないように）。
+"""
+from __future__ import annotations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from commons import keyset
+from commons.models import CustomerAccount, Follow, Review, TimelineEntry
+
+# フォローした・ミュートを解除したときに配る、相手の最近の口コミの件数
+BACKFILL_REVIEWS = 50
+
+
+def fanout_max_followers() -> int:
+    """
+    これ以上フォロワーのいるユーザーの口コミは配らずに読むときに引く（settings で上書き可）
+    """
+    return getattr(settings, "TIMELINE_FANOUT_MAX_FOLLOWERS", 1000)
+
+
+def visible_follows():
+    """
+    タイムラインに出すフォロー（ミュート・ブロックしておらず、相手からもブロックされていない）
+    """
+    blocked_by_followee = Follow.objects.filter(
+        follower_id=OuterRef("followee_id"), followee_id=OuterRef("follower_id"), is_blocked=True,
+    )
+    return Follow.objects.filter(is_muted=False, is_blocked=False).exclude(Exists(blocked_by_followee))
+
+
+def _is_fanout_author(author_id: int) -> bool:
+    follower_count = (
+        CustomerAccount.objects.filter(pk=author_id).values_list("follower_count", flat=True).first() or 0
+    )
+    return follower_count < fanout_max_followers()
+
+
+def _entries(owner_ids, reviews) -> list[TimelineEntry]:
+    return [
+        TimelineEntry(owner_id=owner_id, review_id=pk, author_id=author_id, posted_at=posted_at)
+        for owner_id in owner_ids
+        for pk, author_id, posted_at in reviews
+    ]
+
+
+# =====================================================
+# 書き込み
+# =====================================================
+def fan_out(review: Review) -> int:
+    """
+    新しい口コミを投稿者のフォロワーのタイムラインに配る。戻り値：配った人数
+    フォロワーの多い投稿者は配らない（読むときに引く）
+    """
+    if not _is_fanout_author(review.reviewer_id):
+        return 0
+    owner_ids = list(visible_follows().filter(followee_id=review.reviewer_id).values_list("follower_id", flat=True))
+    TimelineEntry.objects.bulk_create(
+        _entries(owner_ids, [(review.pk, review.reviewer_id, review.posted_at)]),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    return len(owner_ids)
+
+
+def sync_pair(owner_id: int, author_id: int) -> None:
+    """
+    owner のタイムラインにある author の口コミを、今のフォロー関係に合わせて配り直すか消す
+    """
+    with transaction.atomic():
+        TimelineEntry.objects.filter(owner_id=owner_id, author_id=author_id).delete()
+        visible = visible_follows().filter(follower_id=owner_id, followee_id=author_id).exists()
+        if not visible or not _is_fanout_author(author_id):
+            return
+        TimelineEntry.objects.bulk_create(_entries([owner_id], _recent_reviews(author_id)), ignore_conflicts=True)
+
+
+def _recent_reviews(author_id: int):
+    return (
+        Review.objects.filter(reviewer_id=author_id)
+        .order_by("-posted_at", "-pk")
+        .values_list("pk", "reviewer_id", "posted_at")[:BACKFILL_REVIEWS]
+    )
+
+
+def author_crossed(author_id: int, follower_delta: int) -> None:
+    """
+    フォロワー数が閾値をまたいだ投稿者の行を揃える（follower_count は更新済みであること）
+    - 閾値以上になった：読むときに引くので、配った行を全員分消す
+    - 閾値未満になった：読むときに引かなくなるので、フォロワー全員に最近の口コミを配り直す
+    """
+    if not follower_delta:
+        return
+    after = (
+        CustomerAccount.objects.filter(pk=author_id).values_list("follower_count", flat=True).first() or 0
+    )
+    before = after - follower_delta
+    limit = fanout_max_followers()
+    if before < limit <= after:
+        TimelineEntry.objects.filter(author_id=author_id).delete()
+    elif after < limit <= before:
+        owner_ids = list(visible_follows().filter(followee_id=author_id).values_list("follower_id", flat=True))
+        TimelineEntry.objects.bulk_create(
+            _entries(owner_ids, list(_recent_reviews(author_id))), batch_size=500, ignore_conflicts=True,
+        )
+
+
+def follow_changed(follower_id: int, followee_id: int, follower_delta: int = 0) -> None:
+    """
+    フォロー(+1)・フォロー解除(-1)・ミュート・ブロックの変更(0)時。ブロックは逆向きにも効くので両方向を合わせる
+    フォロー・フォロー解除でフォローされた側のフォロワー数が閾値をまたいだら、その人の行を全員分揃える
+    """
+    with transaction.atomic():
+        sync_pair(follower_id, followee_id)
+        sync_pair(followee_id, follower_id)
+        author_crossed(followee_id, follower_delta)
+
+
+def rebuild(owner_ids=None, progress=None) -> int:
+    """
+    タイムラインを作り直す（owner_ids=None なら全員）。戻り値：作った行数
+    既存データの取り込みや、配信対象の閾値（TIMELINE_FANOUT_MAX_FOLLOWERS）を変えたときに使う
+    """
+    follows = visible_follows().filter(followee__follower_count__lt=fanout_max_followers())
+    entries = TimelineEntry.objects.all()
+    if owner_ids is not None:
+        owner_ids = list(owner_ids)
+        follows = follows.filter(follower_id__in=owner_ids)
+        entries = entries.filter(owner_id__in=owner_ids)
+
+    pairs = list(follows.order_by("follower_id").values_list("follower_id", "followee_id"))
+    entries.delete()
+
+    created = 0
+    for done, (owner_id, author_id) in enumerate(pairs, start=1):
+        created += len(
+            TimelineEntry.objects.bulk_create(_entries([owner_id], _recent_reviews(author_id)), ignore_conflicts=True)
+        )
+        if progress:
+            progress(done, len(pairs))
+    return created
+
+
+# =====================================================
+# 読み込み
+# =====================================================
+def feed(viewer_id: int, cursor: str | None = None, size: int = keyset.PAGE_SIZE):
+    """
+    viewer のタイムラインを新着順に size 件（配られた分と、フォロワーの多い人の口コミを混ぜる）
+    戻り値：(口コミのリスト, 次のページのカーソル（最後なら None）)。不正なカーソルは ValueError
+    """
+    size = keyset.clamp_size(size)
+
+    # 配られた分（口コミは結合せず、タイムラインの索引だけで並べる）
+    rows = set(
+        keyset.after(TimelineEntry.objects.filter(owner_id=viewer_id), cursor, "posted_at", "review_id")
+        .order_by("-posted_at", "-review_id")
+        .values_list("review_id", "posted_at")[:size + 1]
+    )
+
+    # フォロワーの多い人の口コミは、その人たちの口コミから直接引く
+    pulled_authors = list(
+        visible_follows()
+        .filter(follower_id=viewer_id, followee__follower_count__gte=fanout_max_followers())
+        .values_list("followee_id", flat=True)
+    )
+    if pulled_authors:
+        rows.update(
+            keyset.after(Review.objects.filter(reviewer_id__in=pulled_authors), cursor)
+            .order_by("-posted_at", "-pk")
+            .values_list("pk", "posted_at")[:size + 1]
+        )
+
+    # (投稿日時, 口コミID) の降順に混ぜて size 件
+    merged = sorted(rows, key=lambda row: (row[1], row[0]), reverse=True)
+    page_rows = merged[:size]
+    next_cursor = None
+    if len(merged) > size:
+        last_pk, last_at = page_rows[-1]
+        next_cursor = keyset.encode(last_at, last_pk)
+
+    reviews = (
+        Review.objects.filter(pk__in=[pk for pk, _ in page_rows])
+        .select_related("reviewer", "store")
+        .prefetch_related("photos")
+        .in_bulk()
+    )
+    return [reviews[pk] for pk, _ in page_rows if pk in reviews], next_cursor
@@ -0,0 +1,323 @@
+# commons/trust.py
+"""
+信頼度スコアの差分更新
+
+CustomerAccount に口コミ数・いいね合計・点数合計・点数二乗和・フォロワー数を
+カウンタとして持たせ、イベントごとに F() で足し引きする（O(1)）。
+標準偏差は二乗和から出すので、口コミを読み直す必要はない。
+"""
+from __future__ import annotations
+
+import math
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # numpy は任意（無ければ純 Python で計算）
+    np = None
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from commons.models import CustomerAccount, Follow, Review
+from commons import ratings
+
+# compute_trust_score に渡すカウンタ列
+COUNTER_FIELDS = ("date_joined", "review_count", "total_likes", "score_sum", "score_sq_sum", "follower_count")
+
+
+def score_std_dev(review_count: int, score_sum: int, score_sq_sum: int) -> float:
+    """
+    点数の標準偏差（母標準偏差。DB の StdDev と同じ）
+    """
+    if review_count <= 0:
+        return 0.0
+    mean = score_sum / review_count
+    variance = score_sq_sum / review_count - mean * mean
+    # 丸め誤差でわずかに負になることがある
+    return math.sqrt(variance) if variance > 0 else 0.0
+
+
+def compute_trust_score(
+    date_joined,
+    review_count: int,
+    total_likes: int,
+    score_sum: int,
+    score_sq_sum: int,
+    follower_count: int,
+    now: datetime | None = None,
+) -> float:
+    """
+    信頼度スコア (0-100点)。DB を見ずにカウンタだけで計算する
+    （配点は CustomerAccount.calculate_trust_score の旧実装と同じ）
+    """
+    score = 0.0
+
+    # 1. アカウント年齢スコア (0-20点) - 2年で満点
+    if date_joined:
+        current = now or datetime.now(date_joined.tzinfo)
+        account_age_days = (current - date_joined).days
+        score += min(20.0, (account_age_days / 730.0) * 20.0)
+
+    # 2. レビュー数スコア (0-20点) - 100件で満点
+    score += min(20.0, (review_count / 100.0) * 20.0)
+
+    # 3. レビューの質スコア (0-20点) - 平均5いいね以上で満点
+    if review_count > 0:
+        avg_likes = total_likes / review_count
+        score += min(20.0, (avg_likes / 5.0) * 20.0)
+
+    # 4. レビューの一貫性スコア (0-20点)
+    if review_count >= 3:
+        std_dev = score_std_dev(review_count, score_sum, score_sq_sum)
+        score += max(0.0, 20.0 - (std_dev / 1.5) * 20.0)
+    elif review_count > 0:
+        score += 5.0  # 未実績時のベース
+
+    # 5. フォロワー数スコア (0-20点) - 50人で満点
+    score += min(20.0, (follower_count / 50.0) * 20.0)
+
+    # 実績が極端に少ないユーザーは低く抑えるための係数
+    if review_count < 3:
+        score *= 0.5
+
+    return round(score, 2)
+
+
+def apply_customer_delta(
+    customer_id: int | None,
+    *,
+    reviews: int = 0,
+    likes: int = 0,
+    score: int = 0,
+    score_sq: int = 0,
+    followers: int = 0,
+    reweight: bool = True,
+) -> float | None:
+    """
+    カウンタに差分を足して信頼度を付け直す。
+    信頼度かフォロワー数が変わったら、その人の口コミの重み（店舗評価）にも反映する
+    （変化が小さいときは recompute_all の一括再計算まで持ち越す）。
+    戻り値: 新しい信頼度（該当ユーザーが無ければ None）
+    """
+    if not customer_id:
+        return None
+
+    with transaction.atomic():
+        if reviews or likes or score or score_sq or followers:
+            CustomerAccount.objects.filter(pk=customer_id).update(
+                review_count=F("review_count") + reviews,
+                total_likes=F("total_likes") + likes,
+                score_sum=F("score_sum") + score,
+                score_sq_sum=F("score_sq_sum") + score_sq,
+                follower_count=F("follower_count") + followers,
+            )
+
+        row = (
+            CustomerAccount.objects.filter(pk=customer_id)
+            .values("trust_score", *COUNTER_FIELDS)
+            .first()
+        )
+        if row is None:
+            return None
+
+        old_score = row.pop("trust_score")
+        new_score = compute_trust_score(**row)
+        if new_score != old_score:
+            CustomerAccount.objects.filter(pk=customer_id).update(trust_score=new_score)
+
+        # 重みの付け直しは O(その人の口コミ数) なので、係数が十分変わったときだけ
+        if reweight and (new_score != old_score or followers):
+            if ratings.needs_reweight(customer_id, new_score, row["follower_count"]):
+                ratings.reweight_reviewer(customer_id)
+
+    return new_score
+
+
+def review_contribution(review_like) -> dict:
+    """
+    口コミ1件がレビュアーのカウンタに与える寄与（review は Review か values() の dict）
+    """
+    get = review_like.get if isinstance(review_like, dict) else (lambda k: getattr(review_like, k))
+    score = int(get("score") or 0)
+    return {
+        "reviews": 1,
+        "likes": int(get("like_count") or 0),
+        "score": score,
+        "score_sq": score * score,
+    }
+
+
+def _negate(contrib: dict) -> dict:
+    return {k: -v for k, v in contrib.items()}
+
+
+def review_saved(review, previous: dict | None) -> None:
+    """
+    口コミ保存時：旧い寄与を外して新しい寄与を足す（いいね数・点数の変更も同じ経路）
+    previous: pre_save で退避した値（新規なら None）
+    ※ 店舗評価側（ratings.review_saved）を先に済ませておくこと。
+      信頼度が変わればここで reweight_reviewer がまとめて重みを付け直す
+    """
+    current = review_contribution(review)
+
+    if previous and previous.get("reviewer_id") == review.reviewer_id:
+        before = review_contribution(previous)
+        delta = {k: current[k] - before[k] for k in current}
+        delta["reviews"] = 0
+        apply_customer_delta(review.reviewer_id, **delta)
+        return
+
+    if previous:
+        # 投稿者が付け替えられた（通常は起きない）
+        apply_customer_delta(previous.get("reviewer_id"), **_negate(review_contribution(previous)))
+    apply_customer_delta(review.reviewer_id, **current)
+
+
+def review_deleted(row: dict) -> None:
+    """
+    口コミ削除時：寄与を外す（row は pre_delete で退避した値）
+    """
+    apply_customer_delta(row.get("reviewer_id"), **_negate(review_contribution(row)))
+
+
+def follow_changed(followee_id: int | None, delta: int) -> None:
+    """
+    フォロー(+1) / フォロー解除(-1)
+    """
+    apply_customer_delta(followee_id, followers=delta)
+
+
+def likes_changed(review_deltas: dict[int, int]) -> None:
+    """
+    いいね数の増減（{review_id: 増減}）をレビュアーのいいね合計に足す
+    ※ 信頼度が変わったレビュアーの口コミはここで重みを付け直す。変わらなかった口コミの重みは
+      呼び出し側で ratings.reweight_reviews を使う
+    """
+    per_reviewer: dict[int, int] = {}
+    for review_id, reviewer_id in Review.objects.filter(pk__in=list(review_deltas)).values_list("pk", "reviewer_id"):
+        per_reviewer[reviewer_id] = per_reviewer.get(reviewer_id, 0) + review_deltas[review_id]
+    for reviewer_id, likes in per_reviewer.items():
+        if likes:
+            apply_customer_delta(reviewer_id, likes=likes)
+
+
+def true_counters(customer_ids=None) -> dict[int, dict]:
+    """
+    口コミ・フォローから集計し直したカウンタ（整合性チェック用）
+    {customer_id: {review_count, total_likes, score_sum, score_sq_sum, follower_count}}
+    """
+    reviews = Review.objects.all()
+    follows = Follow.objects.all()
+    if customer_ids is not None:
+        reviews = reviews.filter(reviewer_id__in=customer_ids)
+        follows = follows.filter(followee_id__in=customer_ids)
+
+    result: dict[int, dict] = {}
+
+    def _row(cid):
+        return result.setdefault(cid, {
+            "review_count": 0, "total_likes": 0, "score_sum": 0, "score_sq_sum": 0, "follower_count": 0,
+        })
+
+    for row in reviews.values("reviewer_id").annotate(
+        cnt=Count("id"),
+        likes=Sum("like_count"),
+        total=Sum("score"),
+        sq=Sum(F("score") * F("score")),
+    ):
+        r = _row(row["reviewer_id"])
+        r["review_count"] = row["cnt"]
+        r["total_likes"] = row["likes"] or 0
+        r["score_sum"] = row["total"] or 0
+        r["score_sq_sum"] = row["sq"] or 0
+
+    for row in follows.values("followee_id").annotate(cnt=Count("id")):
+        _row(row["followee_id"])["follower_count"] = row["cnt"]
+
+    return result
+
+
+def compute_trust_scores(rows: list[dict], now: datetime | None = None) -> list[float]:
+    """
+    compute_trust_score の一括版（rows は COUNTER_FIELDS を持つ dict のリスト）
+    numpy があれば配列でまとめて計算する
+    """
+    if not rows:
+        return []
+    if np is None:
+        return [compute_trust_score(now=now, **row) for row in rows]
+
+    def col(name):
+        return np.array([row[name] for row in rows], dtype=float)
+
+    cnt = col("review_count")
+    likes = col("total_likes")
+    total = col("score_sum")
+    sq = col("score_sq_sum")
+    followers = col("follower_count")
+
+    age_days = np.array([
+        ((now or datetime.now(row["date_joined"].tzinfo)) - row["date_joined"]).days
+        if row["date_joined"] else -1
+        for row in rows
+    ], dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        safe_cnt = np.where(cnt > 0, cnt, 1.0)
+        mean = total / safe_cnt
+        std_dev = np.sqrt(np.clip(sq / safe_cnt - mean * mean, 0.0, None))
+
+    score = np.where(age_days >= 0, np.minimum(20.0, age_days / 730.0 * 20.0), 0.0)
+    score += np.minimum(20.0, cnt / 100.0 * 20.0)
+    score += np.where(cnt > 0, np.minimum(20.0, likes / safe_cnt / 5.0 * 20.0), 0.0)
+    score += np.where(
+        cnt >= 3,
+        np.maximum(0.0, 20.0 - std_dev / 1.5 * 20.0),
+        np.where(cnt > 0, 5.0, 0.0),
+    )
+    score += np.minimum(20.0, followers / 50.0 * 20.0)
+    score = np.where(cnt < 3, score * 0.5, score)
+
+    return [round(float(v), 2) for v in score]
+
+
+def recompute_all(*, chunk_size: int = 500, progress=None) -> int:
+    """
+    全ユーザーのカウンタと信頼度を実データから一括で作り直す
+    （集計は数本の GROUP BY、書き込みは chunk_size ごとの bulk_update）
+    progress: progress(done, total) で進捗を受け取るコールバック
+    戻り値: 信頼度・カウンタが変わったユーザー数
+    """
+    expected = true_counters()
+    empty = {"review_count": 0, "total_likes": 0, "score_sum": 0, "score_sq_sum": 0, "follower_count": 0}
+    fields = ["review_count", "total_likes", "score_sum", "score_sq_sum", "follower_count", "trust_score"]
+
+    current = list(CustomerAccount.objects.values("pk", "date_joined", *fields))
+    wanted = [
+        {"date_joined": row["date_joined"], **expected.get(row["pk"], empty)}
+        for row in current
+    ]
+    scores = compute_trust_scores(wanted, now=timezone.now())
+
+    changed: list[CustomerAccount] = []
+    for row, want, new_score in zip(current, wanted, scores):
+        want["trust_score"] = new_score
+        if all(row[name] == want[name] for name in fields):
+            continue
+        changed.append(CustomerAccount(pk=row["pk"], **{name: want[name] for name in fields}))
+
+    total = len(changed)
+    done = 0
+    for start in range(0, total, chunk_size):
+        batch = changed[start:start + chunk_size]
+        with transaction.atomic():
+            CustomerAccount.objects.bulk_update(batch, fields)
+        done += len(batch)
+        if progress:
+            progress(done, total)
+
+    # 差分更新で持ち越した重みのずれもここで解消するので、店舗評価は毎回作り直す
+    ratings.rebuild_store_ratings(chunk_size=chunk_size)
+    return total
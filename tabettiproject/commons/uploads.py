@@ -0,0 +1,212 @@
+# commons/uploads.py
+"""
+口コミ写真・店舗写真のアップロード処理
+
+リクエストではファイルをステージング領域（UPLOAD_STAGING_ROOT、公開しない）へ
+チャンクごとに書き出し、ImageUpload（処理待ち）を1行作ってすぐに返す。
+検証・EXIF 除去・再エンコード（commons.image_worker.sanitize）と ReviewPhoto / StoreImage の作成は
+コミット後に起こすワーカースレッドが ImageUpload を古い順に取り出して行い、
+派生画像は作成時のシグナル（commons.images.schedule）でプロセスプールへ回る。
+
+ワーカーはプロセス内のスレッドなので、再起動などで残った処理待ちは process_image_uploads で流す。
+"""
+from __future__ import annotations
+
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import F
+
+from commons import image_worker
+from commons.models import ImageUpload, ReviewPhoto, StoreImage
+
+# 1ファイルの上限（バイト、settings で上書き可）
+MAX_UPLOAD_BYTES = getattr(settings, "UPLOAD_MAX_BYTES", 20 * 1024 * 1024)
+# ワーカーが1回に取り出す件数
+BATCH_SIZE = 20
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_worker: threading.Thread | None = None
+
+
+def staging_root() -> Path:
+    return Path(getattr(settings, "UPLOAD_STAGING_ROOT", Path(settings.BASE_DIR) / "upload_staging"))
+
+
+def _staged_path(name: str) -> Path:
+    return staging_root() / name
+
+
+def _remove_staged(upload: ImageUpload) -> None:
+    try:
+        os.remove(_staged_path(upload.staged_name))
+    except FileNotFoundError:
+        pass
+
+
+# =====================================================
+# 受付（リクエスト内）
+# =====================================================
+def stage(uploaded_file, kind: str, uploaded_by=None, **targets) -> ImageUpload:
+    """
+    アップロードファイルをステージング領域に書き出して ImageUpload を作る（処理はコミット後）
+    targets：review / store / image_status。大きすぎるファイルは ValueError
+    """
+    if uploaded_file.size > MAX_UPLOAD_BYTES:
+        raise ValueError(f"画像は {MAX_UPLOAD_BYTES // (1024 * 1024)}MB 以下にしてください。")
+
+    root = staging_root()
+    root.mkdir(parents=True, exist_ok=True)
+    staged_name = uuid.uuid4().hex
+    # メモリに載せず、受け取ったチャンクのまま書き出す
+    with open(root / staged_name, "wb") as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+
+    upload = ImageUpload.objects.create(
+        kind=kind,
+        staged_name=staged_name,
+        original_name=os.path.basename(uploaded_file.name or "")[:255],
+        uploaded_by=uploaded_by,
+        **targets,
+    )
+    transaction.on_commit(enqueue)
+    return upload
+
+
+# =====================================================
+# 処理（ワーカー）
+# =====================================================
+def _create_target(upload: ImageUpload, clean_path: Path, ext: str):
+    stem = Path(upload.original_name).stem[:80] or "photo"
+    with open(clean_path, "rb") as f:
+        content = File(f, name=f"{stem}.{ext}")
+        if upload.kind == ImageUpload.KIND_REVIEW_PHOTO:
+            photo = ReviewPhoto(review_id=upload.review_id)
+            photo.image_path.save(content.name, content, save=False)
+            photo.save()
+            upload.review_photo = photo
+        else:
+            image = StoreImage(
+                store_id=upload.store_id,
+                image_status_id=upload.image_status_id,
+                uploaded_by_id=upload.uploaded_by_id,
+            )
+            image.image_file.save(content.name, content, save=False)
+            image.save()
+            upload.store_image = image
+
+
+def process(upload_id: int) -> bool:
+    """
+    処理待ちの ImageUpload を1件処理する（他のワーカーが取った行は飛ばす）。完了したら True
+    画像として受け付けられないものは失敗にしてステージングのファイルを消す
+    """
+    claimed = ImageUpload.objects.filter(pk=upload_id, state=ImageUpload.STATE_PENDING).update(
+        state=ImageUpload.STATE_PROCESSING, attempts=F("attempts") + 1,
+    )
+    if not claimed:
+        return False
+    upload = ImageUpload.objects.get(pk=upload_id)
+
+    source = _staged_path(upload.staged_name)
+    clean_base = _staged_path(f"{upload.staged_name}.clean")
+    clean_path = None
+    try:
+        result = image_worker.sanitize(str(source), str(clean_base))
+        clean_path = Path(f"{clean_base}.{result['ext']}")
+        with transaction.atomic():
+            _create_target(upload, clean_path, result["ext"])
+            upload.state = ImageUpload.STATE_DONE
+            upload.error = ""
+            upload.save(update_fields=["review_photo", "store_image", "state", "error", "updated_at"])
+    except ValueError as e:
+        # 画像ではない・壊れている・大きすぎる（やり直しても同じなので元ファイルも消す）
+        upload.state = ImageUpload.STATE_FAILED
+        upload.error = str(e)
+        upload.save(update_fields=["state", "error", "updated_at"])
+        _remove_staged(upload)
+        return False
+    except Exception as e:
+        # 保存先の障害など（元ファイルは残すので process_image_uploads --retry でやり直せる）
+        print("IMAGE UPLOAD ERROR:", upload.pk, e)
+        upload.state = ImageUpload.STATE_FAILED
+        upload.error = str(e)
+        upload.save(update_fields=["state", "error", "updated_at"])
+        return False
+    finally:
+        if clean_path is not None and clean_path.exists():
+            os.remove(clean_path)
+
+    _remove_staged(upload)
+    return True
+
+
+def pending_ids(limit: int | None = None) -> list[int]:
+    qs = ImageUpload.objects.filter(state=ImageUpload.STATE_PENDING).order_by("id").values_list("pk", flat=True)
+    return list(qs[:limit] if limit else qs)
+
+
+def process_pending(limit: int | None = None) -> tuple[int, int]:
+    """
+    処理待ちを古い順に処理する。戻り値：(完了数, 失敗数)
+    """
+    done = failed = 0
+    for pk in pending_ids(limit):
+        if process(pk):
+            done += 1
+        elif ImageUpload.objects.filter(pk=pk, state=ImageUpload.STATE_FAILED).exists():
+            failed += 1
+    return done, failed
+
+
+def requeue(include_processing: bool = False) -> int:
+    """
+    ステージングのファイルが残っている失敗分（と、止まったままの処理中）を処理待ちに戻す
+    """
+    states = [ImageUpload.STATE_FAILED]
+    if include_processing:
+        states.append(ImageUpload.STATE_PROCESSING)
+    ids = [
+        pk for pk, name in ImageUpload.objects.filter(state__in=states).values_list("pk", "staged_name")
+        if _staged_path(name).exists()
+    ]
+    return ImageUpload.objects.filter(pk__in=ids).update(state=ImageUpload.STATE_PENDING)
+
+
+def _run() -> None:
+    """
+    処理待ちが無くなるまで流し、次に起こされるまで待つ（専用スレッド）
+    """
+    while True:
+        _wake.wait()
+        _wake.clear()
+        try:
+            while True:
+                ids = pending_ids(BATCH_SIZE)
+                if not ids:
+                    break
+                for pk in ids:
+                    process(pk)
+        except Exception as e:
+            print("IMAGE UPLOAD ERROR:", e)
+        finally:
+            connection.close()
+
+
+def enqueue() -> None:
+    """
+    ワーカースレッドを起こす（無ければ起動する）
+    """
+    global _worker
+    with _lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name="image-uploads", daemon=True)
+            _worker.start()
+    _wake.set()
@@ -1,3 +1,172 @@
-from django.test import TestCase
+from datetime import date
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from commons import timeline
+from commons.models import (
+    AccountType, AgeGroup, Area, CustomerAccount, Follow, Gender, Review, Scene, Store, TimelineEntry,
+)
+
+
+class FollowerListQueryCountTest(TestCase):
+    def setUp(self):
+        # マスタデータ作成
+        self.account_type = AccountType.objects.create(account_type="顧客")
+        self.age_group = AgeGroup.objects.create(age_range="20代")
+        self.gender = Gender.objects.create(gender="男性")
+        self.owner = self._customer("owner")
+
+    def _customer(self, name):
+        return CustomerAccount.objects.create(
+            username=f"{name}@example.com",
+            email=f"{name}@example.com",
+            account_type=self.account_type,
+            nickname=name,
+            age_group=self.age_group,
+            gender=self.gender,
+            birth_date=date(1990, 1, 1),
+        )
+
+    def _add_followers(self, names, mutual=()):
+        for name in names:
+            follower = self._customer(name)
+            Follow.objects.create(follower=follower, followee=self.owner)
+            if name in mutual:
+                Follow.objects.create(follower=self.owner, followee=follower)
+
+    def _count_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("follows:customer_follower_list"))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_follower_list_query_count_is_constant(self):
+        """フォロワー一覧のクエリ数がフォロワー数に比例しないか"""
+        self.client.force_login(self.owner)
+
+        self._add_followers([f"u{i}" for i in range(3)])
+        small, _ = self._count_queries()
+
+        self._add_followers([f"v{i}" for i in range(30)], mutual={"v1", "v7"})
+        large, response = self._count_queries()
+
+        self.assertEqual(small, large)
+        cards = response.context["followers"]
+        self.assertEqual(len(cards), 33)
+        mutual = {c["user"].nickname for c in cards if c["is_following"]}
+        self.assertEqual(mutual, {"v1", "v7"})
+
+
+@override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=2)
+class TimelineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        # マスタデータ作成
+        self.account_type = AccountType.objects.create(account_type="顧客")
+        self.age_group = AgeGroup.objects.create(age_range="20代")
+        self.gender = Gender.objects.create(gender="男性")
+        self.store = Store.objects.create(
+            store_name="店舗A", area=Area.objects.create(area_name="テストエリア"),
+            scene=Scene.objects.create(scene_name="テストシーン"), seats=10, budget=1000,
+        )
+        self.alice = self._customer("alice")
+        self.bob = self._customer("bob")      # フォロワー1人：書き込み時に配る
+        self.carol = self._customer("carol")  # フォロワー2人：読むときに引く
+        self.dave = self._customer("dave")    # alice はフォローしていない
+
+        self.alice_bob = Follow.objects.create(follower=self.alice, followee=self.bob)
+        Follow.objects.create(follower=self.alice, followee=self.carol)
+        Follow.objects.create(follower=self.dave, followee=self.carol)
+
+        self.expected = []
+        for i in range(30):
+            author = (self.bob, self.carol, self.dave)[i % 3]
+            review = Review.objects.create(reviewer=author, store=self.store, score=4, review_text=f"review {i}")
+            if author != self.dave:
+                self.expected.insert(0, review.pk)
+
+    def _customer(self, name):
+        return CustomerAccount.objects.create(
+            username=f"{name}@example.com",
+            email=f"{name}@example.com",
+            account_type=self.account_type,
+            nickname=name,
+            age_group=self.age_group,
+            gender=self.gender,
+            birth_date=date(1990, 1, 1),
+        )
+
+    def _feed_ids(self, size=7):
+        ids, cursor = [], None
+        while True:
+            reviews, cursor = timeline.feed(self.alice.pk, cursor, size)
+            ids += [review.pk for review in reviews]
+            if not cursor:
+                return ids
+
+    def test_feed_merges_fanned_out_and_pulled_reviews(self):
+        """配った口コミと読むときに引いた口コミが新着順に重複なく並ぶか"""
+        # 配るのはフォロワーの少ない bob の分だけ
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(owner=self.alice).values_list("author_id", flat=True)),
+            {self.bob.pk},
+        )
+        self.assertFalse(TimelineEntry.objects.filter(author_id=self.carol.pk).exists())
+        self.assertEqual(self._feed_ids(), self.expected)
+
+        # 作り直しても同じ
+        timeline.rebuild()
+        self.assertEqual(self._feed_ids(size=4), self.expected)
+
+    def test_crossing_fanout_threshold_keeps_reviews(self):
+        """フォロワー数が閾値をまたいでも、配らなかった（引かなかった）期間の口コミが抜けないか"""
+        carol_entries = TimelineEntry.objects.filter(owner=self.alice, author_id=self.carol.pk)
+
+        # dave がフォロー解除 → carol は配る側に戻る
+        Follow.objects.get(follower=self.dave, followee=self.carol).delete()
+        self.assertEqual(carol_entries.count(), 10)
+        self.assertEqual(self._feed_ids(), self.expected)
+
+        # もう一度フォロー → 読むときに引く側になり、配った行は消える
+        Follow.objects.create(follower=self.dave, followee=self.carol)
+        self.assertFalse(carol_entries.exists())
+        self.assertEqual(self._feed_ids(), self.expected)
+
+    def test_mute_and_block_hide_reviews(self):
+        """ミュート・ブロックした（された）相手の口コミが出ないか"""
+        bob_reviews = set(Review.objects.filter(reviewer=self.bob).values_list("pk", flat=True))
+        carol_reviews = set(Review.objects.filter(reviewer=self.carol).values_list("pk", flat=True))
+
+        self.alice_bob.is_muted = True
+        self.alice_bob.save()
+        self.assertFalse(set(self._feed_ids()) & bob_reviews)
+
+        self.alice_bob.is_muted = False
+        self.alice_bob.save()
+        self.assertEqual(self._feed_ids(), self.expected)
+
+        # carol が alice をブロック
+        Follow.objects.create(follower=self.carol, followee=self.alice, is_blocked=True)
+        self.assertFalse(set(self._feed_ids()) & carol_reviews)
+
+    def test_timeline_endpoint(self):
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse("follows:customer_timeline"))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([r["id"] for r in data["reviews"]], self.expected)
+        self.assertIsNone(data["next_cursor"])
+
+        _, cursor = timeline.feed(self.alice.pk, None, 5)
+        response = self.client.get(reverse("follows:customer_timeline"), {"cursor": cursor, "format": "html"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["reviews"]), 15)
+        self.assertEqual(response["X-Next-Cursor"], "")
+
+        response = self.client.get(reverse("follows:customer_timeline"), {"cursor": "broken"})
+        self.assertEqual(response.status_code, 400)
@@ -10,4 +10,7 @@ urlpatterns = [
 
     # ✅ 追加：ユーザーのマイページ表示（customer_reviewer_detail.html を使う）
     path("user/<int:customer_id>/", Customer_user_pageView.as_view(), name="customer_user_page"),
+
+    # フォロー中のユーザーの口コミのタイムライン（JSON / HTML 断片）
+    path("timeline/", Customer_timelineView.as_view(), name="customer_timeline"),
 ]
@@ -1,12 +1,14 @@
+from django.views import View
 from django.views.generic import TemplateView
-from django.shortcuts import redirect, get_object_or_404
+from django.shortcuts import redirect, get_object_or_404, render
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import Http404, JsonResponse
 from django.db import IntegrityError, transaction
 from django.contrib import messages
 
-from django.db.models import Sum
-from commons.models import CustomerAccount, Follow, Review,ReviewPhoto
+from commons.models import CustomerAccount, Follow, Review
+from commons import images, likes, reviewer_stats, timeline
+from commons.follow_graph import FollowGraph
 
 
 
@@ -21,35 +23,14 @@ def _get_login_customer_or_404(request):
     return customer
 
 
-def _pack_user_card(viewer: CustomerAccount, target: CustomerAccount):
+def _pack_user_cards(viewer: CustomerAccount, targets):
     """
-    テンプレの item.user.username 互換を保つため dict で返す
+    テンプレの item.user.username 互換を保つため dict のリストで返す
+    （フォロー関係は FollowGraph で一括取得：人数によらず 2 クエリ）
     """
-    follower_count = Follow.objects.filter(followee=target).count()
-
-    rel = Follow.objects.filter(follower=viewer, followee=target).only("is_muted").first()
-    is_following = rel is not None
-    is_muted = rel.is_muted if rel else False
-
-    is_follower = Follow.objects.filter(follower=target, followee=viewer).exists()
-
-    # ✅ 追加：相手ユーザーのカバー/アイコン
-    cover_field = getattr(target, "cover_image", None)
-    icon_field = getattr(target, "icon_image", None)
-
-    return {
-        "id": target.pk,
-        "user": target,
-        "review_count": target.review_count,
-        "follower_count": follower_count,
-        "is_following": is_following,
-        "is_follower": is_follower,
-        "is_muted": is_muted,
-
-        # ✅ 追加（カードで使う）
-        "cover_image_url": cover_field.url if cover_field else "",
-        "user_icon_url": icon_field.url if icon_field else "",
-    }
+    targets = list(targets)
+    graph = FollowGraph.resolve(viewer, targets)
+    return [graph.card(target) for target in targets]
 
 
 
@@ -92,7 +73,7 @@ class Customer_follower_listView(LoginRequiredMixin, TemplateView):
             .order_by("-followed_at")
         )
 
-        followers = [_pack_user_card(viewer or customer, rel.follower) for rel in follower_rels]
+        followers = _pack_user_cards(viewer or customer, [rel.follower for rel in follower_rels])
 
         context["followers"] = followers
         context["follower_count"] = len(followers)
@@ -229,11 +210,10 @@ class Customer_follow_listView(LoginRequiredMixin, TemplateView):
         )
 
         viewer = CustomerAccount.objects.filter(pk=self.request.user.pk).first()
-        follows = []
-        for rel in follow_rels:
-            card = _pack_user_card(viewer or customer, rel.followee)
+        follow_rels = list(follow_rels)
+        follows = _pack_user_cards(viewer or customer, [rel.followee for rel in follow_rels])
+        for card, rel in zip(follows, follow_rels):
             card["is_muted"] = rel.is_muted
-            follows.append(card)
 
         context["follows"] = follows
         context["follow_count"] = len(follows)
@@ -312,18 +292,8 @@ class Customer_user_pageView(LoginRequiredMixin, TemplateView):
         cover_field = getattr(target, "cover_image", None)
         icon_field = getattr(target, "icon_image", None)
 
-        # counts / stats（テンプレが参照している変数を全部埋める）
-        count_reviews = Review.objects.filter(reviewer=target).count()
-        count_following = Follow.objects.filter(follower=target).count()
-        count_followers = Follow.objects.filter(followee=target).count()
-        stats_photos = ReviewPhoto.objects.filter(review__reviewer=target).count()
-        stats_likes = (
-            Review.objects.filter(reviewer=target).aggregate(total=Sum("like_count")).get("total") or 0
-        )
-        # 訪問者数っぽいもの：ユニーク店舗数（無ければ0）
-        stats_visitors = (
-            Review.objects.filter(reviewer=target).values("store_id").distinct().count()
-        )
+        # counts / stats（顧客のカウンタ列から。テンプレが参照している変数を全部埋める）
+        stats = reviewer_stats.profile_context(target)
 
         display_name = target.nickname or target.username
 
@@ -333,14 +303,7 @@ class Customer_user_pageView(LoginRequiredMixin, TemplateView):
             "cover_image_url": cover_field.url if cover_field else "",
             "user_icon_url": icon_field.url if icon_field else "",
 
-            "stats_reviews": count_reviews,
-            "stats_photos": stats_photos,
-            "stats_visitors": stats_visitors,
-            "stats_likes": stats_likes,
-
-            "count_reviews": count_reviews,
-            "count_following": count_following,
-            "count_followers": count_followers,
+            **stats,
 
             # ✅ 他人ページなので編集UIを出したくない場合に使う（任意）
             "readonly_mode": True,
@@ -349,3 +312,51 @@ class Customer_user_pageView(LoginRequiredMixin, TemplateView):
         })
         return context
 
+
+class Customer_timelineView(LoginRequiredMixin, View):
+    """
+    フォロー中のユーザーの口コミのタイムライン（新着順、カーソルでページ送り）
+    - ?cursor= 前のページの next_cursor（無ければ最初のページ）
+    - ?format=html なら口コミカードの HTML 断片（次のカーソルは X-Next-Cursor ヘッダ）
+      それ以外は JSON：{"reviews": [...], "next_cursor": ...}
+    """
+    def get(self, request, *args, **kwargs):
+        customer = _get_login_customer_or_404(request)
+
+        try:
+            reviews, next_cursor = timeline.feed(customer.pk, request.GET.get("cursor") or None)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        # 写真の派生画像をまとめて引いてキャッシュに載せる
+        images.variants_for(photo.image_path for review in reviews for photo in review.photos.all())
+        liked_ids = likes.liked_by(customer, (review.pk for review in reviews))
+
+        if request.GET.get("format") == "html":
+            response = render(request, "reviews/_review_cards.html", {"reviews": reviews, "liked_review_ids": liked_ids})
+            response["X-Next-Cursor"] = next_cursor or ""
+            return response
+
+        return JsonResponse({
+            "reviews": [
+                {
+                    "id": review.pk,
+                    "reviewer": {"id": review.reviewer_id, "nickname": review.reviewer.nickname},
+                    "store": {"id": review.store_id, "store_name": review.store.store_name},
+                    "score": review.score,
+                    "review_text": review.review_text,
+                    "like_count": review.like_count,
+                    "liked": review.pk in liked_ids,
+                    "posted_at": review.posted_at.isoformat(),
+                    "photos": [
+                        {
+                            "url": photo.image_path.url,
+                            "thumb_url": images.url(photo.image_path, "thumb"),
+                        }
+                        for photo in review.photos.all() if photo.image_path
+                    ],
+                }
+                for review in reviews
+            ],
+            "next_cursor": next_cursor,
+        })
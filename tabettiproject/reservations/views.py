@@ -14,9 +14,10 @@ from django.utils import timezone
 from django.core.paginator import Paginator
 from django.views.generic import ListView
 from datetime import timedelta, datetime
-from dataclasses import dataclass
 
-from commons.models import CustomerAccount, Reservation, ReservationStatus, StoreOnlineReservation, Store
+from commons.models import CustomerAccount, Reservation, ReservationStatus, Store
+from commons import availability, booking, slots
+from commons.schedule import StoreSchedule
 
 
 # ----------------------------
@@ -185,71 +186,16 @@ class store_reservation_editView(LoginRequiredMixin, View):
         return timezone.localdate() + timedelta(days=4)
 
     # ----------------------------
-    # 受付中チェック（B仕様：未設定日もNG）
+    # 受付中チェック（B仕様：上書きも既定ルールも無い日はNG）
     # ----------------------------
-    def _is_store_accepting_on(self, store_id: int, target_date: date) -> bool:
-        row = StoreOnlineReservation.objects.filter(store_id=store_id, date=target_date).first()
-        if row is None:
+    def _is_store_accepting_on(self, store: Store, target_date: date) -> bool:
+        setting = availability.get_day_setting(store, target_date)
+        if setting is None:
             return False  # ★B仕様：未設定日は受付停止扱い
-        return bool(row.booking_status)
+        return bool(setting.booking_status)
 
     # ----------------------------
-    # 営業時間ヘルパ（Store.open/close 1・2枠）
-    # ----------------------------
-    @dataclass(frozen=True)
-    class TimeInterval:
-        start: time
-        end: time
-
-    def _time_to_minutes(self, t: time) -> int:
-        return t.hour * 60 + t.minute
-
-    def _minutes_to_time(self, m: int) -> time:
-        m = max(0, min(24 * 60 - 1, m))
-        return time(m // 60, m % 60)
-
-    def _get_store_intervals(self, store) -> list["store_reservation_editView.TimeInterval"]:
-        """
-        Store の open/close から営業時間区間を返す（最大2区間）
-        - start>=end は無効として捨てる
-        """
-        intervals: list[store_reservation_editView.TimeInterval] = []
-
-        def push(a: time | None, b: time | None) -> None:
-            if isinstance(a, time) and isinstance(b, time) and self._time_to_minutes(b) > self._time_to_minutes(a):
-                intervals.append(self.TimeInterval(a, b))
-
-        push(store.open_time_1, store.close_time_1)
-        push(store.open_time_2, store.close_time_2)
-
-        intervals.sort(key=lambda x: self._time_to_minutes(x.start))
-        return intervals
-
-    def _is_inside_one_interval(
-        self,
-        start: time,
-        end: time,
-        intervals: list["store_reservation_editView.TimeInterval"],
-    ) -> bool:
-        """
-        予約の開始〜終了が「どれか1つの営業時間区間」に完全に収まるか
-        中休みをまたぐのはNG
-        """
-        s = self._time_to_minutes(start)
-        e = self._time_to_minutes(end)
-        if e <= s:  # 日跨ぎ/逆転NG
-            return False
-
-        for itv in intervals:
-            a = self._time_to_minutes(itv.start)
-            b = self._time_to_minutes(itv.end)
-            # ★閉店ぴったりOK → e <= b
-            if a <= s and e <= b:
-                return True
-        return False
-
-    # ----------------------------
-    # 15分刻み：開始候補生成（コース込みで営業時間判定）
+    # 15分刻み：開始候補生成（commons.slots のビット列を使う）
     # ----------------------------
     def _build_available_start_times(
         self,
@@ -257,41 +203,27 @@ class store_reservation_editView(LoginRequiredMixin, View):
         store,
         target_date: date,
         course_minutes: int,
-        step_min: int = 15,
+        party_size: int = 1,
+        reservation_id: int | None = None,
     ) -> list[str]:
         # ★変更先の最短日チェック（今日+4日未満なら候補なし）
         if target_date < self._min_editable_date():
             return []
 
-        intervals = self._get_store_intervals(store)
-        if not intervals:
-            return []
-
         # B仕様：その日が受付中でなければ候補なし
-        if not self._is_store_accepting_on(store.id, target_date):
+        setting = availability.get_day_setting(store, target_date)
+        if setting is None or not setting.booking_status:
             return []
 
-        starts: list[str] = []
-
-        for itv in intervals:
-            a = self._time_to_minutes(itv.start)
-            b = self._time_to_minutes(itv.end)
-
-            last_start = b - course_minutes
-            t = a
-            while t <= last_start:
-                st = self._minutes_to_time(t)
-                ed = self._minutes_to_time(t + course_minutes)
-
-                # 中休み跨ぎ/営業時間外NG（「どれか1枠」に完全に収まること）
-                if self._is_inside_one_interval(st, ed, intervals):
-                    starts.append(f"{st.hour:02d}:{st.minute:02d}")
-
-                t += step_min
-
-        # 重複除去＋ソート
-        starts = sorted(set(starts), key=lambda s: int(s[:2]) * 60 + int(s[3:]))
-        return starts
+        # 営業時間外・中休み跨ぎは候補に出さない／変更中の予約自身は席数に数えない
+        return slots.available_start_times(
+            store,
+            target_date,
+            course_minutes,
+            setting=setting,
+            party_size=party_size,
+            exclude_reservation_id=reservation_id,
+        )
 
     def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
         customer = _get_customer_user(request)
@@ -319,7 +251,8 @@ class store_reservation_editView(LoginRequiredMixin, View):
             store=reservation.store,
             target_date=reservation.visit_date,
             course_minutes=current_minutes,
-            step_min=15,
+            party_size=reservation.visit_count,
+            reservation_id=reservation.id,
         )
 
         ctx = {
@@ -404,7 +337,7 @@ class store_reservation_editView(LoginRequiredMixin, View):
         # ----------------------------
         # ★受付中 + 営業時間 + 中休み跨ぎチェック
         # ----------------------------
-        if not self._is_store_accepting_on(reservation.store_id, new_date):
+        if not self._is_store_accepting_on(reservation.store, new_date):
             messages.error(request, "その日時は選択できません。")
             return redirect("reservations:store_reservation_edit", reservation_id=reservation.id)
 
@@ -422,25 +355,30 @@ class store_reservation_editView(LoginRequiredMixin, View):
 
         new_end = end_dt.time()
 
-        intervals = self._get_store_intervals(reservation.store)
-        if not intervals:
-            messages.error(request, "その日時は選択できません。")
-            return redirect("reservations:store_reservation_edit", reservation_id=reservation.id)
-
-        if not self._is_inside_one_interval(new_time, new_end, intervals):
+        # 営業時間内・中休み跨ぎなし（営業時間未設定もNG）
+        if not StoreSchedule.for_store(reservation.store).contains(new_time, new_end):
             messages.error(request, "その日時は選択できません。")
             return redirect("reservations:store_reservation_edit", reservation_id=reservation.id)
 
         # ----------------------------
-        # 保存
+        # 保存（席数チェックと席の付け替えは新規予約と同じくロックの中で行う）
         # ----------------------------
-        reservation.visit_date = new_date
-        reservation.visit_time = new_time
-        reservation.start_time = new_time
-        reservation.end_time = new_end
-        reservation.visit_count = new_count
-        reservation.course = new_course
-        reservation.save()
+        try:
+            booking.reschedule(
+                reservation.id,
+                booking.BookingRequest(
+                    store=reservation.store,
+                    visit_date=new_date,
+                    visit_time=new_time,
+                    end_time=new_end,
+                    course_minutes=int(new_minutes),  # type: ignore[arg-type]
+                    course_name=new_course,
+                    party_size=new_count,
+                ),
+            )
+        except booking.BookingError as e:
+            messages.error(request, str(e))
+            return redirect("reservations:store_reservation_edit", reservation_id=reservation.id)
 
         messages.success(request, "ご予約内容を変更しました。")
         return redirect("reservations:store_reservation_confirm", reservation_id=reservation.id)
@@ -449,7 +387,7 @@ class store_reservation_editView(LoginRequiredMixin, View):
 class available_timesView(LoginRequiredMixin, View):
     """
     来店日 + コース分 から、選択可能な開始時刻（15分刻み）を返すAPI
-    - 未設定日（StoreOnlineReservationなし） -> NG（times=[]）
+    - 未設定日（上書きも既定ルールも無い） -> NG（times=[]）
     - booking_status=False -> NG
     - 変更先が今日+4日未満 -> NG
     - 営業時間外 / 中休み跨ぎ -> 候補に出さない
@@ -467,6 +405,7 @@ class available_timesView(LoginRequiredMixin, View):
         try:
             target_date = date.fromisoformat(date_s)
             course_minutes = int(course_s)
+            party_size = int((request.GET.get("party_size") or "").strip() or reservation.visit_count)
         except Exception:
             return JsonResponse({"times": []})
 
@@ -483,7 +422,8 @@ class available_timesView(LoginRequiredMixin, View):
             store=store,
             target_date=target_date,
             course_minutes=course_minutes,
-            step_min=15,
+            party_size=party_size,
+            reservation_id=reservation.id,
         )
         return JsonResponse({"times": times})
 
@@ -1,3 +1,57 @@
+from datetime import date
+
 from django.test import TestCase
+from django.urls import reverse
+
+from commons import availability
+from commons.models import AccountType, Area, Scene, Store, StoreAccount, StoreOnlineReservation, StoreReservationRule
+
+
+class BulkOpenTest(TestCase):
+    def setUp(self):
+        self.area = Area.objects.create(area_name="テストエリア")
+        self.scene = Scene.objects.create(scene_name="テストシーン")
+        self.account_type = AccountType.objects.create(account_type="店舗")
+        self.url = reverse("reservations_management:store_reservation_settings") + "?year=2030&month=1"
+
+    def _login_store(self, pk, seats):
+        store = Store.objects.create(id=pk, store_name=f"店舗{pk}", area=self.area, scene=self.scene, seats=seats, budget=1000)
+        account = StoreAccount.objects.create(
+            username=f"store{pk}@example.com",
+            email=f"store{pk}@example.com",
+            account_type=self.account_type,
+            store=store,
+            admin_email=f"store{pk}@example.com",
+        )
+        self.client.force_login(account)
+        return store
+
+    def test_bulk_open_stores_no_overrides_for_rule_days(self):
+        """一括で受付中にしても、既定ルールと同じ日は上書き行を作らないか"""
+        # 席数未設定（0）の自動予約店：既定ルールは無制限相当
+        store = self._login_store(209, seats=0)
+        response = self.client.post(self.url, {"action": "bulk_open", "year": 2030, "month": 1})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(StoreOnlineReservation.objects.filter(store=store).count(), 0)
+        self.assertEqual(availability.get_day_setting(store, date(2030, 1, 15)).available_seats, 999)
+
+    def test_bulk_open_creates_rule_for_store_without_one(self):
+        """ルールの無い通常の店舗は、店舗の席数で全曜日受付のルールを作る（席数 0＝無制限にしない）"""
+        store = self._login_store(1, seats=10)
+        self.client.post(self.url, {"action": "bulk_open", "year": 2030, "month": 1})
+
+        self.assertEqual(StoreOnlineReservation.objects.filter(store=store).count(), 0)
+        self.assertEqual(StoreReservationRule.objects.get(store=store).open_weekdays, StoreReservationRule.ALL_WEEKDAYS)
+        self.assertEqual(availability.get_day_setting(store, date(2030, 1, 15)).available_seats, 10)
+
+        # 平日だけのルールに変える → 一括で開くと土日だけ上書き行になる
+        self.client.post(self.url, {"action": "save_rule", "open_weekdays": ["0", "1", "2", "3", "4"], "rule_seats": "6"})
+        self.client.post(self.url, {"action": "bulk_open", "year": 2030, "month": 1})
+        overrides = StoreOnlineReservation.objects.filter(store=store)
+        self.assertEqual(sorted({d.weekday() for d in overrides.values_list("date", flat=True)}), [5, 6])
+        self.assertEqual(set(overrides.values_list("available_seats", flat=True)), {6})
+        self.assertEqual(len(availability.open_dates(store, date(2030, 1, 1), date(2030, 1, 31))), 31)
 
-# Create your tests here.
+        response = self.client.get(self.url)
+        self.assertContains(response, 'name="open_weekdays" value="4" checked')
+        self.assertNotContains(response, 'name="open_weekdays" value="5" checked')
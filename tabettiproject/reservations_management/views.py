@@ -17,7 +17,9 @@ from django.views import View
 from django.views.generic.base import TemplateView
 
 # モデルは commons
-from commons.models import Store, Reservation, StoreOnlineReservation, ReservationStatus
+from commons.models import Store, Reservation, ReservationStatus, StoreReservationRule
+from commons import availability
+from commons.schedule import StoreSchedule, minutes_to_time, time_to_minutes
 
 
 # ============================================================
@@ -47,97 +49,14 @@ class StoreLoginRequiredMixin(LoginRequiredMixin):
 
 
 # ============================================================
-# 営業時間ヘルパ（Store.open/close 1・2枠）
+# 営業時間ヘルパ（判定は commons.schedule.StoreSchedule）
 # ============================================================
-@dataclass(frozen=True)
-class TimeInterval:
-    start: time
-    end: time
-
-
-def _time_to_minutes(t: time) -> int:
-    return t.hour * 60 + t.minute
-
-
-def _minutes_to_time(m: int) -> time:
-    m = max(0, min(24 * 60 - 1, m))
-    return time(m // 60, m % 60)
-
-
-def _get_store_intervals(store: Store) -> list[TimeInterval]:
-    """
-    Store の open/close から営業時間区間を返す（最大2区間）
-    - start>=end は無効として捨てる
-    """
-    intervals: list[TimeInterval] = []
-
-    def push(a: time | None, b: time | None) -> None:
-        if isinstance(a, time) and isinstance(b, time) and _time_to_minutes(b) > _time_to_minutes(a):
-            intervals.append(TimeInterval(a, b))
-
-    push(store.open_time_1, store.close_time_1)
-    push(store.open_time_2, store.close_time_2)
-
-    intervals.sort(key=lambda x: _time_to_minutes(x.start))
-    return intervals
-
-
-def _build_closed_ranges(intervals: list[TimeInterval]) -> list[TimeInterval]:
-    """
-    営業時間レンジ内の「中休み」区間を返す
-    例: (11-15),(17-22) -> (15-17)
-    """
-    if len(intervals) < 2:
-        return []
-    closed: list[TimeInterval] = []
-    for i in range(len(intervals) - 1):
-        a_end = intervals[i].end
-        b_start = intervals[i + 1].start
-        if _time_to_minutes(b_start) > _time_to_minutes(a_end):
-            closed.append(TimeInterval(a_end, b_start))
-    return closed
-
-
-def _is_inside_one_interval(start: time, end: time, intervals: list[TimeInterval]) -> bool:
-    """
-    予約の開始〜終了が「どれか1つの営業時間区間」に完全に収まるか
-    中休みをまたぐのはNG
-    """
-    s = _time_to_minutes(start)
-    e = _time_to_minutes(end)
-
-    # 日跨ぎ（end <= start）はNG（このシステムでは想定しない）
-    if e <= s:
-        return False
-
-    for itv in intervals:
-        a = _time_to_minutes(itv.start)
-        b = _time_to_minutes(itv.end)
-        if a <= s and e <= b:
-            return True
-    return False
-
-
-def _ledger_range_from_intervals(intervals: list[TimeInterval]) -> tuple[time, time]:
-    """
-    台帳の表示レンジ（最小start〜最大end）
-    intervals が無い場合は 11-23 を返す
-    """
-    if not intervals:
-        return time(11, 0), time(23, 0)
-    start = min(i.start for i in intervals)
-    end = max(i.end for i in intervals)
-    if _time_to_minutes(end) <= _time_to_minutes(start):
-        return time(11, 0), time(23, 0)
-    return start, end
-
-
 def _build_time_labels(day_start: time, day_end: time, step_min: int = 30) -> list[str]:
     """
     例: 11:00〜23:00 を 30分刻みで ['11:00','11:30',...,'22:30','23:00']
     """
-    a = _time_to_minutes(day_start)
-    b = _time_to_minutes(day_end)
+    a = time_to_minutes(day_start)
+    b = time_to_minutes(day_end)
     if b <= a:
         return ["11:00", "23:00"]
 
@@ -235,21 +154,20 @@ def _build_day_bars_and_closed_bands(
     - bars は表示レンジにクリップして left/width を計算
     - 中休み帯は closed_bands（left_pct/width_pct）で返す
     """
-    intervals = _get_store_intervals(store)
-    day_start, day_end = _ledger_range_from_intervals(intervals)
+    schedule = StoreSchedule.for_store(store)
+    day_start, day_end = schedule.ledger_range()
 
-    start_min = _time_to_minutes(day_start)
-    end_min = _time_to_minutes(day_end)
+    start_min = time_to_minutes(day_start)
+    end_min = time_to_minutes(day_end)
     span = max(1, end_min - start_min)
 
     time_labels = _build_time_labels(day_start, day_end, step_min=step_min)
 
     # 中休み帯（営業時間レンジ基準）
-    closed_ranges = _build_closed_ranges(intervals)
     closed_bands: list[dict[str, float]] = []
-    for itv in closed_ranges:
-        left = (_time_to_minutes(itv.start) - start_min) / span * 100.0
-        width = (_time_to_minutes(itv.end) - _time_to_minutes(itv.start)) / span * 100.0
+    for itv in schedule.closed_ranges:
+        left = (time_to_minutes(itv.start) - start_min) / span * 100.0
+        width = (time_to_minutes(itv.end) - time_to_minutes(itv.start)) / span * 100.0
         if width > 0:
             closed_bands.append({"left_pct": left, "width_pct": width})
 
@@ -262,8 +180,8 @@ def _build_day_bars_and_closed_bands(
         if not isinstance(st, time) or not isinstance(ed, time):
             continue
 
-        st_min = _time_to_minutes(st)
-        ed_min = _time_to_minutes(ed)
+        st_min = time_to_minutes(st)
+        ed_min = time_to_minutes(ed)
 
         # 日跨ぎは当日表示では末尾までに丸める（表示だけの措置）
         if ed_min <= st_min:
@@ -289,7 +207,7 @@ def _build_day_bars_and_closed_bands(
                 reservation_id=r.id,
                 title=booking_name,
                 start=st,
-                end=_minutes_to_time(ed_min),
+                end=minutes_to_time(ed_min),
                 left_pct=left,
                 width_pct=width,
                 visit_count=int(getattr(r, "visit_count", 0) or 0),
@@ -318,7 +236,7 @@ def _assign_bars_to_fixed_lanes(
     lane_bars: list[list[LedgerBar]] = [[] for _ in range(lane_count)]
 
     def to_min(t: time) -> int:
-        return _time_to_minutes(t)
+        return time_to_minutes(t)
 
     bars_sorted = sorted(bars, key=lambda b: (to_min(b.start), to_min(b.end), b.reservation_id))
 
@@ -518,17 +436,17 @@ class store_reservation_editView(StoreLoginRequiredMixin, TemplateView):
             else:
                 # 既存通り：終了時刻の手入力
                 new_end = time.fromisoformat(end_time_s)
-                if _time_to_minutes(new_end) <= _time_to_minutes(new_start):
+                if time_to_minutes(new_end) <= time_to_minutes(new_start):
                     raise ValueError("終了時刻は開始時刻より後にしてください。")
 
                 # コース文字列は「変更しない」（現状維持）
                 new_course = None  # type: ignore[assignment]
 
             # ★営業時間チェック（中休み跨ぎも弾く）
-            intervals = _get_store_intervals(store)
-            if not intervals:
+            schedule = StoreSchedule.for_store(store)
+            if not schedule:
                 raise ValueError("営業時間が未設定のため更新できません。")
-            if not _is_inside_one_interval(new_start, new_end, intervals):
+            if not schedule.contains(new_start, new_end):
                 raise ValueError("営業時間外、または中休みをまたぐ時間帯は設定できません。")
 
             # ステータスIDが来ている場合のみ更新
@@ -699,13 +617,12 @@ class store_reservation_calendarView(StoreLoginRequiredMixin, TemplateView):
         )
         daily = {row["visit_date"]: {"groups": row["groups"], "people": int(row["people"] or 0)} for row in qs}
 
-        online_qs = (
-            StoreOnlineReservation.objects.filter(store=store, date__gte=month_start, date__lt=month_end)
-            .values("date", "booking_status", "available_seats")
-        )
+        # 既定ルール＋上書き（行の無い日も既定ルールで表示する）
         online = {
-            row["date"]: {"is_open": bool(row["booking_status"]), "available_seats": int(row["available_seats"] or 0)}
-            for row in online_qs
+            d: {"is_open": setting.booking_status, "available_seats": setting.available_seats}
+            for d, setting in availability.get_range_settings(
+                store, month_start, month_end - timedelta(days=1)
+            ).items()
         }
 
         today = timezone.localdate()
@@ -749,13 +666,12 @@ class store_reservation_settingsView(StoreLoginRequiredMixin, TemplateView):
         weeks = _build_month_weeks(year, month)
         month_start, month_end = _month_range(year, month)
 
-        online_qs = (
-            StoreOnlineReservation.objects.filter(store=store, date__gte=month_start, date__lt=month_end)
-            .values("date", "booking_status", "available_seats")
-        )
+        # 既定ルール＋上書き（行の無い日も既定ルールで表示する）
         online = {
-            row["date"]: {"is_open": bool(row["booking_status"]), "available_seats": int(row["available_seats"] or 0)}
-            for row in online_qs
+            d: {"is_open": setting.booking_status, "available_seats": setting.available_seats}
+            for d, setting in availability.get_range_settings(
+                store, month_start, month_end - timedelta(days=1)
+            ).items()
         }
 
         today = timezone.localdate()
@@ -776,10 +692,29 @@ class store_reservation_settingsView(StoreLoginRequiredMixin, TemplateView):
                 "next_month": next_month,
                 "online": online,
                 "closed_days": set(),
+                **self._rule_context(store),
             }
         )
         return ctx
 
+    @staticmethod
+    def _rule_context(store) -> dict[str, Any]:
+        """
+        既定ルールのフォーム用（曜日のチェック・席数。席数 0 / 未入力は店舗の席数）
+        """
+        rule = availability.get_rule(store)
+        row = StoreReservationRule.objects.filter(store_id=store.pk).values_list("available_seats", flat=True).first()
+        labels = ("月", "火", "水", "木", "金", "土", "日")
+        return {
+            "rule_weekdays": [
+                {"value": i, "label": label, "checked": bool(rule.open_weekdays >> i & 1)}
+                for i, label in enumerate(labels)
+            ],
+            "rule_seats": row or "",
+            "rule_is_set": row is not None,
+            "store_default_seats": availability.default_available_seats(store),
+        }
+
     def post(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
         store = _get_store_from_user(request)
 
@@ -788,22 +723,33 @@ class store_reservation_settingsView(StoreLoginRequiredMixin, TemplateView):
 
         action = request.POST.get("action", "")
 
-        # ★表示中の月を一括で「受付中」
+        # ★表示中の月を一括で「受付中」（ルールが無ければ全曜日受付の既定ルールを作る）
         if action == "bulk_open":
-            default_seats = int(getattr(store, "seats", 0) or 0)
-
-            d = month_start
-            while d < month_end:
-                StoreOnlineReservation.objects.update_or_create(
-                    store=store,
-                    date=d,
-                    defaults={"booking_status": True, "available_seats": default_seats},
-                )
-                d += timedelta(days=1)
+            availability.open_range(store, month_start, month_end)
 
             messages.success(request, f"{year}年{month}月をすべて『受付中』にしました。")
             return redirect(f"{reverse('reservations_management:store_reservation_settings')}?year={year}&month={month}")
 
+        # ★既定ルール（受付する曜日・席数）
+        if action == "save_rule":
+            open_weekdays = 0
+            for value in request.POST.getlist("open_weekdays"):
+                if value.isdigit() and int(value) < 7:
+                    open_weekdays |= 1 << int(value)
+            rule_seats_str = (request.POST.get("rule_seats") or "").strip()
+            try:
+                rule_seats = int(rule_seats_str or 0)
+            except ValueError:
+                messages.error(request, "席数は数字で入力してください。")
+                return redirect(f"{reverse('reservations_management:store_reservation_settings')}?year={year}&month={month}")
+            if rule_seats < 0:
+                messages.error(request, "席数は0以上で入力してください。")
+                return redirect(f"{reverse('reservations_management:store_reservation_settings')}?year={year}&month={month}")
+
+            availability.set_rule(store, open_weekdays, rule_seats)
+            messages.success(request, "既定の受付ルールを保存しました。")
+            return redirect(f"{reverse('reservations_management:store_reservation_settings')}?year={year}&month={month}")
+
         # 既存：日別設定
         date_str = request.POST.get("date", "")
         day_type = request.POST.get("day_type", "open")
@@ -837,11 +783,7 @@ class store_reservation_settingsView(StoreLoginRequiredMixin, TemplateView):
                 messages.error(request, "空き席数は0以上で入力してください。")
                 return redirect(f"{reverse('reservations_management:store_reservation_settings')}?year={year}&month={month}")
 
-        StoreOnlineReservation.objects.update_or_create(
-            store=store,
-            date=target_date,
-            defaults={"booking_status": is_open, "available_seats": available_seats},
-        )
+        availability.set_day_setting(store, target_date, is_open, available_seats)
         messages.success(request, f"{target_date} の設定を保存しました。")
         return redirect(f"{reverse('reservations_management:store_reservation_settings')}?year={year}&month={month}")
     
@@ -1,3 +1,122 @@
-from django.test import TestCase
+from datetime import date, timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from commons.models import (
+    AccountType, AgeGroup, Area, CustomerAccount, Gender, Review, ReviewPhoto, Scene, Store,
+)
+
+# クエリ数を数えるテストでは、キャッシュの読み書き（DatabaseCache）を数に入れない
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StoreReviewPageTest(TestCase):
+    def setUp(self):
+        # マスタデータ作成
+        area = Area.objects.create(area_name="テストエリア")
+        scene = Scene.objects.create(scene_name="テストシーン")
+        self.store = Store.objects.create(store_name="店舗A", area=area, scene=scene, seats=10, budget=1000)
+        self.customer = CustomerAccount.objects.create(
+            username="alice@example.com",
+            email="alice@example.com",
+            account_type=AccountType.objects.create(account_type="顧客"),
+            nickname="alice",
+            age_group=AgeGroup.objects.create(age_range="20代"),
+            gender=Gender.objects.create(gender="男性"),
+            birth_date=date(1990, 1, 1),
+        )
+
+        # 同じ投稿日時の口コミを混ぜる（id で順序が決まるか）
+        base = timezone.now()
+        for i in range(45):
+            review = Review.objects.create(
+                reviewer=self.customer, store=self.store, score=4, review_text=f"review {i}",
+            )
+            Review.objects.filter(pk=review.pk).update(posted_at=base - timedelta(minutes=i // 3))
+            ReviewPhoto.objects.create(review=review, image_path=f"review/photos/{i}.jpg")
+
+    def _get(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("reviews:store_review_page", args=[self.store.pk]), params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_cursor_pages_cover_all_reviews_in_order(self):
+        """カーソルで全件を重複なく新着順に辿れ、どのページもクエリ数が同じか"""
+        seen = []
+        query_counts = []
+        cursor = ""
+        while True:
+            response, queries = self._get(cursor=cursor)
+            data = response.json()
+            seen.extend(r["id"] for r in data["reviews"])
+            query_counts.append(queries)
+            self.assertEqual(len(data["reviews"][0]["photos"]), 1)
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+
+        expected = list(Review.objects.order_by("-posted_at", "-id").values_list("pk", flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(query_counts), 3)
+        self.assertEqual(len(set(query_counts)), 1)
+
+    def test_html_fragment_and_invalid_cursor(self):
+        """HTML 断片・一覧画面は最初の20件と次のカーソルを返し、不正なカーソルは 400 になるか"""
+        response, _ = self._get(format="html")
+        self.assertContains(response, 'class="review-card"', count=20)
+        self.assertTrue(response["X-Next-Cursor"])
+
+        response = self.client.get(reverse("reviews:store_review_page", args=[self.store.pk]), {"cursor": "???"})
+        self.assertEqual(response.status_code, 400)
+
+        # 一覧画面は最初のページだけ描画し、続きのカーソルを埋め込む
+        response = self.client.get(reverse("reviews:customer_review_list"), {"store_id": self.store.pk})
+        self.assertContains(response, 'class="review-card"', count=20)
+        self.assertContains(response, 'id="reviewMore"')
+
+    def test_cards_serve_webp_derivatives(self):
+        """派生画像のある写真は WebP の <source> と srcset 付きで出るか"""
+        from commons.models import ImageDerivative
+
+        newest = Review.objects.order_by("-posted_at", "-id").first()
+        source = newest.photos.get().image_path.name
+        ImageDerivative.objects.create(
+            source=source,
+            content_hash="ab" * 32,
+            width=1600,
+            height=1200,
+            variants={
+                size: {"width": width, "height": width * 3 // 4, "webp": f"derived/ab/{size}.webp", "jpg": f"derived/ab/{size}.jpg"}
+                for size, width in (("thumb", 160), ("card", 320), ("full", 1280))
+            },
+        )
+        cache.clear()
+
+        response = self.client.get(
+            reverse("reviews:store_review_page", args=[self.store.pk]), {"format": "html"}
+        )
+        self.assertContains(response, '<source type="image/webp" srcset="/media/derived/ab/thumb.webp 160w', count=1)
+        self.assertContains(response, 'class="review-photo"', count=20)
+
+    def test_lists_mark_reviews_liked_by_viewer(self):
+        """口コミ一覧・レビュアーの口コミ一覧で、閲覧者がいいね済みの口コミだけ is-active になるか"""
+        from commons import likes
+
+        # 前のテストで同じ ID の閲覧者のいいね済み判定が残っていることがある
+        cache.clear()
+        newest = Review.objects.order_by("-posted_at", "-id").first()
+        likes.toggle(newest.pk, self.customer.pk)
+        self.client.force_login(self.customer)
+
+        response = self.client.get(reverse("reviews:customer_review_list"), {"store_id": self.store.pk})
+        self.assertContains(response, "btn-like is-active", count=1)
+
+        response = self.client.get(reverse("reviews:customer_reviewer_review_list"))
+        self.assertContains(response, "btn-like is-active", count=1)
@@ -10,6 +10,12 @@ urlpatterns = [
         name="customer_review_list",
     ),
     
+    path(
+        "store/<int:store_id>/reviews/",
+        store_review_pageView.as_view(),
+        name="store_review_page",
+    ),
+
     path("customer_store_preserve/", 
          customer_store_preserveView.as_view(), 
          name="customer_store_preserve"),
@@ -16,6 +16,7 @@ from django.views import View
 from django.views.generic import ListView
 from django.views.generic.base import TemplateView
 
+from commons import fulltext, images, keyset, likes, reviewer_stats, uploads
 from commons.models import (
     CustomerAccount,
     Store,
@@ -23,15 +24,43 @@ from commons.models import (
     Reservation,
     ReservationStatus,
     Review,
-    ReviewPhoto,
     ReviewReport,
     StoreInfoReport,
     StoreInfoReportPhoto,
-    Follow,
     Genre,
+    ImageUpload,
 )
 
 
+def store_review_queryset(store, review_keyword=""):
+    """
+    店舗の口コミ（投稿者・写真はまとめて引く）。review_keyword があれば本文で絞る
+    """
+    queryset = (
+        Review.objects
+        .filter(store=store)
+        .select_related("reviewer")
+        .prefetch_related("photos")
+    )
+    if review_keyword:
+        # 全文検索索引で絞る（短いキーワードは部分一致）
+        matched_reviews = fulltext.search_reviews(queryset, review_keyword)
+        if matched_reviews is not None:
+            return matched_reviews
+        queryset = queryset.filter(review_text__icontains=review_keyword)
+    return queryset
+
+
+def store_review_page(queryset, cursor=None):
+    """
+    新着順の1ページ分（キーセット方式）と次のカーソル。写真の縮小版の URL もまとめて引いておく
+    不正なカーソルは ValueError
+    """
+    rows, next_cursor = keyset.page(queryset, cursor)
+    images.variants_for(photo.image_path for review in rows for photo in review.photos.all())
+    return rows, next_cursor
+
+
 class customer_review_listView(View):
     """
     口コミ一覧（誰でも閲覧OK）
@@ -75,29 +104,25 @@ class customer_review_listView(View):
         customer = self._get_login_customer(request)
         store = self._get_store(request)
 
-        store_reviews = Review.objects.none()
+        store_reviews = []
+        next_cursor = None
         avg_rating = 0.0
         review_count = 0
+        review_total = 0
         star_states = ["empty"] * 5
 
         if store:
-            store_reviews = (
-                Review.objects
-                .select_related("reviewer")
-                .filter(store=store)
-                .order_by("-posted_at")
-            )
-
             # 加重平均を含む評価情報の取得
             rating_ctx = store.get_weighted_rating_context()
             avg_rating = rating_ctx["avg_rating"]
             review_count = rating_ctx["review_count"]
             star_states = rating_ctx["star_states"]
 
-            # ★ キーワード検索（本文・タイトル）
+            # 最初のページだけ描画し、続きは store_review_page から無限スクロールで読む
             review_keyword = request.GET.get("review_keyword", "").strip()
-            if review_keyword:
-                store_reviews = store_reviews.filter(review_text__icontains=review_keyword)
+            queryset = store_review_queryset(store, review_keyword)
+            store_reviews, next_cursor = store_review_page(queryset)
+            review_total = queryset.count() if review_keyword else review_count
 
         # 保存済み判定（ログイン時のみ）
         is_saved = False
@@ -121,6 +146,9 @@ class customer_review_listView(View):
 
             # 一覧用
             "reviews": store_reviews,
+            "next_cursor": next_cursor,
+            "review_total": review_total,
+            **likes.liked_context(request.user, store_reviews),
             "customer": customer,
             "store_id": store.pk if store else "",
             # 共通ヘッダーのタブ制御を使っているなら渡す
@@ -246,15 +274,21 @@ class customer_review_listView(View):
             )
 
             files = request.FILES.getlist('photos')
-            
-            # 最大5枚まで保存する
+
+            # 最大5枚まで受け付ける（検証・保存はコミット後にワーカーが行う）
+            skipped = 0
             for f in files[:5]:
-                ReviewPhoto.objects.create(
-                    review=review_obj, # さっき作った口コミと紐付け
-                    image_path=f        # commons/models.pyのフィールド名に合わせる
-                )
+                try:
+                    uploads.stage(f, ImageUpload.KIND_REVIEW_PHOTO, uploaded_by=request.user, review=review_obj)
+                except ValueError:
+                    skipped += 1
 
-            messages.success(request, "口コミを投稿しました。")
+            if files:
+                messages.success(request, "口コミを投稿しました。写真は処理が終わりしだい表示されます。")
+            else:
+                messages.success(request, "口コミを投稿しました。")
+            if skipped:
+                messages.error(request, f"写真 {skipped} 枚はサイズが大きすぎるため投稿できませんでした。")
 
             params = {
                 "store_id": store.pk,
@@ -271,6 +305,53 @@ class customer_review_listView(View):
         return redirect(reverse("reviews:customer_review_list"))
 
 
+class store_review_pageView(View):
+    """
+    店舗の口コミの続き（無限スクロール用、誰でも閲覧OK）
+    - ?cursor= 前のページの next_cursor（無ければ最初のページ）
+    - ?format=html なら口コミカードの HTML 断片（次のカーソルは X-Next-Cursor ヘッダ）
+      それ以外は JSON：{"reviews": [...], "next_cursor": ...}
+    """
+    def get(self, request, store_id, *args, **kwargs):
+        store = get_object_or_404(Store.objects.only("pk"), pk=store_id)
+        queryset = store_review_queryset(store, request.GET.get("review_keyword", "").strip())
+
+        try:
+            rows, next_cursor = store_review_page(queryset, request.GET.get("cursor") or None)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        liked_ids = likes.liked_by(request.user, (review.pk for review in rows))
+
+        if request.GET.get("format") == "html":
+            response = render(request, "reviews/_review_cards.html", {"reviews": rows, "liked_review_ids": liked_ids})
+            response["X-Next-Cursor"] = next_cursor or ""
+            return response
+
+        return JsonResponse({
+            "reviews": [
+                {
+                    "id": review.pk,
+                    "reviewer": {"id": review.reviewer_id, "nickname": review.reviewer.nickname},
+                    "score": review.score,
+                    "review_text": review.review_text,
+                    "like_count": review.like_count,
+                    "liked": review.pk in liked_ids,
+                    "posted_at": review.posted_at.isoformat(),
+                    "photos": [
+                        {
+                            "url": photo.image_path.url,
+                            "thumb_url": images.url(photo.image_path, "thumb"),
+                        }
+                        for photo in review.photos.all() if photo.image_path
+                    ],
+                }
+                for review in rows
+            ],
+            "next_cursor": next_cursor,
+        })
+
+
 class customer_store_preserveView(LoginRequiredMixin, View):
     template_name = "reviews/customer_store_preserve.html"
 
@@ -402,24 +483,14 @@ class customer_reviewer_detailView(LoginRequiredMixin, View):
         cover_field = getattr(customer, "cover_image", None)
         icon_field = getattr(customer, "icon_image", None)
 
-        count_reviews = Review.objects.filter(reviewer=customer).count()
-        count_following = Follow.objects.filter(follower=customer).count()
-        count_followers = Follow.objects.filter(followee=customer).count()
-
         context = {
             "customer": customer,
             "user_name": customer.nickname or request.user.username,
             "cover_image_url": cover_field.url if cover_field else "",
             "user_icon_url": icon_field.url if icon_field else "",
 
-            "stats_reviews": count_reviews,
-            "stats_photos": ReviewPhoto.objects.filter(review__reviewer=customer).count(),
-            "stats_visitors": 0,
-            "stats_likes": getattr(customer, "total_likes", 0),
-
-            "count_reviews": count_reviews,
-            "count_following": count_following,
-            "count_followers": count_followers,
+            # counts / stats（顧客のカウンタ列から）
+            **reviewer_stats.profile_context(customer),
 
             "latest_reviews": Review.objects.filter(reviewer=customer).order_by("-posted_at")[:3],
         }
@@ -491,7 +562,7 @@ class customer_reviewer_review_listView(LoginRequiredMixin, View):
         if max_budget and max_budget.isdigit():
             my_reviews_qs = my_reviews_qs.filter(store__budget__lte=int(max_budget))
 
-        my_reviews = my_reviews_qs.order_by("-posted_at")
+        my_reviews = list(my_reviews_qs.order_by("-posted_at"))
 
         reviewed_store_rows = (
             Review.objects
@@ -519,7 +590,8 @@ class customer_reviewer_review_listView(LoginRequiredMixin, View):
             "reviewed_total": reviewed_store_rows.count(),
 
             "my_reviews": my_reviews,
-            "my_reviews_total": my_reviews.count(),
+            "my_reviews_total": len(my_reviews),
+            **likes.liked_context(request.user, my_reviews),
 
             "store_choices": store_choices,
             "genres": genres,
@@ -791,6 +863,7 @@ class company_review_listView(TemplateView):
 
         context["reviews"] = reviews_page
         context["reported_review_ids"] = reported_review_ids
+        context.update(likes.liked_context(self.request.user, reviews_page))
         context["only_reported"] = only_reported
         context["query"] = query
         return context
@@ -912,22 +985,12 @@ def toggle_review_like(request, pk):
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'login_required'}, status=403)
 
-    review = get_object_or_404(Review, pk=pk)
-    user = request.user
-
-    # 🌟 すでに「いいね」リストの中に自分がいるか判定
-    if user in review.liked_users.all():
-        review.liked_users.remove(user) # リストから削除
-        liked = False
-    else:
-        review.liked_users.add(user) # リストに追加
-        liked = True
+    review = get_object_or_404(Review.objects.only("pk"), pk=pk)
 
-    # 🌟 数のカウントを更新して保存
-    review.like_count = review.liked_users.count()
-    review.save()
+    # いいねの行の有無だけ見て切り替え、いいね数は差分で更新（commons.likes）
+    liked, total_likes = likes.toggle(review.pk, request.user.pk)
 
     return JsonResponse({
         'liked': liked,
-        'total_likes': review.like_count
+        'total_likes': total_likes
     })
\ No newline at end of file
@@ -1,8 +1,16 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.test import TestCase, override_settings
 from django.urls import reverse
-from commons.models import Store, Area, Scene
+from commons import fulltext, geo, page_cache
+from commons.models import Store, Area, Scene, StoreRatingSummary
 from datetime import time
 
+# クエリ数を数えるテストでは、キャッシュの読み書き（DatabaseCache）を数に入れない
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
 class SearchTimeFilterTest(TestCase):
     def setUp(self):
         # マスタデータ作成
@@ -62,3 +70,188 @@ class SearchTimeFilterTest(TestCase):
         response = self.client.get(reverse('search:customer_search_list'), {'time': '06:00'})
         self.assertNotContains(response, self.store_normal.store_name)
         self.assertNotContains(response, self.store_midnight.store_name)
+
+
+class SearchAvailabilityCalendarTest(TestCase):
+    def setUp(self):
+        self.area = Area.objects.create(area_name="テストエリア")
+        self.scene = Scene.objects.create(scene_name="テストシーン")
+        # ID209-390 は既定で受付中
+        self.store = Store.objects.create(
+            id=209,
+            store_name="自動予約店",
+            area=self.area,
+            scene=self.scene,
+            seats=10,
+            budget=1000,
+        )
+
+    def test_calendar_uses_virtual_defaults_without_writes(self):
+        """既定で受付中の店舗は行を作らずに○になり、店舗が閉じた日だけ×になるか"""
+        from datetime import date, timedelta
+        from commons.models import StoreOnlineReservation
+
+        base = date.today() + timedelta(days=1)
+        closed_day = base + timedelta(days=3)
+        StoreOnlineReservation.objects.create(store=self.store, date=closed_day, booking_status=False)
+
+        response = self.client.get(reverse('search:customer_search_list'), {'date': base.isoformat()})
+        store = next(s for s in response.context["stores"] if s.pk == self.store.pk)
+
+        flags = {cell["date"]: cell["is_open"] for cell in store.calendar_12}
+        self.assertEqual(len(flags), 12)
+        self.assertFalse(flags[closed_day])
+        self.assertEqual(sum(flags.values()), 11)
+        self.assertEqual(StoreOnlineReservation.objects.count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchResultCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.area = Area.objects.create(area_name="テストエリア")
+        self.scene = Scene.objects.create(scene_name="テストシーン")
+        self.stores = [
+            Store.objects.create(
+                store_name=f"検索店{i:02d}", area=self.area, scene=self.scene, seats=10, budget=1000,
+            )
+            for i in range(12)
+        ]
+
+    def test_pages_slice_cached_id_list(self):
+        """2回目以降は ID 列をキャッシュから使い、ページは主キーで引くだけか"""
+        url = reverse('search:customer_search_list')
+        first = self.client.get(url, {'keyword': '検索店', 'page': 1})
+        self.assertEqual([s.pk for s in first.context["stores"]], [s.pk for s in self.stores[:5]])
+        self.assertEqual(first.context["stores"].paginator.count, 12)
+
+        # 件数・並び順の集計はせず、ページ分の店舗を主キーで引く（店舗・サムネ・受付ルール・受付日）
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'keyword': '検索店', 'page': 3})
+        self.assertContains(response, "検索店10")
+        self.assertNotContains(response, "検索店04")
+
+        # 店舗が増えるとキャッシュが無効になる
+        Store.objects.create(store_name="検索店12", area=self.area, scene=self.scene, seats=10, budget=1000)
+        response = self.client.get(url, {'keyword': '検索店', 'page': 3})
+        self.assertEqual(response.context["stores"].paginator.count, 13)
+
+    @override_settings(SEARCH_CACHE_MAX_IDS=6)
+    def test_pages_beyond_cached_ids_follow_sort_order(self):
+        """キャッシュする ID は上限まで。その先のページも並び順どおりに続きから引けるか"""
+        for i, store in enumerate(self.stores):
+            StoreRatingSummary.objects.update_or_create(
+                store=store,
+                defaults={"review_count": i % 4, "weighted_avg_rating": None if i % 5 == 0 else (i % 3) + 1.5},
+            )
+        url = reverse('search:customer_search_list')
+
+        for sort in ("", "rating", "reviews"):
+            cache.clear()
+            expected = list(
+                Store.objects.order_by(*{
+                    "": ("id",),
+                    "rating": (F("rating_summary__weighted_avg_rating").desc(nulls_last=True), "id"),
+                    "reviews": (Coalesce(F("rating_summary__review_count"), 0).desc(), "id"),
+                }[sort]).values_list("pk", flat=True)
+            )
+            seen = []
+            for page in (1, 2, 3):
+                response = self.client.get(url, {'sort': sort, 'page': page})
+                self.assertEqual(response.context["stores"].paginator.count, 12)
+                seen += [s.pk for s in response.context["stores"]]
+            self.assertEqual(seen, expected, sort)
+
+            ids = page_cache.cached_ids(page_cache.STORE_SEARCH, {"sort": sort, "people": 0}, Store.objects.all())
+            self.assertEqual(ids.head, expected[:6])
+
+
+class FullTextSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.area = Area.objects.create(area_name="テストエリア")
+        self.scene = Scene.objects.create(scene_name="テストシーン")
+        self.yakitori = Store.objects.create(
+            store_name="炭火焼き鳥とりまる", genre="焼き鳥", address="東京都渋谷区",
+            area=self.area, scene=self.scene, seats=10, budget=1000,
+        )
+        self.ramen = Store.objects.create(
+            store_name="麺屋こはく", genre="ラーメン", address="東京都新宿区",
+            area=self.area, scene=self.scene, seats=10, budget=1000,
+        )
+
+    def _search_ids(self, keyword):
+        response = self.client.get(reverse('search:customer_search_list'), {'keyword': keyword})
+        return [s.pk for s in response.context["stores"]]
+
+    def test_index_follows_store_and_scene_changes(self):
+        """保存・削除・シーン名変更が索引に反映され、icontains と同じ店舗が引けるか"""
+        self.assertEqual(self._search_ids("焼き鳥"), [self.yakitori.pk])
+        self.assertEqual(
+            list(fulltext.search_stores(Store.objects.order_by("id"), "東京都").values_list("pk", flat=True)),
+            [self.yakitori.pk, self.ramen.pk],
+        )
+
+        self.ramen.genre = "焼き鳥・ラーメン"
+        self.ramen.save()
+        self.assertEqual(sorted(self._search_ids("焼き鳥")), [self.yakitori.pk, self.ramen.pk])
+
+        self.scene.scene_name = "深夜ひとり飲み"
+        self.scene.save()
+        self.assertEqual(sorted(self._search_ids("ひとり飲み")), [self.yakitori.pk, self.ramen.pk])
+
+        self.yakitori.delete()
+        self.assertEqual(self._search_ids("焼き鳥"), [self.ramen.pk])
+
+    def test_short_keyword_falls_back_to_icontains(self):
+        """trigram で引けない2文字のキーワードは部分一致で探す"""
+        self.assertIsNone(fulltext.search_stores(Store.objects.all(), "麺屋"))
+        self.assertEqual(self._search_ids("麺屋"), [self.ramen.pk])
+
+
+class NearbySearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.area = Area.objects.create(area_name="テストエリア")
+        self.scene = Scene.objects.create(scene_name="テストシーン")
+        self.other_scene = Scene.objects.create(scene_name="別シーン")
+        # 東京駅（35.6812, 139.7671）からの距離：約0.9km / 約0.3km / 約1.8km（別シーン） / 約4.5km
+        self.mid = self._store("中間", 35.6812, 139.7771)
+        self.near = self._store("近い", 35.6839, 139.7671)
+        self.other = self._store("別シーン", 35.6812, 139.7871, scene=self.other_scene)
+        self.far = self._store("遠い", 35.7217, 139.7671)
+
+    def _store(self, name, lat, lng, scene=None):
+        return Store.objects.create(
+            store_name=name, area=self.area, scene=scene or self.scene, seats=10, budget=1000,
+            latitude=lat, longitude=lng,
+        )
+
+    def _search(self, **params):
+        response = self.client.get(
+            reverse('search:customer_search_list'), {'lat': '35.6812', 'lng': '139.7671', **params}
+        )
+        return response.context["stores"]
+
+    def test_radius_filter_and_distance_sort(self):
+        """半径内の店舗だけを近い順に返し、シーン条件とも組み合わせられるか"""
+        stores = self._search(radius_km='2')
+        self.assertEqual([s.pk for s in stores], [self.near.pk, self.mid.pk, self.other.pk])
+        self.assertAlmostEqual(stores[0].distance_km, 0.30, places=1)
+
+        stores = self._search(radius_km='2', scene=str(self.scene.pk))
+        self.assertEqual([s.pk for s in stores], [self.near.pk, self.mid.pk])
+
+        # 並び順の指定がある場合は半径で絞るだけ
+        stores = self._search(radius_km='5', sort='reviews')
+        self.assertEqual([s.pk for s in stores], [self.mid.pk, self.near.pk, self.other.pk, self.far.pk])
+
+    def test_candidates_match_full_scan(self):
+        """矩形で候補を引いてから絞った結果が、全店舗の距離計算と同じか"""
+        for radius_km in (0.5, 1.0, 1.85, 4.6):
+            expected = sorted(
+                s.pk for s in Store.objects.all()
+                if geo.distance_km(35.6812, 139.7671, s.latitude, s.longitude) <= radius_km
+            )
+            found = sorted(pk for pk, _ in geo.within_radius(Store.objects.all(), 35.6812, 139.7671, radius_km))
+            self.assertEqual(found, expected)
@@ -1,90 +1,25 @@
 # search/views.py
 from __future__ import annotations
 
+import math
 from datetime import date, datetime, timedelta
 
 from django.conf import settings
 from django.core.paginator import Paginator
-from django.db.models import Avg, Count, F, Q
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
 from django.shortcuts import render
 from django.db import models
 
+from commons import fulltext, geo, images, page_cache
+from commons.availability import AvailabilityWindow, is_default_open_store
+from commons.follow_graph import FollowGraph
 from commons.models import (
     Store,
     StoreAccount,
     StoreImage,
-    StoreOnlineReservation,
 )
 
-# ============================================================
-# ★追加：ID209〜390は「店舗アカウント無しでも」ネット予約を有効化
-# （今後範囲が増えるならここだけ触ればOK）
-# ============================================================
-AUTO_RESERVATION_STORE_ID_MIN = 209
-AUTO_RESERVATION_STORE_ID_MAX = 390
-
-
-def _is_auto_reservation_store_id(store_id: int) -> bool:
-    try:
-        sid = int(store_id or 0)
-    except Exception:
-        sid = 0
-    return AUTO_RESERVATION_STORE_ID_MIN <= sid <= AUTO_RESERVATION_STORE_ID_MAX
-
-
-def _default_available_seats(store: Store) -> int:
-    seats = int(getattr(store, "seats", 0) or 0)
-    return seats if seats > 0 else 999
-
-
-def _ensure_online_settings_for_12days(stores_page, date_list: list[date]) -> int:
-    """
-    検索一覧で表示する12日分について、
-    ID209-390 の店は StoreOnlineReservation が無ければ自動で作る（○扱いにする）
-    戻り値: 作成件数
-    """
-    # 対象storeを抽出（ページ内のみ）
-    targets = []
-    for s in stores_page:
-        if _is_auto_reservation_store_id(getattr(s, "id", 0)):
-            targets.append(s)
-
-    if not targets or not date_list:
-        return 0
-
-    store_ids = [s.id for s in targets]
-    start = date_list[0]
-    end = date_list[-1]
-
-    # 既存を取得（該当範囲）
-    existing_pairs = set(
-        StoreOnlineReservation.objects.filter(
-            store_id__in=store_ids,
-            date__range=(start, end),
-        ).values_list("store_id", "date")
-    )
-
-    to_create = []
-    for s in targets:
-        for d in date_list:
-            if (s.id, d) in existing_pairs:
-                continue
-            to_create.append(
-                StoreOnlineReservation(
-                    store=s,
-                    date=d,
-                    booking_status=True,
-                    available_seats=_default_available_seats(s),
-                )
-            )
-
-    if not to_create:
-        return 0
-
-    # UniqueConstraint( store, date ) がある前提なので ignore_conflicts=True で安全に
-    StoreOnlineReservation.objects.bulk_create(to_create, ignore_conflicts=True)
-    return len(to_create)
-
 
 # =====================================================
 # ジャンル一覧（画像つき）
@@ -206,6 +141,35 @@ def genre_list(request):
 # =====================================================
 # 検索結果（店舗一覧）
 # =====================================================
+def _stores_after(store_qs, sort_key, last_pk):
+    """
+    並び順のキー（評価・口コミ数・ID）で last_pk の店舗より後ろに絞る
+    （キャッシュした ID 列より先のページ用。並び順は store_qs のまま）
+    """
+    if sort_key == "rating":
+        field = "rating_summary__weighted_avg_rating"
+        value = Store.objects.filter(pk=last_pk).values_list(field, flat=True).first()
+        if value is None:
+            return store_qs.filter(**{f"{field}__isnull": True}, id__gt=last_pk)
+        return store_qs.filter(
+            Q(**{f"{field}__lt": value})
+            | Q(**{field: value}, id__gt=last_pk)
+            | Q(**{f"{field}__isnull": True})
+        )
+    if sort_key == "reviews":
+        reviews = Coalesce(F("rating_summary__review_count"), 0)
+        value = (
+            Store.objects.filter(pk=last_pk)
+            .annotate(review_total=reviews)
+            .values_list("review_total", flat=True)
+            .first()
+        )
+        return store_qs.alias(review_total=reviews).filter(
+            Q(review_total__lt=value or 0) | Q(review_total=value or 0, id__gt=last_pk)
+        )
+    return store_qs.filter(id__gt=last_pk)
+
+
 def customer_search_listView(request):
     # ---------- 検索条件 ----------
     area_name = (request.GET.get("area") or "").strip()
@@ -233,34 +197,35 @@ def customer_search_listView(request):
 
     date_list = [base_date + timedelta(days=i) for i in range(12)]
 
-    # 加重平均の重み計算式（シグナル/モデルメソッドと同期）
-    weight_expr = models.ExpressionWrapper(
-        (models.F("review__reviewer__trust_score") / 10.0) * 
-        ((1.0 + models.F("review__like_count") / 5.0) * (1.0 + models.F("review__like_count") / 5.0) * (1.0 + models.F("review__like_count") / 5.0)) * 
-        (1.0 + models.F("review__reviewer__follower_count") / 10.0),
-        output_field=models.FloatField()
-    )
+    # 現在地からの半径検索（lat / lng / radius_km）
+    lat_str = (request.GET.get("lat") or "").strip()
+    lng_str = (request.GET.get("lng") or "").strip()
+    radius_str = (request.GET.get("radius_km") or "").strip()
+    near = None
+    if lat_str and lng_str:
+        try:
+            lat, lng = float(lat_str), float(lng_str)
+            radius_km = float(radius_str) if radius_str else geo.DEFAULT_RADIUS_KM
+        except ValueError:
+            pass
+        else:
+            if geo.is_valid_point(lat, lng) and math.isfinite(radius_km) and radius_km > 0:
+                near = (lat, lng, min(radius_km, geo.MAX_RADIUS_KM))
 
     # ---------- 店舗ベースクエリ ----------
-    store_qs = (
-        Store.objects
-        .select_related("area", "scene", "genre_master")
-        .annotate(
-            has_account=models.Count("storeaccount", distinct=True),
-            weighted_avg_rating=models.Sum(
-                models.F("review__score") * weight_expr
-            ) / models.Sum(weight_expr),
-            avg_rating=models.Avg("review__score"),
-            review_count=models.Count("review", distinct=True),
-        )
-    )
+    # 絞り込み・並び順は ID を出すためだけに使い、表示用の注釈（評価・店舗アカウント有無）は
+    # 表示するページの店舗にだけ付ける
+    store_qs = Store.objects.all()
 
     # ---------- ソート順 ----------
+    # 評価は StoreRatingSummary（口コミ保存時に差分更新）から読むだけ
     sort_key = request.GET.get("sort")
     if sort_key == "rating":
-        store_qs = store_qs.order_by("-weighted_avg_rating", "id")
+        store_qs = store_qs.order_by(F("rating_summary__weighted_avg_rating").desc(nulls_last=True), "id")
     elif sort_key == "reviews":
-        store_qs = store_qs.order_by("-review_count", "id")
+        store_qs = store_qs.order_by(
+            Coalesce(F("rating_summary__review_count"), 0).desc(), "id"
+        )
     else:
         store_qs = store_qs.order_by("id")
 
@@ -268,13 +233,23 @@ def customer_search_listView(request):
     if area_name:
         store_qs = store_qs.filter(area__area_name__icontains=area_name)
 
+    by_rank = False
     if keyword:
-        store_qs = store_qs.filter(
-            Q(store_name__icontains=keyword) |
-            Q(genre__icontains=keyword) |
-            Q(address__icontains=keyword) |
-            Q(scene__scene_name__icontains=keyword)
-        )
+        # 全文検索索引（trigram）で絞る。並び順の指定が無ければ関連度順
+        matched_qs = fulltext.search_stores(store_qs, keyword)
+        if matched_qs is not None:
+            store_qs = matched_qs
+            if sort_key not in ("rating", "reviews"):
+                store_qs = store_qs.order_by("search_rank", "id")
+                by_rank = True
+        else:
+            # 索引で引けない短いキーワードは従来どおり部分一致
+            store_qs = store_qs.filter(
+                Q(store_name__icontains=keyword) |
+                Q(genre__icontains=keyword) |
+                Q(address__icontains=keyword) |
+                Q(scene__scene_name__icontains=keyword)
+            )
 
     # 人数連動フィルタリング
     if people > 0:
@@ -337,11 +312,59 @@ def customer_search_listView(request):
             pass
 
     # ---------- ページネーション ----------
-    paginator = Paginator(store_qs, 5)
+    # 条件ごとに結果の ID 列の先頭と件数をキャッシュし、ページはその切り出しを主キーで引く。
+    # COUNT(*) の再実行や深いページの OFFSET が無くなる
+    # キャッシュした範囲より後ろのページは並び順のキーで続きから引く（関連度順は OFFSET）
+    seek = None
+    if not by_rank:
+        def seek(last_pk):
+            return _stores_after(store_qs, sort_key, last_pk)
+
+    # 半径検索は索引で候補を引いて距離で絞る（並び順の指定が無ければ近い順）
+    build_ids = None
+    if near:
+        by_distance = sort_key not in ("rating", "reviews")
+
+        def build_ids():
+            rows = geo.within_radius(store_qs, *near)
+            if by_distance:
+                rows.sort(key=lambda row: (row[1], row[0]))
+            return [pk for pk, _ in rows]
+
+    store_ids_all = page_cache.cached_ids(
+        page_cache.STORE_SEARCH,
+        {
+            "area": area_name,
+            "keyword": keyword,
+            "time": search_time_str,
+            "scene": scene_id_str,
+            "people": people,
+            "sort": sort_key,
+            "near": near,
+        },
+        store_qs,
+        builder=build_ids,
+        seek=seek,
+    )
+    paginator = Paginator(store_ids_all, 5)
     page_number = request.GET.get("page")
     stores = paginator.get_page(page_number)
 
-    store_ids = [s.id for s in stores]
+    store_ids = list(stores.object_list)
+    by_id = (
+        Store.objects
+        .select_related("area", "scene", "genre_master")
+        .annotate(
+            has_account=models.Exists(
+                StoreAccount.objects.filter(store_id=models.OuterRef("pk"))
+            ),
+            weighted_avg_rating=F("rating_summary__weighted_avg_rating"),
+            avg_rating=F("rating_summary__avg_score"),
+            review_count=Coalesce(F("rating_summary__review_count"), 0),
+        )
+        .in_bulk(store_ids)
+    )
+    stores.object_list = [by_id[pk] for pk in store_ids if pk in by_id]
 
     # ---------- サムネ ----------
     thumbs = (
@@ -355,28 +378,12 @@ def customer_search_listView(request):
     thumb_map = {}
     for row in thumbs:
         thumb_map.setdefault(row["store_id"], row["image_file"])
-
-    # =========================================================
-    # ★ここが追加の本体
-    # ID209-390の店は、12日分の予約設定が無ければ自動生成して「○」扱いにする
-    # =========================================================
-    created_count = _ensure_online_settings_for_12days(stores, date_list)
-    # 必要ならデバッグ（本番では消してOK）
-    # print(f"DEBUG: auto online settings created={created_count}")
+    # 縮小版（派生画像）の有無をまとめて引いておく（テンプレートの image_url はキャッシュを読むだけ）
+    images.variants_for(thumb_map.values())
 
     # ---------- 予約受付（12日分） ----------
-    open_qs = (
-        StoreOnlineReservation.objects
-        .filter(
-            store_id__in=store_ids,
-            date__in=date_list,
-            booking_status=True,
-        )
-        .values_list("store_id", "date")
-    )
-    open_map: dict[int, set[date]] = {}
-    for sid, d in open_qs:
-        open_map.setdefault(sid, set()).add(d)
+    # 設定の無い日は店舗の既定で判定（ID209-390 は受付中）。表示のために行は作らない
+    window = AvailabilityWindow.load(stores, date_list[0], date_list[-1])
 
     # ---------- 店舗ごとに付与 ----------
     dow_ja = ["月", "火", "水", "木", "金", "土", "日"]
@@ -385,7 +392,7 @@ def customer_search_listView(request):
         s.thumb_path = thumb_map.get(s.id)
 
         real_has_account = bool(getattr(s, "has_account", 0) > 0)
-        is_auto = _is_auto_reservation_store_id(s.id)
+        is_auto = is_default_open_store(s.id)
 
         # ★テンプレ表示判定：店アカウント or 自動予約対象
         s.has_account = real_has_account or is_auto
@@ -399,8 +406,11 @@ def customer_search_listView(request):
         s.star_states = Store.build_star_states(rating)
         s.display_rating = rating
 
+        s.distance_km = None
+        if near and geo.is_valid_point(s.latitude, s.longitude):
+            s.distance_km = geo.distance_km(near[0], near[1], s.latitude, s.longitude)
+
         if s.has_account:
-            opened = open_map.get(s.id, set())
             s.calendar_12 = [
                 {
                     "date": d,
@@ -409,7 +419,7 @@ def customer_search_listView(request):
                     "dow_ja": dow_ja[d.weekday()],
                     "is_sat": d.weekday() == 5,
                     "is_sun": d.weekday() == 6,
-                    "is_open": (d in opened),
+                    "is_open": window.is_open(s.id, d),
                 }
                 for d in date_list
             ]
@@ -432,6 +442,9 @@ def customer_search_listView(request):
         "people": people_str,
         "time": search_time_str,
         "date": date_str,
+        "lat": lat_str if near else "",
+        "lng": lng_str if near else "",
+        "radius_km": near[2] if near else "",
         "MEDIA_URL": settings.MEDIA_URL,
         "base_date": base_date,
     }
@@ -442,7 +455,7 @@ def customer_search_listView(request):
 # ユーザー検索
 # =====================================================
 def customer_user_search_listView(request):
-    from commons.models import CustomerAccount, Follow
+    from commons.models import CustomerAccount
 
     keyword = (request.GET.get("keyword") or "").strip()
 
@@ -461,38 +474,13 @@ def customer_user_search_listView(request):
     if request.user.is_authenticated:
         login_customer = CustomerAccount.objects.filter(pk=request.user.pk).first()
 
-    user_list = []
-    for target in users_page:
-        if login_customer and target.pk == login_customer.pk:
-            continue
-
-        follower_count = Follow.objects.filter(followee=target).count()
-        is_following = False
-        is_follower = False
-        is_muted = False
-
-        if login_customer:
-            rel = Follow.objects.filter(follower=login_customer, followee=target).first()
-            is_following = rel is not None
-            if rel:
-                is_muted = rel.is_muted
-
-            is_follower = Follow.objects.filter(follower=target, followee=login_customer).exists()
-
-        cover_field = getattr(target, "cover_image", None)
-        icon_field = getattr(target, "icon_image", None)
-
-        user_list.append({
-            "id": target.pk,
-            "user": target,
-            "review_count": target.review_count,
-            "follower_count": follower_count,
-            "is_following": is_following,
-            "is_follower": is_follower,
-            "is_muted": is_muted,
-            "cover_image_url": cover_field.url if cover_field else "",
-            "user_icon_url": icon_field.url if icon_field else "",
-        })
+    targets = [
+        target for target in users_page
+        if not (login_customer and target.pk == login_customer.pk)
+    ]
+    # フォロー関係はページ分まとめて取得（FollowGraph）
+    graph = FollowGraph.resolve(login_customer, targets)
+    user_list = [graph.card(target) for target in targets]
 
     page_range = paginator.get_elided_page_range(
         number=users_page.number,
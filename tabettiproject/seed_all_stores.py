@@ -6,7 +6,8 @@ from django.utils import timezone
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tabettiproject.settings')
 django.setup()
 
-from commons.models import Store, StoreAccessLog
+from commons.models import Store
+from commons import access_log
 
 stores = Store.objects.all()
 now = timezone.now()
@@ -20,12 +21,8 @@ for store in stores:
         # Create some data
         count = (i + 1) * 2 + 5
         for _ in range(count):
-            # We can't easily backdate accessed_at because it's auto_now_add
-            # So for the sake of chart verification, we'll just create a lot for today
-            # and maybe some stores will have data. 
-            # WAIT! If I want backdated data, I should have used a DateTimeField without auto_now_add
-            # or modified it for the migration.
-            StoreAccessLog.objects.create(store=store)
-            # Actually, I'll just create them and accept they are all 'today' for now.
-    
+            # 記録時刻を渡せるので過去日付のデータも作れる（日次集計にも反映される）
+            access_log.record_access(store.pk, at=d)
+
+access_log.flush()
 print("Seeding complete.")
@@ -1,2 +1,31 @@
 // 共通のJavaScript処理をここに記述します
 console.log('customer.js loaded');
+
+// 口コミの「いいね！」切り替え（口コミ一覧・レビュアーの口コミ一覧で共通）
+async function toggleLike(button, reviewId) {
+    // urls.py で設定した toggle_review_like のパス
+    const url = `/reviews/review/like/${reviewId}/`;
+
+    try {
+        const response = await fetch(url, {
+            method: 'GET',
+            headers: { 'X-Requested-With': 'XMLHttpRequest' }
+        });
+
+        const data = await response.json();
+
+        if (data.error === 'login_required') {
+            alert("いいねをするにはログインが必要です。");
+            window.location.href = "/accounts/customer_login/";
+            return;
+        }
+
+        // 数値と見た目の更新
+        const countSpan = button.querySelector('.like-count');
+        countSpan.innerText = data.total_likes;
+        button.classList.toggle('is-active', data.liked);
+
+    } catch (error) {
+        console.error("Error:", error);
+    }
+}
@@ -27,6 +27,7 @@ from .views import (
     # --- 予約 ---
     StoreAvailabilityJsonView,
     StoreTimeSlotsJsonView,
+    StoreMapJsonView,
     CustomerReservationCreateView,
 )
 
@@ -35,6 +36,7 @@ app_name = "stores"
 urlpatterns = [
     # --- 顧客側 ---
     path("customer_map/", customer_mapView.as_view(), name="customer_map"),
+    path("map-stores/", StoreMapJsonView.as_view(), name="map_stores_json"),
     path("customer_menu_course/<int:pk>/", customer_menu_courseView.as_view(), name="customer_menu_course"),
     path("customer_store_info/<int:pk>/", customer_store_infoView.as_view(), name="customer_store_info"),
     path("customer_store_basic_edit/", customer_store_basic_editView.as_view(), name="customer_store_basic_edit"),
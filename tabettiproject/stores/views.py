@@ -6,8 +6,7 @@ import os
 import random
 import urllib.parse
 import requests
-from dataclasses import dataclass
-from datetime import date, datetime, time, timedelta
+from datetime import date, timedelta
 
 from django.conf import settings
 from django.contrib import messages
@@ -17,6 +16,7 @@ from django.db import models
 from django.db.models import Q, Avg, Count, Sum, F
 from django.http import HttpRequest, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.templatetags.static import static
 from django.urls import reverse
 from django.utils import timezone
 from django.views import View
@@ -33,12 +33,13 @@ from commons.models import (
     StoreAccount,
     StoreImage,
     StoreMenu,
-    StoreOnlineReservation,
-    StoreAccessLog,
     Area,
     Scene,
     Genre,
+    ImageUpload,
 )
+from commons import access_log, availability, booking, geo, occupancy, slots, uploads
+from commons.schedule import StoreSchedule
 
 from .form import (
     CompanyStoreEditForm,
@@ -49,92 +50,11 @@ from .form import (
     StoreRegistrationForm,
 )
 
-# ============================================================
-# ★ 追加：ID209〜390は「店舗アカウント無しでも」予約機能を有効化
-# （今後範囲が増えるならここだけ触ればOK）
-# ============================================================
-AUTO_RESERVATION_STORE_ID_MIN = 209
-AUTO_RESERVATION_STORE_ID_MAX = 390
-
-
-def _is_auto_reservation_store(store: Store) -> bool:
-    sid = int(getattr(store, "pk", 0) or 0)
-    return AUTO_RESERVATION_STORE_ID_MIN <= sid <= AUTO_RESERVATION_STORE_ID_MAX
-
-
-def _default_available_seats(store: Store) -> int:
-    # seats が 0/None の場合は “無制限相当” として大きめにする
-    seats = int(getattr(store, "seats", 0) or 0)
-    return seats if seats > 0 else 999
-
-
 def has_net_reservation(store: Store) -> bool:
     """
-    ネット予約可能か（店舗アカウントあり or ID209-390）
-    """
-    return StoreAccount.objects.filter(store=store).exists() or _is_auto_reservation_store(store)
-
-
-def _ensure_online_setting(store: Store, target_date: date) -> StoreOnlineReservation | None:
-    """
-    ID209-390の店舗は StoreOnlineReservation が未作成でも
-    予約を使えるように、必要な日だけ自動で作る（既存なら何もしない）
-    """
-    if not _is_auto_reservation_store(store):
-        return None
-
-    obj = StoreOnlineReservation.objects.filter(store=store, date=target_date).first()
-    if obj:
-        return obj
-
-    return StoreOnlineReservation.objects.create(
-        store=store,
-        date=target_date,
-        booking_status=True,
-        available_seats=_default_available_seats(store),
-    )
-
-
-def _ensure_month_online_settings(store: Store, year: int, month: int) -> None:
-    """
-    customer_store_info のカレンダー表示用：
-    ID209-390店舗は、その月の未来日ぶんの StoreOnlineReservation を
-    まとめて自動生成して “open_days が 0件” にならないようにする
+    ネット予約可能か（店舗アカウントあり or 既定ルールで受付する店舗）
     """
-    if not _is_auto_reservation_store(store):
-        return
-
-    today = timezone.localdate()
-    start = date(year, month, 1)
-    last_day = calendar.monthrange(year, month)[1]
-    end = date(year, month, last_day)
-
-    # 未来日だけ
-    dates = [start + timedelta(days=i) for i in range((end - start).days + 1)]
-    dates = [d for d in dates if d >= today]
-    if not dates:
-        return
-
-    existing = set(
-        StoreOnlineReservation.objects.filter(store=store, date__range=(start, end))
-        .values_list("date", flat=True)
-    )
-    to_create = [d for d in dates if d not in existing]
-    if not to_create:
-        return
-
-    StoreOnlineReservation.objects.bulk_create(
-        [
-            StoreOnlineReservation(
-                store=store,
-                date=d,
-                booking_status=True,
-                available_seats=_default_available_seats(store),
-            )
-            for d in to_create
-        ],
-        ignore_conflicts=True,
-    )
+    return StoreAccount.objects.filter(store=store).exists() or availability.has_rule(store)
 
 
 # ============================================================
@@ -220,82 +140,6 @@ def _ensure_store_menus(
     return created
 
 
-# ============================================================
-# 営業時間ヘルパ（Store.open/close 1・2枠）
-# ============================================================
-@dataclass(frozen=True)
-class TimeInterval:
-    start: time
-    end: time
-
-
-def _time_to_minutes(t: time) -> int:
-    return t.hour * 60 + t.minute
-
-
-def _minutes_to_time(m: int) -> time:
-    m = max(0, min(24 * 60 - 1, m))
-    return time(m // 60, m % 60)
-
-
-def _get_store_intervals(store: Store) -> list[TimeInterval]:
-    """
-    Store の open/close から営業時間区間を返す（最大2区間）
-    - start>=end は無効として捨てる
-    """
-    intervals: list[TimeInterval] = []
-
-    def push(a: time | None, b: time | None) -> None:
-        if isinstance(a, time) and isinstance(b, time) and _time_to_minutes(b) > _time_to_minutes(a):
-            intervals.append(TimeInterval(a, b))
-
-    push(getattr(store, "open_time_1", None), getattr(store, "close_time_1", None))
-    push(getattr(store, "open_time_2", None), getattr(store, "close_time_2", None))
-
-    intervals.sort(key=lambda x: _time_to_minutes(x.start))
-    return intervals
-
-
-def _build_closed_ranges(intervals: list[TimeInterval]) -> list[TimeInterval]:
-    """
-    営業時間レンジ内の「中休み」区間を返す
-    例: (11-15),(17-22) -> (15-17)
-    """
-    if len(intervals) < 2:
-        return []
-    closed: list[TimeInterval] = []
-    for i in range(len(intervals) - 1):
-        a_end = intervals[i].end
-        b_start = intervals[i + 1].start
-        if _time_to_minutes(b_start) > _time_to_minutes(a_end):
-            closed.append(TimeInterval(a_end, b_start))
-    return closed
-
-
-def _is_inside_one_interval(start: time, end: time, intervals: list[TimeInterval]) -> bool:
-    """
-    予約の開始〜終了が「どれか1つの営業時間区間」に完全に収まるか
-    中休みをまたぐのはNG
-    """
-    s = _time_to_minutes(start)
-    e = _time_to_minutes(end)
-
-    # 日跨ぎ（end <= start）はNG
-    if e <= s:
-        return False
-
-    for itv in intervals:
-        a = _time_to_minutes(itv.start)
-        b = _time_to_minutes(itv.end)
-        if a <= s and e <= b:
-            return True
-    return False
-
-
-def _format_intervals_for_js(intervals: list[TimeInterval]) -> list[dict[str, str]]:
-    return [{"start": itv.start.strftime("%H:%M"), "end": itv.end.strftime("%H:%M")} for itv in intervals]
-
-
 def _course_name(course_minutes: int) -> str:
     course_map = {
         30: "30分コース",
@@ -307,43 +151,6 @@ def _course_name(course_minutes: int) -> str:
     return course_map.get(course_minutes, f"{course_minutes}分コース")
 
 
-def _validate_customer_reservation_time(
-    *,
-    store: Store,
-    visit_date: date,
-    visit_time: time,
-    course_minutes: int,
-) -> tuple[bool, str, time | None]:
-    """
-    顧客予約の「営業時間」検証：
-    - 店舗の営業時間が未設定ならNG
-    - コース終了が営業時間超え / 中休み跨ぎ はNG
-    - 日跨ぎはNG
-    戻り値: (ok, reason, end_time)
-    """
-    intervals = _get_store_intervals(store)
-    if not intervals:
-        return False, "営業時間が未設定のため予約できません。店舗へお問い合わせください。", None
-
-    if course_minutes not in (30, 60, 90, 120, 150):
-        return False, "コースが不正です。", None
-
-    start_dt = datetime.combine(visit_date, visit_time)
-    end_dt = start_dt + timedelta(minutes=course_minutes)
-
-    # 日跨ぎNG
-    if end_dt.date() != visit_date:
-        return False, "営業時間外の予約はできません（終了時刻が翌日になります）。", None
-
-    end_time = end_dt.time()
-
-    # 1区間内に収まる（中休み跨ぎもNG）
-    if not _is_inside_one_interval(visit_time, end_time, intervals):
-        return False, "営業時間外、または中休みをまたぐ時間帯は予約できません。", None
-
-    return True, "", end_time
-
-
 # ============================================================
 # helper
 # ============================================================
@@ -448,12 +255,91 @@ def _get_reservator_initial(customer: CustomerAccount | None) -> dict[str, str]:
 # customer views
 # =========================
 class customer_mapView(TemplateView):
+    # 店舗は表示範囲ごとに StoreMapJsonView から取る
     template_name = "stores/customer_map.html"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context["stores"] = Store.objects.prefetch_related('images').all()
-        return context
+
+# -----------------------------
+# 地図：表示範囲の店舗 JSON
+# -----------------------------
+def _store_thumbnail_urls(store_ids) -> dict[int, str]:
+    """
+    店舗ごとの先頭画像の URL（画像の無い店舗は含まない）
+    """
+    rows = (
+        StoreImage.objects
+        .filter(store_id__in=store_ids)
+        .order_by("store_id", "id")
+        .values_list("store_id", "image_file", "image_path")
+    )
+    urls = {}
+    for store_id, image_file, image_path in rows:
+        if store_id in urls:
+            continue
+        if image_file:
+            urls[store_id] = StoreImage._meta.get_field("image_file").storage.url(image_file)
+        elif image_path:
+            urls[store_id] = static(image_path)
+    return urls
+
+
+class StoreMapJsonView(View):
+    """
+    GET /stores/map-stores/?south=..&west=..&north=..&east=..&zoom=15
+    - 狭い範囲（zoom >= geo.MIN_MARKER_ZOOM かつ geo.MAX_MARKERS 件以下）は店舗を1件ずつ
+    - それ以外はマスごとの件数・重心（clusters）
+    """
+    def get(self, request: HttpRequest):
+        try:
+            bbox = geo.BoundingBox.from_params(request.GET)
+        except ValueError as exc:
+            return JsonResponse({"ok": False, "error": str(exc)}, status=400)
+
+        try:
+            zoom = int(request.GET.get("zoom") or 0)
+        except ValueError:
+            return JsonResponse({"ok": False, "error": "zoom が不正です。"}, status=400)
+
+        store_qs = geo.in_bbox(Store.objects.all(), bbox)
+        total = store_qs.count()
+
+        if zoom < geo.MIN_MARKER_ZOOM or total > geo.MAX_MARKERS:
+            return JsonResponse({
+                "ok": True,
+                "mode": "clusters",
+                "total": total,
+                "clusters": geo.clusters(Store.objects.all(), bbox),
+            })
+
+        rows = list(
+            store_qs.order_by("id").values(
+                "id", "store_name", "branch_name", "address", "genre",
+                "business_hours", "phone_number", "latitude", "longitude",
+            )
+        )
+        thumbs = _store_thumbnail_urls([row["id"] for row in rows])
+        no_image = static("images/no_image.png")
+
+        return JsonResponse({
+            "ok": True,
+            "mode": "stores",
+            "total": total,
+            "stores": [
+                {
+                    "id": row["id"],
+                    "detailUrl": reverse("stores:customer_store_info", args=[row["id"]]),
+                    "name": f"{row['store_name']} {row['branch_name']}".strip() if row["branch_name"] else row["store_name"],
+                    "address": row["address"],
+                    "genre": row["genre"],
+                    "hours": row["business_hours"],
+                    "phone": row["phone_number"],
+                    "lat": row["latitude"],
+                    "lng": row["longitude"],
+                    "imageUrl": thumbs.get(row["id"], no_image),
+                }
+                for row in rows
+            ],
+        })
 
 
 class customer_store_mapView(TemplateView):
@@ -504,11 +390,10 @@ class customer_menu_courseView(TemplateView):
         )
 
         # ★営業時間情報（UIで使う）
-        intervals = _get_store_intervals(store)
-        closed_ranges = _build_closed_ranges(intervals)
-        context["store_intervals_json"] = _format_intervals_for_js(intervals)
-        context["closed_ranges_json"] = _format_intervals_for_js(closed_ranges)
-        context["has_business_hours"] = bool(intervals)
+        schedule = StoreSchedule.for_store(store)
+        context["store_intervals_json"] = schedule.intervals_for_js()
+        context["closed_ranges_json"] = schedule.closed_ranges_for_js()
+        context["has_business_hours"] = bool(schedule)
 
         # ★ネット予約対応（店舗アカウント or ID209-390）
         context["has_account"] = has_net_reservation(store)
@@ -549,8 +434,8 @@ class customer_store_infoView(TemplateView):
         store = get_object_or_404(Store.objects.select_related("genre_master", "area", "scene"), pk=self.kwargs["pk"])
         context["store"] = store
 
-        # アクセスログの記録
-        StoreAccessLog.objects.create(store=store)
+        # アクセスログの記録（バッファに積んでまとめて書き込む）
+        access_log.record_access(store.pk)
 
         # 店舗画像
         context["store_images"] = StoreImage.objects.filter(store=store).order_by("id")
@@ -577,22 +462,12 @@ class customer_store_infoView(TemplateView):
         # ★「来月を見る→」ボタン用
         context["next_ym"] = _get_next_ym(year, month)
 
-        # ★ID209-390なら、その月の予約設定を自動生成（未来日だけ）
-        _ensure_month_online_settings(store, year, month)
-
         start = date(year, month, 1)
         last_day = calendar.monthrange(year, month)[1]
         end = date(year, month, last_day)
 
-        # 受付中の日（過去日は除外）※ date型のまま保持
-        open_days_dates = list(
-            StoreOnlineReservation.objects.filter(
-                store=store,
-                date__range=(start, end),
-                booking_status=True,
-            ).values_list("date", flat=True)
-        )
-        open_days_dates = [d for d in open_days_dates if d >= today]
+        # 受付中の日（既定ルール＋上書き。過去日は除外）※ date型のまま保持
+        open_days_dates = [d for d in availability.open_dates(store, start, end) if d >= today]
 
         # ★テンプレの「今月0件判定」用（文字列）
         context["open_days"] = [d.isoformat() for d in sorted(open_days_dates)]
@@ -663,11 +538,10 @@ class customer_store_infoView(TemplateView):
         context["now_hm"] = timezone.localtime().strftime("%H:%M")
 
         # ★営業時間情報
-        intervals = _get_store_intervals(store)
-        closed_ranges = _build_closed_ranges(intervals)
-        context["store_intervals_json"] = _format_intervals_for_js(intervals)
-        context["closed_ranges_json"] = _format_intervals_for_js(closed_ranges)
-        context["has_business_hours"] = bool(intervals)
+        schedule = StoreSchedule.for_store(store)
+        context["store_intervals_json"] = schedule.intervals_for_js()
+        context["closed_ranges_json"] = schedule.closed_ranges_for_js()
+        context["has_business_hours"] = bool(schedule)
 
         # ★星評価
         context.update(_get_store_rating_context(store))
@@ -704,21 +578,11 @@ class StoreAvailabilityJsonView(View):
         if (year, month) < (today.year, today.month):
             year, month = today.year, today.month
 
-        # ★ID209-390なら、その月の予約設定を自動生成（未来日だけ）
-        _ensure_month_online_settings(store, year, month)
-
         start = date(year, month, 1)
         last_day = calendar.monthrange(year, month)[1]
         end = date(year, month, last_day)
 
-        open_days = list(
-            StoreOnlineReservation.objects.filter(
-                store=store,
-                date__range=(start, end),
-                booking_status=True,
-            ).values_list("date", flat=True)
-        )
-        open_days = [d for d in open_days if d >= today]
+        open_days = [d for d in availability.open_dates(store, start, end) if d >= today]
 
         return JsonResponse({
             "year": year,
@@ -732,7 +596,7 @@ class StoreAvailabilityJsonView(View):
 # -----------------------------
 class StoreTimeSlotsJsonView(View):
     """
-    GET /stores/time-slots/<store_id>/?date=YYYY-MM-DD&course_minutes=60
+    GET /stores/time-slots/<store_id>/?date=YYYY-MM-DD&course_minutes=60&party_size=2
     """
     def get(self, request: HttpRequest, store_id: int):
         store = get_object_or_404(Store, pk=store_id)
@@ -753,60 +617,42 @@ class StoreTimeSlotsJsonView(View):
         if course_minutes not in (30, 60, 90, 120, 150):
             return JsonResponse({"ok": False, "error": "course_minutes が不正です。"}, status=400)
 
-        intervals = _get_store_intervals(store)
-        if not intervals:
+        # 人数（未指定なら1名として空きを見る）
+        try:
+            party_size = int((request.GET.get("party_size") or "1").strip())
+        except ValueError:
+            return JsonResponse({"ok": False, "error": "party_size が不正です。"}, status=400)
+        if party_size < 1:
+            return JsonResponse({"ok": False, "error": "party_size が不正です。"}, status=400)
+
+        schedule = StoreSchedule.for_store(store)
+        if not schedule:
             return JsonResponse({"ok": True, "slots": [], "reason": "営業時間未設定"})
 
-        # 受付日チェック（ID209-390は未設定なら自動作成）
-        setting = StoreOnlineReservation.objects.filter(store=store, date=target_date).first()
-        if not setting:
-            setting = _ensure_online_setting(store, target_date)
+        # 受付日チェック（上書きが無い日は既定ルール）
+        setting = availability.get_day_setting(store, target_date)
 
         if not setting or not setting.booking_status:
             return JsonResponse({"ok": True, "slots": [], "reason": "この日は受付していません"})
 
-        step = 15  # 15分刻み
-
-        today = timezone.localdate()
-        now_t = timezone.localtime().time()
-
-        slots: list[str] = []
-        for itv in intervals:
-            start_m = _time_to_minutes(itv.start)
-            end_m = _time_to_minutes(itv.end)
-
-            last_start_m = end_m - course_minutes
-            if last_start_m < start_m:
-                continue
-
-            m = start_m
-            while m <= last_start_m:
-                t = _minutes_to_time(m)
-
-                # 当日の過去時刻は除外
-                if target_date == today and t < now_t:
-                    m += step
-                    continue
-
-                ok, _, _end_t = _validate_customer_reservation_time(
-                    store=store,
-                    visit_date=target_date,
-                    visit_time=t,
-                    course_minutes=course_minutes,
-                )
-                if ok:
-                    slots.append(t.strftime("%H:%M"))
-
-                m += step
+        # 営業時間から作ったビット列（キャッシュ）× 当日の現在時刻以降 × 人数分の空席
+        slots_list = slots.available_start_times(
+            store,
+            target_date,
+            course_minutes,
+            setting=setting,
+            now=timezone.localtime(),
+            party_size=party_size,
+        )
 
         return JsonResponse(
             {
                 "ok": True,
                 "date": target_date.isoformat(),
                 "course_minutes": course_minutes,
-                "slots": slots,
-                "intervals": _format_intervals_for_js(intervals),
-                "closed_ranges": _format_intervals_for_js(_build_closed_ranges(intervals)),
+                "slots": slots_list,
+                "intervals": schedule.intervals_for_js(),
+                "closed_ranges": schedule.closed_ranges_for_js(),
             }
         )
 
@@ -842,34 +688,24 @@ class CustomerReservationCreateView(LoginRequiredMixin, View):
             messages.error(request, "現在時刻より前の時刻は予約できません。")
             return redirect("stores:customer_store_info", pk=store.id)
 
-        # 受付チェック（ID209-390は未設定なら自動作成）
-        setting = StoreOnlineReservation.objects.filter(store=store, date=visit_date).first()
-        if not setting:
-            setting = _ensure_online_setting(store, visit_date)
+        # 受付チェック（上書きが無い日は既定ルール）
+        setting = availability.get_day_setting(store, visit_date)
 
         if not setting or not setting.booking_status:
             messages.error(request, "この日はネット予約を受け付けていません。")
             return redirect("stores:customer_store_info", pk=store.id)
 
         # ★営業時間チェック
-        ok, reason, end_time = _validate_customer_reservation_time(
-            store=store,
-            visit_date=visit_date,
-            visit_time=visit_time,
-            course_minutes=course_minutes,
-        )
+        ok, reason, end_time = StoreSchedule.for_store(store).validate(visit_date, visit_time, course_minutes)
 
         if not ok or end_time is None:
             messages.error(request, reason or "営業時間チェックに失敗しました。")
             return redirect("stores:customer_store_info", pk=store.id)
 
-        # 席数チェック（日単位合計）
-        used = (
-            Reservation.objects
-            .filter(store=store, visit_date=visit_date)
-            .aggregate(models.Sum("visit_count"))["visit_count__sum"] or 0
-        )
-        if setting.available_seats and used + visit_count > setting.available_seats:
+        # 席数の先行チェック（確定時は booking.book がロックした上でもう一度見る）
+        if not occupancy.fits(
+            store.pk, visit_date, visit_time, course_minutes, visit_count, setting.available_seats
+        ):
             messages.error(request, "空席が不足しています。人数を減らすか別日をご選択ください。")
             return redirect("stores:customer_store_info", pk=store.id)
 
@@ -934,17 +770,24 @@ class CustomerReservationCreateView(LoginRequiredMixin, View):
         # 予約ステータス
         status = ReservationStatus.objects.get_or_create(status="予約確定")[0]
 
-        reservation = Reservation.objects.create(
-            booking_user=reservator,
-            store=store,
-            visit_date=visit_date,
-            visit_time=visit_time,
-            start_time=visit_time,
-            end_time=end_time,
-            visit_count=visit_count,
-            course=course_name,
-            booking_status=status,
-        )
+        # 空席確認と予約作成を1トランザクションで（同時予約で席数を超えない）
+        try:
+            reservation = booking.book(
+                booking.BookingRequest(
+                    store=store,
+                    visit_date=visit_date,
+                    visit_time=visit_time,
+                    end_time=end_time,
+                    course_minutes=course_minutes,
+                    course_name=course_name,
+                    party_size=visit_count,
+                ),
+                booking_user=reservator,
+                status=status,
+            )
+        except booking.BookingError as e:
+            messages.error(request, str(e))
+            return redirect("stores:customer_store_info", pk=store.id)
 
         return redirect("stores:customer_reservation_complete", reservation_id=reservation.id)
 
@@ -1222,26 +1065,17 @@ class store_topView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
         context["store"] = store
 
         # --- アクセス数チャート用データの集計 (過去7日間) ---
-        today = timezone.now().date()
+        # 日次集計テーブルを1クエリで読む（このプロセスの未書き込み分は書き込まずに足す）
+        today = timezone.localdate()
         date_list = [today - timedelta(days=i) for i in range(6, -1, -1)]
+        daily = access_log.daily_counts(store.pk, date_list[0], today)
 
-        access_counts = []
-        labels = []
-        for d in date_list:
-            count = StoreAccessLog.objects.filter(
-                store=store,
-                accessed_at__date=d
-            ).count()
-            access_counts.append(count)
-            labels.append(d.strftime("%Y-%m-%d"))
-
-        context["chart_labels"] = labels
-        context["chart_data"] = access_counts
-        print(f"DEBUG: Store={store.store_name}, Labels={labels}, Data={access_counts}")
+        context["chart_labels"] = [d.strftime("%Y-%m-%d") for d in date_list]
+        context["chart_data"] = [daily.get(d, 0) for d in date_list]
 
         today = timezone.localdate()
 
-        today_setting = StoreOnlineReservation.objects.filter(store=store, date=today).first()
+        today_setting = availability.get_day_setting(store, today)
         if today_setting is not None:
             context["is_online_open"] = bool(today_setting.booking_status)
             context["today_available_seats"] = int(today_setting.available_seats or 0)
@@ -1320,16 +1154,20 @@ class customer_store_photo_uploadView(LoginRequiredMixin, View):
             messages.error(request, "画像ステータスが設定されていません。管理者に連絡してください。")
             return redirect("stores:customer_store_info", pk=pk)
         
-        # StoreImage を作成
-        store_image = StoreImage(
-            store=store,
-            image_file=uploaded_file,
-            image_status=default_status,
-            uploaded_by=request.user,
-        )
-        store_image.save()
-        
-        messages.success(request, "写真を投稿しました！")
+        # ステージングに置いて受け付ける（StoreImage はコミット後にワーカーが作る）
+        try:
+            uploads.stage(
+                uploaded_file,
+                ImageUpload.KIND_STORE_IMAGE,
+                uploaded_by=request.user,
+                store=store,
+                image_status=default_status,
+            )
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect("stores:customer_store_info", pk=pk)
+
+        messages.success(request, "写真を受け付けました！処理が終わりしだい表示されます。")
         return redirect("stores:customer_store_photos", pk=pk)
 
 
@@ -5,23 +5,18 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tabettiproject.settings')
 django.setup()
 
-from commons.models import CustomerAccount, Follow
+from commons import trust
 
-def sync_data():
-    print("Syncing follower_count for all customers...")
-    customers = CustomerAccount.objects.all()
-    count = 0
-    for customer in customers:
-        # フォロワー数をカウント
-        f_count = Follow.objects.filter(followee=customer).count()
-        customer.follower_count = f_count
-        # trust_score を再計算して保存
-        customer.update_trust_score()
-        count += 1
-        if count % 100 == 0:
-            print(f"Processed {count} customers...")
-    
-    print(f"Successfully finished! Processed {count} customers.")
+def sync_data(chunk_size=500):
+    print("Syncing follower_count and trust_score for all customers...")
+
+    def progress(done, total):
+        print(f"Processed {done}/{total} customers...")
+
+    # フォロワー数などのカウンタを GROUP BY でまとめて集計し、bulk_update で書き戻す
+    count = trust.recompute_all(chunk_size=chunk_size, progress=progress)
+
+    print(f"Successfully finished! Updated {count} customers.")
 
 if __name__ == "__main__":
     sync_data()
@@ -92,6 +92,20 @@ DATABASES = {
     }
 }
 
+# キャッシュ（全プロセスで共有する。プロセスごとの LocMemCache だと、
+# シグナルでの無効化が保存したプロセスにしか届かない）
+# テーブルは commons のマイグレーションで作る（manage.py createcachetable でも可）
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+        'OPTIONS': {
+            # 既定の 300 件では検索結果・閲覧者ごとのいいね済み判定がすぐ押し出される
+            'MAX_ENTRIES': 50000,
+        },
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -137,6 +151,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # メディアファイルの設定
 MEDIA_URL = '/media/'   # メディアファイルのURL
 MEDIA_ROOT = BASE_DIR / 'media'  # メディアファイルの保存先ディレクトリ
+UPLOAD_STAGING_ROOT = BASE_DIR / 'upload_staging'  # 処理前のアップロード画像（公開しない）
 
 #staticファイルの設定
 STATICFILES_DIRS = [